@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+比较各Excel读取引擎解析订单导出文件的耗时
+
+用法:
+    python benchmarks/excel_reader_benchmark.py [文件 ...] [--repeat 3] [--generate 行数]
+
+不指定文件时使用 Downloads/orders 中已下载的订单文件；--generate 按订单导出的列布局生成一个测试文件
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from config import CONFIG
+from modules.data_processor import ORDER_COLUMN_MAPPING, ORDER_STRING_COLUMNS
+from modules.excel_reader import ENGINE_PREFERENCE, engine_installed, read_excel
+
+# 订单导出中存在但不会被使用的列
+UNUSED_COLUMNS = ['商品条码', '发票类型', '发票抬头', '买家留言', '卖家备注', '优惠金额', '支付方式', '下单渠道']
+
+def generate_order_file(rows, directory):
+    """按订单导出的列布局生成测试文件"""
+    columns = list(ORDER_COLUMN_MAPPING) + UNUSED_COLUMNS
+    data = {}
+    for column in columns:
+        if column in ORDER_STRING_COLUMNS:
+            data[column] = [f"{3000000000000 + i}" for i in range(rows)]
+        elif column.endswith('时间'):
+            data[column] = pd.date_range('2024-01-01', periods=rows, freq='min')
+        elif column in ('运费', '产品采购价', '采购数量', '采购单应付采购款', '用户实际支付总额'):
+            data[column] = [round(i * 0.37 % 500, 2) for i in range(rows)]
+        else:
+            data[column] = [f"{column}{i % 97}" for i in range(rows)]
+
+    file_path = os.path.join(directory, f"orders_{rows}.xlsx")
+    pd.DataFrame(data).to_excel(file_path, index=False)
+    return file_path
+
+def time_read(file_path, engine, columns, repeat):
+    """返回多次读取中最短的耗时（秒）和读取的行数"""
+    best, rows = None, 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = read_excel(file_path, columns=columns, dtype=ORDER_STRING_COLUMNS, engine=engine)
+        elapsed = time.perf_counter() - started
+        rows = len(df)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+def default_order_files():
+    """各账号订单目录中的文件，以及旧版本共用订单目录中尚未迁移的文件"""
+    accounts_dir = os.path.join(CONFIG['paths']['download_dir'], 'accounts')
+    orders_dirs = [CONFIG['paths']['orders_dir']]
+    if os.path.isdir(accounts_dir):
+        orders_dirs += [os.path.join(accounts_dir, name, 'orders') for name in sorted(os.listdir(accounts_dir))]
+    return [os.path.join(orders_dir, name)
+            for orders_dir in orders_dirs if os.path.isdir(orders_dir)
+            for name in sorted(os.listdir(orders_dir)) if name.endswith(('.xls', '.xlsx'))]
+
+def main():
+    parser = argparse.ArgumentParser(description="比较各Excel读取引擎解析订单导出文件的耗时")
+    parser.add_argument('files', nargs='*', help="要解析的订单Excel文件")
+    parser.add_argument('--repeat', type=int, default=3, help="每种读取方式重复的次数，取最短耗时")
+    parser.add_argument('--generate', type=int, default=0, help="生成指定行数的测试文件")
+    args = parser.parse_args()
+
+    files = list(args.files)
+    temp_dir = None
+    if args.generate:
+        temp_dir = tempfile.TemporaryDirectory()
+        files.append(generate_order_file(args.generate, temp_dir.name))
+    if not files:
+        files = default_order_files()
+    if not files:
+        print("没有可解析的订单文件，请指定文件或使用 --generate")
+        return 1
+
+    engines = [engine for engine in ENGINE_PREFERENCE if engine_installed(engine)]
+    modes = [("全部列", None), ("映射列", ORDER_COLUMN_MAPPING)]
+
+    print(f"{'文件':<40}{'引擎':<12}{'读取列':<10}{'行数':>10}{'耗时(秒)':>12}")
+    for file_path in files:
+        for engine in engines:
+            for mode_name, columns in modes:
+                try:
+                    elapsed, rows = time_read(file_path, engine or 'default', columns, args.repeat)
+                    print(f"{os.path.basename(file_path):<40}{engine or 'default':<12}{mode_name:<10}{rows:>10}{elapsed:>12.3f}")
+                except Exception as e:
+                    print(f"{os.path.basename(file_path):<40}{engine or 'default':<12}{mode_name:<10}  读取失败: {str(e)}")
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
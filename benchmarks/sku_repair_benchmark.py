@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+比较SKU科学计数法修复的逐单元格实现与向量化实现的耗时，并确认两者结果相同
+
+用法:
+    python benchmarks/sku_repair_benchmark.py [--rows 1000000] [--repeat 3]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from modules.data_processor import repair_sku_column
+
+def legacy_repair_sku_column(column):
+    """原来逐个单元格处理的实现"""
+    column = column.astype(str).apply(
+        lambda x: f"{float(x):.0f}" if x.strip() and x.lower() != 'nan' and 'e' in x.lower() else x
+    )
+    return column.replace('nan', '')
+
+# 需要与原实现逐字一致的边界值
+EDGE_CASES = ['-0e0', '-0E5', '-1e-1', '-6e-1', '2.5e0', '-2.5e0', '1e20', 'inf', '-inf', 'NaN', ' 3e2 ']
+
+def generate_sku_column(rows, seed=0):
+    """生成混合了普通SKU、科学计数法SKU、空值、'nan' 和边界值的SKU列"""
+    rng = np.random.default_rng(seed)
+    numbers = rng.integers(10 ** 9, 10 ** 13, rows)
+    kinds = rng.integers(0, 10, rows)
+    values = np.where(kinds < 5, numbers.astype(str),
+             np.where(kinds < 8, [f"{n:.5E}" for n in numbers.astype(float)],
+             np.where(kinds < 9, '', 'nan')))
+    return pd.Series(list(values) + EDGE_CASES, dtype=object)
+
+def best_time(fn, column, repeat):
+    """返回多次执行中最短的耗时（秒）和最后一次的结果"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(column)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description="比较SKU科学计数法修复的实现")
+    parser.add_argument('--rows', type=int, default=1000000, help="测试列的行数")
+    parser.add_argument('--repeat', type=int, default=3, help="每种实现重复的次数，取最短耗时")
+    args = parser.parse_args()
+    
+    column = generate_sku_column(args.rows)
+    # 读取时指定了字符串类型的SKU列可能是object或字符串类型，两种输入分别比较
+    cases = [("object", column), ("字符串", column.astype(str))]
+    
+    print(f"{'输入类型':<12}{'行数':>10}{'原实现(秒)':>14}{'向量化(秒)':>14}{'加速':>8}  结果一致")
+    for name, values in cases:
+        legacy_time, expected = best_time(legacy_repair_sku_column, values, args.repeat)
+        new_time, actual = best_time(repair_sku_column, values, args.repeat)
+        same = expected.equals(actual)
+        print(f"{name:<12}{args.rows:>10}{legacy_time:>14.3f}{new_time:>14.3f}{legacy_time / new_time:>7.1f}x  {same}")
+        if not same:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -42,6 +42,65 @@ CONFIG = {
     'jd': {
         'username': '',  # 不再在此存储敏感信息
         'password': ''   # 不再在此存储敏感信息
+    },
+    'database': {
+        'upsert_mode': 'merge',  # 主表更新插入方式：merge 暂存表批量合并，row 逐行处理
+        'chunk_size': 5000,      # 主表合并、明细表和服务单表批量插入时每块的行数
+        'pool_size': 4,          # 数据库连接池最大连接数
+        'pool_idle_timeout': 300,  # 空闲连接超过该秒数后关闭
+        'skip_unchanged': True     # 按每行内容哈希跳过与数据库中相同的记录，只写入新增或变化的记录
+    },
+    'http': {
+        'pool_size': 10,  # 每个域名保持的长连接数量
+        'timeout': 30     # 调用京东接口的超时秒数
+    },
+    'download': {
+        'chunk_size': 1024 * 1024,  # 流式下载每次写入的字节数
+        'retries': 5,               # 下载中断后的最大尝试次数，每次从断点继续
+        'timeout': 60               # 两次收到数据之间的最长等待秒数
+    },
+    'export': {
+        'poll_initial_delay': 2,  # 提交导出后第一次查询前的等待秒数，之后按指数递增
+        'poll_max_delay': 30,     # 两次查询之间的最长等待秒数
+        'poll_timeout': 900,      # 等待导出完成的最长秒数
+        'lookback_days': 30,      # 批量下载时只下载最近多少天内创建的导出任务
+        'download_workers': 4,    # 批量下载时同时下载的文件数
+        'page_size': 50,          # 批量下载时每页查询的任务数
+        'max_pages': 20,          # 批量下载时最多查询的页数
+        'download_statuses': None,  # 批量下载时只下载这些状态的任务，例如 [2]；None 表示只要求任务已生成文件
+        'shard': 'week',          # 一键同步时按 'day'、'week' 或天数拆分日期范围
+        'max_concurrent': 3       # 一键同步时同时在导出中的分片数量上限
+    },
+    'processing': {
+        'parse_workers': 4,        # 并行解析订单Excel的进程数，1 表示在当前进程中依次解析
+        'excel_engine': 'auto',    # Excel读取引擎：'auto' 已安装 python-calamine 时优先使用，'default' 使用pandas默认引擎
+        'parse_cache': True,       # 缓存订单文件的解析结果，重复上传时不再解析Excel，需要安装pyarrow
+        'parse_cache_max_mb': 512, # 每个订单目录中解析缓存的大小上限（MB）
+        'incremental': True,       # 上传时只处理还没有成功上传过的文件
+        'lean_dtypes': True,       # 解析结果使用分类和可空字符串类型，降低合并大量订单时的内存占用
+        'streaming': True,         # 上传订单列表时每解析完一个文件就上传，不先合并所有文件
+        'stream_queue_size': 2     # 流式上传时等待上传的文件数上限，达到上限时暂停解析
+    },
+    'accounts': {
+        'max_parallel': 3  # 同步全部账号时最多同时同步的账号数
+    },
+    'browser': {
+        'pool_size': 3,        # 同时保持运行的Chrome实例上限
+        'idle_timeout': 600,   # 空闲的Chrome实例保留秒数，超时后关闭
+        'headless': True       # 登录时使用无头模式，需要手动验证时自动改用可见窗口
+    },
+    'session': {
+        'probe_ttl': 300,          # 登录状态检查结果的缓存秒数
+        'check_interval': 1800,    # 后台检查当前账号登录状态的间隔秒数
+        'refresh_before': 3600,    # 登录cookies在多少秒内过期时提前重新登录
+        'auto_login': True         # 后台检查发现需要登录时自动打开浏览器登录
+    },
+    'logging': {
+        'ui_buffer_size': 5000,       # 界面日志缓冲区最多保留的条数
+        'ui_flush_interval_ms': 100,  # 界面日志刷新间隔（毫秒）
+        'ui_max_lines': 5000,         # 运行日志区域最多显示的行数
+        'async': True,                # 由后台线程写日志，调用线程只负责入队
+        'queue_size': 10000           # 异步日志队列的最大长度，超出后丢弃低级别日志
     }
 }
 
@@ -8,22 +8,22 @@
 import sys
 import os
 import logging
-from datetime import datetime
+import multiprocessing
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PyQt6.QtWidgets import QApplication, QMessageBox
-from PyQt6.QtCore import QDate, Qt, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtCore import QDate, Qt, QObject, QThread, QTimer, pyqtSignal, pyqtSlot
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import json
-import requests
 
 from ui import MainWindow, VerificationDialog
-from modules import BrowserAutomation, ApiClient, DataProcessor, DatabaseManager, CacheManager, AccountManager
-from modules import UILogHandler, LogSignal, setup_logging, get_logger
+from modules import BrowserAutomation, BrowserPool, DataProcessor, DatabaseManager, AccountManager, AccountSessionManager
+from modules import UILogHandler, LogFlusher, setup_logging, get_logger, get_logging_stats, stop_logging
+from modules.browser_automation import PROFILE_DIR_NAME
 from config import CONFIG, load_db_config
 
-# 创建日志信号对象
-log_signal = LogSignal()
-
 class WorkerSignals(QObject):
     # 定义信号
     finished = pyqtSignal()
@@ -32,30 +32,49 @@ class WorkerSignals(QObject):
     progress = pyqtSignal(str)
 
 class Worker(QThread):
+    """
+    在后台线程中执行任务函数
+    
+    任务函数会额外收到 progress_callback（汇报进度文本）和 cancel_event（取消标志）两个关键字参数
+    """
     def __init__(self, fn, *args, **kwargs):
         super(Worker, self).__init__()
         self.fn = fn
         self.args = args
         self.kwargs = kwargs
         self.signals = WorkerSignals()
+        self.cancel_event = threading.Event()
+        self.result_value = None
+        self.error_message = None
         
     @pyqtSlot()
     def run(self):
         try:
-            result = self.fn(*self.args, **self.kwargs)
+            result = self.fn(*self.args, progress_callback=self.signals.progress.emit,
+                             cancel_event=self.cancel_event, **self.kwargs)
+            self.result_value = result
             self.signals.result.emit(result)
         except Exception as e:
             logger.exception(f"Worker执行过程中发生错误: {str(e)}")
+            self.error_message = str(e)
             self.signals.error.emit(str(e))
         finally:
             self.signals.finished.emit()
+    
+    def cancel(self):
+        """请求取消任务，任务函数在下一个检查点停止"""
+        self.cancel_event.set()
 
 class MainApp(QObject):
     def __init__(self):
         super().__init__()
         # 设置日志系统
-        self.ui_handler = UILogHandler(log_signal)
-        setup_logging(self.ui_handler)
+        self.ui_handler = UILogHandler(max_buffer=CONFIG['logging']['ui_buffer_size'])
+        setup_logging(
+            self.ui_handler,
+            async_mode=CONFIG['logging']['async'],
+            queue_size=CONFIG['logging']['queue_size']
+        )
         
         # 获取模块专用日志记录器
         global logger
@@ -65,19 +84,58 @@ class MainApp(QObject):
         self.app = QApplication(sys.argv)
         self.window = MainWindow()
         
-        # 日志信号连接到窗口状态更新
-        log_signal.log_signal.connect(self.window.set_status)
+        # 定时将缓冲的日志批量刷新到窗口
+        self.log_flusher = LogFlusher(self.ui_handler, CONFIG['logging']['ui_flush_interval_ms'])
+        self.log_flusher.logs_ready.connect(self.window.append_logs)
+        self.log_flusher.start()
+        
+        # 后台任务状态，同一时间只执行一个任务
+        self.current_worker = None
+        self.current_job_name = None
+        self.current_on_result = None
+        self.job_started_at = 0.0
         
         # 初始化各个模块
         self.account_manager = AccountManager()
         self.browser = None  # 延迟初始化，等用户选择账号后再创建
-        self.api_client = ApiClient(
-            cache_dir=CONFIG['paths']['cache_dir'],
-            download_dir=CONFIG['paths']['download_dir']
+        # 登录结束后Chrome保持运行，下次登录直接复用该账号的实例和用户数据目录
+        self.browser_pool = BrowserPool(
+            CONFIG['paths']['cache_dir'],
+            max_size=CONFIG['browser']['pool_size'],
+            idle_timeout=CONFIG['browser']['idle_timeout'],
+            headless=CONFIG['browser']['headless']
         )
         self.data_processor = DataProcessor(
-            download_dir=CONFIG['paths']['download_dir']
+            download_dir=CONFIG['paths']['download_dir'],
+            parse_workers=CONFIG['processing']['parse_workers'],
+            excel_engine=CONFIG['processing']['excel_engine'],
+            parse_cache=CONFIG['processing']['parse_cache'],
+            parse_cache_max_mb=CONFIG['processing']['parse_cache_max_mb'],
+            lean_dtypes=CONFIG['processing']['lean_dtypes']
+        )
+        # 每个账号使用独立的cookies、下载目录和接口客户端
+        self.account_sessions = AccountSessionManager(
+            CONFIG['paths']['cache_dir'],
+            CONFIG['paths']['download_dir'],
+            self.data_processor,
+            api_options={
+                'download_chunk_size': CONFIG['download']['chunk_size'],
+                'download_retries': CONFIG['download']['retries'],
+                'download_timeout': CONFIG['download']['timeout'],
+                'pool_size': CONFIG['http']['pool_size'],
+                'request_timeout': CONFIG['http']['timeout']
+            },
+            export_options=CONFIG['export'],
+            probe_ttl=CONFIG['session']['probe_ttl']
         )
+        
+        # 后台登录状态检查，不占用当前任务
+        self.probe_worker = None
+        self.probe_account = None
+        # 每个账号最近一次因即将过期而自动重新登录的时间，避免新cookies的有效期仍然较短时反复登录
+        self.refreshed_at = {}
+        self.session_timer = QTimer(self)
+        self.session_timer.timeout.connect(self.on_session_timer)
 
         # 从函数加载数据库配置
         db_config = load_db_config()
@@ -89,28 +147,17 @@ class MainApp(QObject):
                               "数据库配置不存在或为空，请在「数据库配置」标签页中设置正确的连接信息")
 
         # 创建数据库管理器
-        self.db_manager = DatabaseManager(
-            server=db_config.get('server', ''),
-            database=db_config.get('database', ''),
-            username=db_config.get('username', ''),
-            password=db_config.get('password', ''),
-            batch_size=db_config.get('batch_size', '100'),
-            timeout=db_config.get('timeout', '30')
-        )
+        self.db_manager = self.create_db_manager(db_config)
 
-        self.cache_manager = CacheManager(
-            cache_dir=CONFIG['paths']['cache_dir'],
-            download_dir=CONFIG['paths']['download_dir']
-        )
-        
         # 连接信号
         self.connect_signals()
         
         # 加载账号配置
         self.load_accounts()
         
-        # 检查是否已有cookie，如果有则启用相应功能
-        self.check_login_status()
+        # 检查当前账号是否已有cookie，如果有则启用相应功能
+        self.check_login_status(self.window.account_combo.currentText())
+        self.session_timer.start(CONFIG['session']['check_interval'] * 1000)
         
         # 显示主窗口
         self.window.show()
@@ -123,8 +170,13 @@ class MainApp(QObject):
         self.window.login_signal.connect(self.login)
         self.window.generate_signal.connect(self.generate_order_list)
         self.window.download_signal.connect(self.download_order_list)
+        self.window.download_all_signal.connect(self.download_all_exports)
+        self.window.sync_orders_signal.connect(self.sync_orders)
+        self.window.sync_all_signal.connect(self.sync_all_accounts)
+        self.window.account_changed_signal.connect(self.check_login_status)
         self.window.upload_signal.connect(self.upload_to_database)
         self.window.clear_cache_signal.connect(self.clear_cache)
+        self.window.cancel_signal.connect(self.cancel_job)
         
         # 新增信号连接
         self.window.clear_orders_signal.connect(self.clear_orders_files)
@@ -139,10 +191,74 @@ class MainApp(QObject):
         
         # 数据库配置信号
         self.window.update_db_config_signal.connect(self.update_db_config)
+        self.window.test_db_connection_signal.connect(self.test_db_connection)
+        self.window.view_db_schema_signal.connect(self.view_db_schema)
         
         # 注册应用退出事件
         self.app.aboutToQuit.connect(self.on_quit)
 
+    def start_job(self, job_name, fn, *args, on_result=None, **kwargs):
+        """在后台线程中执行任务，执行期间禁用功能按钮，任务结束后在界面线程处理结果"""
+        if self.current_worker is not None:
+            self.window.show_message("任务进行中", f"「{self.current_job_name}」正在执行，请等待完成或先取消",
+                                     QMessageBox.Icon.Warning)
+            return False
+        
+        worker = Worker(fn, *args, **kwargs)
+        worker.signals.progress.connect(self.window.set_progress)
+        worker.finished.connect(self.on_job_finished)
+        
+        self.current_worker = worker
+        self.current_job_name = job_name
+        self.current_on_result = on_result
+        self.job_started_at = time.monotonic()
+        
+        self.window.set_busy(True, job_name)
+        logger.info(f"开始执行任务: {job_name}")
+        worker.start()
+        return True
+    
+    def on_job_finished(self):
+        """任务线程结束后恢复界面状态并处理结果"""
+        worker = self.current_worker
+        job_name = self.current_job_name
+        on_result = self.current_on_result
+        if worker is None:
+            return
+        
+        self.current_worker = None
+        self.current_job_name = None
+        self.current_on_result = None
+        self.window.set_busy(False)
+        worker.deleteLater()
+        
+        elapsed = time.monotonic() - self.job_started_at
+        if worker.cancel_event.is_set():
+            logger.info(f"任务「{job_name}」已取消，耗时 {elapsed:.1f} 秒")
+        else:
+            logger.info(f"任务「{job_name}」结束，耗时 {elapsed:.1f} 秒")
+        
+        if worker.error_message is not None:
+            self.window.show_message("执行出错", f"{job_name}时发生错误: {worker.error_message}", QMessageBox.Icon.Critical)
+        elif on_result is not None:
+            on_result(worker.result_value)
+    
+    def cancel_job(self):
+        """取消当前任务"""
+        if self.current_worker is None:
+            return
+        logger.info(f"正在取消任务「{self.current_job_name}」，将在当前步骤完成后停止")
+        self.current_worker.cancel()
+    
+    def show_result(self, result, success_title="成功", failure_title="失败"):
+        """根据任务返回的结果显示提示框"""
+        if result.get('cancelled'):
+            self.window.show_message("已取消", result.get('message', '任务已取消'))
+        elif result.get('success'):
+            self.window.show_message(success_title, result.get('message'))
+        else:
+            self.window.show_message(result.get('title', failure_title), result.get('message'), QMessageBox.Icon.Warning)
+    
     def login(self, account_name):
         """登录处理方法，连接到UI的信号"""
         self.login_jd(account_name)
@@ -153,20 +269,87 @@ class MainApp(QObject):
         if accounts_result.get('success'):
             # 将账号添加到UI的下拉框中
             account_names = accounts_result.get('data', [])
+            # 旧版本所有账号共用登录缓存和下载目录，先迁移到账号目录再检查登录状态
+            self.account_sessions.migrate_legacy_files(account_names)
             for account_name in account_names:
                 self.window.add_account_to_combos(account_name)
             logger.info(f"成功加载 {len(account_names)} 个账号配置")
         else:
             logger.warning("加载账号配置失败")
     
-    def check_login_status(self):
-        """检查登录状态"""
-        has_cookie = self.cache_manager.check_cookie_exists()
+    def check_login_status(self, account_name):
+        """检查所选账号的登录状态"""
+        if not account_name:
+            self.window.enable_logged_in_features(False)
+            return
+        
+        has_cookie = self.account_sessions.get(account_name).has_cookies()
+        self.window.enable_logged_in_features(has_cookie)
         if has_cookie:
-            self.window.enable_logged_in_features(True)
-            logger.info("已检测到登录状态，可以使用所有功能")
+            logger.info(f"已检测到账号 {account_name} 的登录缓存，正在后台确认是否有效")
+            self.probe_session(account_name)
         else:
-            logger.info("未检测到登录状态，请先登录")
+            logger.info(f"未检测到账号 {account_name} 的登录状态，请先登录")
+    
+    def probe_session(self, account_name):
+        """在后台线程中检查账号的登录cookies是否有效，不打开浏览器"""
+        if self.probe_worker is not None:
+            return
+        
+        worker = Worker(self.probe_session_task, account_name)
+        worker.finished.connect(self.on_probe_finished)
+        self.probe_worker = worker
+        self.probe_account = account_name
+        worker.start()
+    
+    def probe_session_task(self, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：检查登录状态，判断是否需要重新登录"""
+        session = self.account_sessions.get(account_name)
+        needs_login, reason = session.needs_login(CONFIG['session']['refresh_before'])
+        return {"needs_login": needs_login, "valid": session.session_valid, "message": reason}
+    
+    def on_probe_finished(self):
+        """登录状态检查线程结束后处理结果"""
+        worker = self.probe_worker
+        if worker is None:
+            return
+        
+        self.probe_worker = None
+        worker.deleteLater()
+        if worker.error_message is not None:
+            logger.warning(f"检查账号 {self.probe_account} 的登录状态时发生错误: {worker.error_message}")
+        elif worker.result_value is not None:
+            self.on_probe_result(self.probe_account, worker.result_value)
+    
+    def on_probe_result(self, account_name, result):
+        """处理后台登录状态检查结果，必要时才打开浏览器重新登录"""
+        if account_name != self.window.account_combo.currentText():
+            return
+        
+        if result.get('valid') is not None:
+            self.window.enable_logged_in_features(result['valid'])
+        
+        if not result.get('needs_login'):
+            if result.get('valid'):
+                logger.info(f"账号 {account_name} 的登录状态有效，可以使用所有功能")
+            return
+        
+        logger.warning(f"账号 {account_name} 需要重新登录: {result.get('message')}")
+        if not CONFIG['session']['auto_login'] or self.current_worker is not None:
+            return
+        refreshed_at = self.refreshed_at.get(account_name)
+        if result.get('valid') and refreshed_at is not None and \
+                time.monotonic() - refreshed_at < CONFIG['session']['refresh_before']:
+            # 刚重新登录过，新cookies的有效期本身就不足 refresh_before，等失效后再登录
+            logger.info(f"账号 {account_name} 刚重新登录过，登录状态仍然有效，暂不再次登录")
+            return
+        self.login_jd(account_name)
+    
+    def on_session_timer(self):
+        """定时在后台检查当前账号的登录状态，在过期前重新登录"""
+        account_name = self.window.account_combo.currentText()
+        if account_name and self.current_worker is None:
+            self.probe_session(account_name)
     
     def login_jd(self, account_name):
         """登录京东"""
@@ -191,16 +374,41 @@ class MainApp(QObject):
             self.window.show_message("错误", error_msg, QMessageBox.Icon.Warning)
             return
         
+        self.start_job("生成登录缓存", self.login_task, account_name, username, password,
+                       on_result=lambda result: self.on_login_result(account_name, result))
+    
+    def login_task(self, account_name, username, password, progress_callback=None, cancel_event=None):
+        """后台任务：打开浏览器并自动登录，cookies保存到该账号的缓存目录"""
+        # 已保存的cookies仍然有效且不会很快过期时，不需要打开浏览器
+        session = self.account_sessions.get(account_name)
+        needs_login, reason = session.needs_login(CONFIG['session']['refresh_before'], force=True)
+        if not needs_login:
+            logger.info(f"账号 {account_name} 的登录状态仍然有效，无需打开浏览器")
+            return "登录成功（登录状态仍然有效）"
+        logger.info(f"账号 {account_name} 需要登录: {reason}")
+        # 登录仍然有效只是即将过期时，不能沿用浏览器中的登录状态
+        refresh = session.has_cookies() and bool(session.session_valid)
+        if refresh:
+            self.refreshed_at[account_name] = time.monotonic()
+        
         # 创建浏览器实例
         self.browser = BrowserAutomation(
-            cache_dir=CONFIG['paths']['cache_dir'],
+            cache_dir=self.account_sessions.get(account_name).cache_dir,
             jd_username=username,
-            jd_password=password
+            jd_password=password,
+            pool=self.browser_pool
         )
         
         logger.info("正在打开浏览器并尝试登录...")
-        result = self.browser.login()
+        result = self.browser.login(refresh=refresh)
         
+        # 需要手动验证时保留浏览器，等待用户操作
+        if result != "需要手动验证":
+            self.close_browser()
+        return result
+    
+    def on_login_result(self, account_name, result):
+        """处理自动登录结果"""
         if result == "需要手动验证":
             # 显示验证对话框
             logger.info("需要手动完成验证，请在浏览器中操作")
@@ -208,77 +416,124 @@ class MainApp(QObject):
             dialog.exec()
             # 用户完成验证后继续
             logger.info("验证完成，等待进入主页面...")
-            
-            # 等待登录成功进入主页面
-            try:
-                WebDriverWait(self.browser.driver, 30).until(
-                    EC.url_contains('gongxiao.jd.com/vender/home')
-                )
-                # 手动保存cookies
-                self.browser.save_cookies()
-                logger.info("已保存登录缓存")
-                self.window.enable_logged_in_features(True)
-            except Exception as e:
-                logger.error(f"等待登录完成失败: {str(e)}")
-                self.window.show_message("登录失败", f"等待登录完成失败: {str(e)}", QMessageBox.Icon.Warning)
-                
+            self.start_job("等待登录完成", self.wait_login_task,
+                           on_result=lambda result: self.on_wait_login_result(account_name, result))
         elif "登录成功" in result:
             logger.info("登录成功")
-            self.window.enable_logged_in_features(True)
+            self.check_login_status(self.window.account_combo.currentText())
         else:
             logger.error(f"登录失败: {result}")
             self.window.show_message("登录失败", result, QMessageBox.Icon.Warning)
-        
-        # 关闭浏览器
+    
+    def wait_login_task(self, progress_callback=None, cancel_event=None):
+        """后台任务：等待手动验证后进入主页面并保存cookies"""
+        try:
+            # 等待登录成功进入主页面
+            WebDriverWait(self.browser.driver, 30).until(
+                EC.url_contains('gongxiao.jd.com/vender/home')
+            )
+            # 手动保存cookies
+            self.browser.save_cookies()
+            logger.info("已保存登录缓存")
+            return {"success": True, "message": "登录成功"}
+        except Exception as e:
+            logger.error(f"等待登录完成失败: {str(e)}")
+            return {"success": False, "message": f"等待登录完成失败: {str(e)}"}
+        finally:
+            self.close_browser()
+    
+    def on_wait_login_result(self, account_name, result):
+        """处理手动验证后的登录结果"""
+        if result.get('success'):
+            self.check_login_status(self.window.account_combo.currentText())
+        else:
+            self.window.show_message("登录失败", result.get('message'), QMessageBox.Icon.Warning)
+    
+    def close_browser(self):
+        """关闭浏览器，Chrome实例归还浏览器池供下次登录复用"""
         if self.browser:
             logger.info("关闭浏览器")
             self.browser.close()
     
     def generate_order_list(self, start_date, end_date, account_name):
-        """生成订单列表"""
+        """生成订单列表并在导出完成后自动下载"""
+        self.start_job("生成并下载订单列表", self.generate_order_list_task, start_date, end_date, account_name,
+                       on_result=lambda result: self.show_result(result, "下载成功", "生成订单列表失败"))
+    
+    def generate_order_list_task(self, start_date, end_date, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：提交订单导出，轮询导出结果并下载"""
         logger.info(f"开始为账号 {account_name} 生成订单列表")
         logger.info(f"时间范围: {start_date} 至 {end_date}")
         
         start_time = f"{start_date} 00:00:00"
         end_time = f"{end_date} 23:59:59"
         
-        result = self.api_client.generate_order_list(start_time, end_time)
+        session = self.account_sessions.get(account_name)
+        result = session.export_poller.run_order_export(
+            start_time, end_time, session.orders_dir, progress_callback, cancel_event
+        )
         
-        if result.get('success', False) or "message" in result:
-            if "message" in result and result["message"] == "成功":
-                total_num = result.get('data', {}).get('totalNum', 0)
-                status_message = f"生成订单列表成功，共 {total_num} 条数据"
-                logger.info(status_message)
-                self.window.show_message("成功", status_message)
-            else:
-                status_message = f"生成订单列表成功: {result.get('message', '未知状态')}"
-                logger.info(status_message)
-                self.window.show_message("成功", status_message)
+        if result.get('success'):
+            logger.info(result.get('message'))
         else:
-            status_message = f"生成订单列表失败: {result.get('message', '未知错误')}"
-            logger.error(status_message)
-            self.window.show_message("失败", status_message, QMessageBox.Icon.Warning)
+            logger.error(result.get('message'))
+        return result
     
     def download_order_list(self, account_name):
         """下载订单列表"""
+        self.start_job("下载订单列表", self.download_order_list_task, account_name,
+                       on_result=lambda result: self.show_result(result, "下载成功", "下载失败"))
+    
+    def download_order_list_task(self, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：下载订单列表"""
         logger.info(f"开始为账号 {account_name} 下载订单列表")
         
-        # 将下载路径修改为orders子文件夹
-        orders_dir = CONFIG['paths']['orders_dir']
-        if not os.path.exists(orders_dir):
-            os.makedirs(orders_dir)
+        # 下载到该账号的orders子文件夹
+        session = self.account_sessions.get(account_name)
+        result = session.api_client.download_order_list(session.orders_dir, progress_callback, cancel_event)
         
-        result = self.api_client.download_order_list(orders_dir)
+        if result.get('success'):
+            logger.info(result.get('message'))
+        else:
+            logger.error(result.get('message'))
+        return result
+    
+    def download_all_exports(self, account_name):
+        """下载全部尚未下载过的订单导出"""
+        self.start_job("下载全部新导出", self.download_all_exports_task, account_name,
+                       on_result=lambda result: self.show_result(result, "下载成功", "下载失败"))
+    
+    def download_all_exports_task(self, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：并行下载导出任务列表中所有尚未下载过的已完成任务"""
+        export_config = CONFIG['export']
+        since = datetime.now() - timedelta(days=export_config['lookback_days'])
+        logger.info(f"开始为账号 {account_name} 下载 {since:%Y-%m-%d %H:%M} 之后创建的全部新导出")
+        
+        session = self.account_sessions.get(account_name)
+        result = session.api_client.download_all_exports(
+            session.orders_dir,
+            since=since,
+            statuses=export_config['download_statuses'],
+            max_workers=export_config['download_workers'],
+            page_size=export_config['page_size'],
+            max_pages=export_config['max_pages'],
+            progress_callback=progress_callback,
+            cancel_event=cancel_event
+        )
         
         if result.get('success'):
             logger.info(result.get('message'))
-            self.window.show_message("下载成功", result.get('message'))
         else:
             logger.error(result.get('message'))
-            self.window.show_message("下载失败", result.get('message'), QMessageBox.Icon.Warning)
+        return result
     
-    def upload_to_database(self):
+    def upload_to_database(self, account_name):
         """上传订单数据到数据库"""
+        self.start_job("上传订单列表", self.upload_to_database_task, account_name,
+                       on_result=lambda result: self.show_result(result, "上传成功", "上传失败"))
+    
+    def upload_to_database_task(self, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：处理订单Excel文件并上传到数据库"""
         logger.info("开始处理Excel文件并上传到数据库")
         
         # 测试数据库连接
@@ -286,222 +541,298 @@ class MainApp(QObject):
         if not test_result.get('success'):
             error_msg = f"数据库连接失败: {test_result.get('message')}"
             logger.error(error_msg)
-            self.window.show_message("数据库连接失败", error_msg, QMessageBox.Icon.Warning)
-            return
+            return {"success": False, "title": "数据库连接失败", "message": error_msg}
         
         logger.info("数据库连接测试成功")
         
-        # 处理Excel文件
-        orders_dir = CONFIG['paths']['orders_dir']
+        # 处理该账号下载的Excel文件，只处理还没有上传过的文件
+        session = self.account_sessions.get(account_name)
+        orders_dir = session.orders_dir
+        manifest = session.orders_manifest if CONFIG['processing']['incremental'] else None
         logger.info(f"从 {orders_dir} 目录读取订单Excel文件")
         
         try:
-            data_result = self.data_processor.process_order_excel(orders_dir)
+            if CONFIG['processing']['streaming']:
+                return self.stream_upload_orders(session, orders_dir, manifest, progress_callback, cancel_event)
+            
+            data_result = self.data_processor.process_order_excel(orders_dir, progress_callback, cancel_event, manifest)
             if not data_result.get('success'):
                 error_msg = f"Excel处理失败: {data_result.get('message')}"
                 logger.error(error_msg)
-                self.window.show_message("处理失败", error_msg, QMessageBox.Icon.Warning)
-                return
+                return {"success": False, "cancelled": data_result.get('cancelled', False),
+                        "title": "处理失败", "message": error_msg}
+            if not data_result['files']:
+                return {"success": True, "message": data_result.get('message')}
                 
             logger.info("Excel文件处理成功")
             
             # 上传数据到数据库
-            upload_result = self.db_manager.upload_data(data_result)
+            upload_result = self.db_manager.upload_data(data_result, progress_callback, cancel_event)
+            self.record_upload(session.orders_manifest, data_result, upload_result)
             if upload_result.get('success'):
                 success_msg = upload_result.get('message')
                 logger.info(success_msg)
-                self.window.show_message("上传成功", success_msg)
+                return {"success": True, "message": success_msg}
             else:
                 error_msg = f"数据上传失败: {upload_result.get('message')}"
                 logger.error(error_msg)
-                self.window.show_message("上传失败", error_msg, QMessageBox.Icon.Warning)
+                return {"success": False, "cancelled": upload_result.get('cancelled', False),
+                        "title": "上传失败", "message": error_msg}
                 
         except Exception as e:
             error_msg = f"上传过程中发生错误: {str(e)}"
             logger.error(error_msg)
-            self.window.show_message("上传错误", error_msg, QMessageBox.Icon.Critical)
+            return {"success": False, "title": "上传错误", "message": error_msg}
+    
+    def stream_upload_orders(self, session, orders_dir, manifest, progress_callback=None, cancel_event=None):
+        """逐个文件解析并上传订单，每个文件上传后立即记录到上传清单"""
+        batches = self.data_processor.iter_order_batches(orders_dir, progress_callback, cancel_event, manifest)
+        upload_result = self.db_manager.upload_stream(
+            batches, progress_callback, cancel_event,
+            on_batch=lambda batch, result: self.record_upload(session.orders_manifest, batch, result),
+            queue_size=CONFIG['processing']['stream_queue_size']
+        )
+        if upload_result.get('success'):
+            success_msg = upload_result.get('message')
+            logger.info(success_msg)
+            return {"success": True, "message": success_msg}
+        else:
+            error_msg = f"订单上传失败: {upload_result.get('message')}"
+            logger.error(error_msg)
+            return {"success": False, "cancelled": upload_result.get('cancelled', False),
+                    "title": "上传失败", "message": error_msg}
+    
+    def record_upload(self, manifest, data_result, upload_result):
+        """在上传清单中记录本次上传的订单文件，成功上传的文件之后不再重复处理"""
+        for file_path in data_result.get('files', []):
+            try:
+                if upload_result.get('success'):
+                    manifest.mark_uploaded(file_path, **data_result.get('file_stats', {}).get(file_path, {}))
+                else:
+                    manifest.mark_failed(file_path, upload_result.get('message'))
+            except OSError as e:
+                logger.warning(f"更新上传清单失败: {str(e)}")
+    
+    def sync_orders(self, start_date, end_date, account_name):
+        """分片导出、解析并上传订单"""
+        self.start_job("一键同步订单", self.sync_orders_task, start_date, end_date, account_name,
+                       on_result=lambda result: self.show_result(result, "同步成功", "同步失败"))
+    
+    def sync_orders_task(self, start_date, end_date, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：按日期分片并发导出订单，完成的分片立即下载解析，最后上传到数据库"""
+        # 先确认数据库可用，避免导出完成后才发现无法上传
+        test_result = self.db_manager.test_connection()
+        if not test_result.get('success'):
+            error_msg = f"数据库连接失败: {test_result.get('message')}"
+            logger.error(error_msg)
+            return {"success": False, "title": "数据库连接失败", "message": error_msg}
+        
+        return self.sync_account(self.account_sessions.get(account_name), start_date, end_date,
+                                 progress_callback, cancel_event)
+    
+    def sync_account(self, session, start_date, end_date, progress_callback=None, cancel_event=None):
+        """分片导出一个账号的订单并上传到数据库，可在多个线程中同时为不同账号调用"""
+        account_name = session.account_name
+        logger.info(f"开始为账号 {account_name} 同步订单，时间范围: {start_date} 至 {end_date}")
+        
+        # 登录已失效时直接返回，不提交注定失败的导出
+        login_result = session.check_login()
+        if login_result.get('success') and not login_result['valid']:
+            error_msg = f"账号 {account_name} {login_result.get('message')}"
+            logger.error(error_msg)
+            return {"success": False, "title": "登录已失效", "message": error_msg}
+        
+        # 流式上传时调度器只下载，之后逐个文件解析上传，不在内存中合并所有分片
+        streaming = CONFIG['processing']['streaming']
+        data_result = session.export_scheduler.run(
+            start_date, end_date,
+            shard=CONFIG['export']['shard'],
+            orders_dir=session.orders_dir,
+            progress_callback=progress_callback,
+            cancel_event=cancel_event,
+            parse=not streaming
+        )
+        if not data_result.get('success'):
+            error_msg = f"账号 {account_name} 分片导出失败: {data_result.get('message')}"
+            logger.error(error_msg)
+            return {"success": False, "cancelled": data_result.get('cancelled', False),
+                    "title": "导出失败", "message": error_msg}
+        
+        logger.info(f"账号 {account_name} 分片导出完成，共下载 {len(data_result['files'])} 个文件，开始上传")
+        
+        if streaming:
+            result = self.stream_upload_orders(session, session.orders_dir, session.orders_manifest,
+                                               progress_callback, cancel_event)
+            prefix = f"账号 {account_name}: " if result.get('success') else f"账号 {account_name} "
+            return dict(result, message=prefix + result.get('message', ''))
+        
+        upload_result = self.db_manager.upload_data(data_result, progress_callback, cancel_event)
+        self.record_upload(session.orders_manifest, data_result, upload_result)
+        if upload_result.get('success'):
+            success_msg = f"账号 {account_name}: {upload_result.get('message')}"
+            logger.info(success_msg)
+            return {"success": True, "message": success_msg}
+        else:
+            error_msg = f"账号 {account_name} 数据上传失败: {upload_result.get('message')}"
+            logger.error(error_msg)
+            return {"success": False, "cancelled": upload_result.get('cancelled', False),
+                    "title": "上传失败", "message": error_msg}
+    
+    def sync_all_accounts(self, start_date, end_date):
+        """同时同步所有已登录账号的订单"""
+        self.start_job("同步全部账号", self.sync_all_accounts_task, start_date, end_date,
+                       on_result=lambda result: self.show_result(result, "同步成功", "同步失败"))
     
-    def clear_cache(self):
+    def sync_all_accounts_task(self, start_date, end_date, progress_callback=None, cancel_event=None):
+        """后台任务：按并发上限同时同步多个账号，总耗时取决于最慢的账号"""
+        accounts_result = self.account_manager.get_all_accounts()
+        if not accounts_result.get('success'):
+            return accounts_result
+        
+        sessions = [self.account_sessions.get(name) for name in accounts_result.get('data', [])]
+        ready = [session for session in sessions if session.has_cookies()]
+        skipped = [session.account_name for session in sessions if not session.has_cookies()]
+        if skipped:
+            logger.warning(f"以下账号没有登录缓存，本次跳过: {', '.join(skipped)}")
+        if not ready:
+            return {"success": False, "message": "没有已生成登录缓存的账号，请先为账号生成登录缓存"}
+        
+        test_result = self.db_manager.test_connection()
+        if not test_result.get('success'):
+            error_msg = f"数据库连接失败: {test_result.get('message')}"
+            logger.error(error_msg)
+            return {"success": False, "title": "数据库连接失败", "message": error_msg}
+        
+        max_parallel = min(CONFIG['accounts']['max_parallel'], len(ready))
+        logger.info(f"开始同步 {len(ready)} 个账号，最多同时同步 {max_parallel} 个")
+        
+        def account_progress(account_name):
+            if progress_callback is None:
+                return None
+            return lambda message: progress_callback(f"[{account_name}] {message}")
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            futures = {
+                executor.submit(self.sync_account, session, start_date, end_date,
+                                account_progress(session.account_name), cancel_event): session.account_name
+                for session in ready
+            }
+            for future in as_completed(futures):
+                account_name = futures[future]
+                try:
+                    results[account_name] = future.result()
+                except Exception as e:
+                    logger.error(f"同步账号 {account_name} 时发生错误: {str(e)}")
+                    results[account_name] = {"success": False, "message": f"账号 {account_name} 同步出错: {str(e)}"}
+        
+        succeeded = [name for name, result in results.items() if result.get('success')]
+        failed = [result.get('message') for result in results.values() if not result.get('success')]
+        summary = f"共同步 {len(ready)} 个账号，成功 {len(succeeded)} 个"
+        if skipped:
+            summary += f"，{len(skipped)} 个账号未登录已跳过"
+        
+        if cancel_event is not None and cancel_event.is_set():
+            return {"success": False, "cancelled": True, "message": f"同步已取消，{summary}"}
+        if failed:
+            return {"success": False, "message": summary + "\n" + "\n".join(failed)}
+        return {"success": True, "message": summary}
+    
+    def clear_cache(self, account_name):
         """清除缓存"""
-        logger.info("开始清除登录缓存")
+        self.start_job("清除登录缓存", self.clear_cache_task, account_name, on_result=self.on_clear_cache_result)
+    
+    def clear_cache_task(self, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：清除账号的登录缓存"""
+        logger.info(f"开始清除账号 {account_name} 的登录缓存")
         
-        result = self.cache_manager.clear_cache()
+        session = self.account_sessions.get(account_name)
+        # 先关闭浏览器池中该账号的空闲Chrome，它仍保持着登录状态并占用用户数据目录
+        self.browser_pool.discard(os.path.join(session.cache_dir, PROFILE_DIR_NAME))
+        result = session.cache_manager.clear_cache()
         
         if result.get('success'):
             logger.info(result.get('message'))
-            self.window.show_message("清除成功", result.get('message'))
-            self.window.enable_logged_in_features(False)  # 禁用需要登录的功能
         else:
             logger.error(result.get('message'))
-            self.window.show_message("清除失败", result.get('message'), QMessageBox.Icon.Warning)
+        return result
+    
+    def on_clear_cache_result(self, result):
+        """处理清除缓存结果"""
+        self.show_result(result, "清除成功", "清除失败")
+        if result.get('success'):
+            self.window.enable_logged_in_features(False)  # 禁用需要登录的功能
     
-    def clear_orders_files(self):
+    def clear_orders_files(self, account_name):
         """清空订单文件夹"""
-        logger.info("开始清空订单文件")
+        self.start_job("清空订单文件", self.clear_files_task, "订单",
+                       self.account_sessions.get(account_name).cache_manager.clear_orders_files,
+                       on_result=lambda result: self.show_result(result, "清除成功", "清除失败"))
+    
+    def clear_service_files(self, account_name):
+        """清空服务单文件夹"""
+        self.start_job("清空服务单文件", self.clear_files_task, "服务单",
+                       self.account_sessions.get(account_name).cache_manager.clear_service_files,
+                       on_result=lambda result: self.show_result(result, "清除成功", "清除失败"))
+    
+    def clear_files_task(self, file_kind, clear_fn, progress_callback=None, cancel_event=None):
+        """后台任务：清空下载文件夹"""
+        logger.info(f"开始清空{file_kind}文件")
         
-        result = self.cache_manager.clear_orders_files()
+        result = clear_fn()
         
         if result.get('success'):
             logger.info(result.get('message'))
-            self.window.show_message("清除成功", result.get('message'))
         else:
             logger.error(result.get('message'))
-            self.window.show_message("清除失败", result.get('message'), QMessageBox.Icon.Warning)
+        return result
     
-    def clear_service_files(self):
-        """清空服务单文件夹"""
-        logger.info("开始清空服务单文件")
+    def generate_service_list(self, start_date, end_date, account_name):
+        """生成服务单列表并在导出完成后自动下载"""
+        self.start_job("生成并下载服务单", self.generate_service_list_task, start_date, end_date, account_name,
+                       on_result=lambda result: self.show_result(result, "下载成功", "生成服务单失败"))
+    
+    def generate_service_list_task(self, start_date, end_date, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：提交服务单导出，轮询导出结果并下载"""
+        logger.info(f"开始为账号 {account_name} 生成服务单列表，时间范围: {start_date} 至 {end_date}")
         
-        result = self.cache_manager.clear_service_files()
+        session = self.account_sessions.get(account_name)
+        result = session.export_poller.run_service_export(
+            f"{start_date} 00:00:00", f"{end_date} 23:59:59",
+            session.service_dir, progress_callback, cancel_event
+        )
         
         if result.get('success'):
             logger.info(result.get('message'))
-            self.window.show_message("清除成功", result.get('message'))
         else:
             logger.error(result.get('message'))
-            self.window.show_message("清除失败", result.get('message'), QMessageBox.Icon.Warning)
-    
-    def generate_service_list(self, start_date, end_date):
-        """生成服务单列表"""
-        logger.info(f"开始生成服务单列表，时间范围: {start_date} 至 {end_date}")
-        
-        # 从cache/cookies.json获取cookies
-        cookie_file = os.path.join(CONFIG['paths']['cache_dir'], 'cookies.json')
-        if not os.path.exists(cookie_file):
-            error_msg = "Cookie文件不存在，请先进行登录"
-            logger.error(error_msg)
-            self.window.show_message("生成失败", error_msg, QMessageBox.Icon.Warning)
-            return
-        
-        try:
-            with open(cookie_file, 'r', encoding='utf-8') as f:
-                cookies_data = json.load(f)
-            
-            # 构建cookie字符串
-            cookie_str = '; '.join([f"{cookie['name']}={cookie['value']}" for cookie in cookies_data])
-            
-            # 准备请求参数
-            start_time = f"{start_date} 00:00:00"
-            end_time = f"{end_date} 23:59:59"
-            
-            payload = {
-                "startCreatedTime": start_time,
-                "endCreatedTime": end_time
-            }
-            
-            # 设置请求头
-            headers = {
-                'authority': 'gmall.jd.com',
-                'method': 'POST',
-                'path': '/api/afs/query/exportAfsService',
-                'scheme': 'https',
-                'accept': 'application/json, text/plain, */*',
-                'accept-encoding': 'gzip, deflate, br, zstd',
-                'accept-language': 'zh-CN,zh;q=0.9',
-                'content-type': 'application/json',
-                'cookie': cookie_str,
-                'origin': 'https://gongxiao.jd.com',
-                'referer': 'https://gongxiao.jd.com/',
-                'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
-            }
-            
-            # 发送请求
-            response = requests.post(
-                'https://gmall.jd.com/api/afs/query/exportAfsService',
-                json=payload,
-                headers=headers
-            )
-            
-            result = response.json()
-            
-            if result.get('success') == True and result.get('message') == "成功":
-                logger.info(f"服务单生成请求成功: {result.get('message')}")
-                self.window.show_message("生成成功", f"服务单生成请求成功，可以点击下载服务单按钮进行下载")
-            else:
-                logger.error(f"服务单生成请求失败: {result}")
-                self.window.show_message("生成失败", f"服务单生成请求失败: {result.get('message', '未知错误')}", QMessageBox.Icon.Warning)
-                
-        except Exception as e:
-            error_msg = f"生成服务单时发生错误: {str(e)}"
-            logger.error(error_msg)
-            self.window.show_message("生成失败", error_msg, QMessageBox.Icon.Critical)
+        return result
     
-    def download_service_list(self):
+    def download_service_list(self, account_name):
         """下载服务单列表"""
-        logger.info("开始下载服务单列表")
+        self.start_job("下载服务单", self.download_service_list_task, account_name,
+                       on_result=lambda result: self.show_result(result, "下载成功", "下载失败"))
+    
+    def download_service_list_task(self, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：下载服务单列表"""
+        logger.info(f"开始为账号 {account_name} 下载服务单列表")
         
-        # 从cache/cookies.json获取cookies
-        cookie_file = os.path.join(CONFIG['paths']['cache_dir'], 'cookies.json')
-        if not os.path.exists(cookie_file):
-            error_msg = "Cookie文件不存在，请先进行登录"
-            logger.error(error_msg)
-            self.window.show_message("下载失败", error_msg, QMessageBox.Icon.Warning)
-            return
+        session = self.account_sessions.get(account_name)
+        result = session.api_client.download_service_list(session.service_dir, progress_callback, cancel_event)
         
-        try:
-            with open(cookie_file, 'r', encoding='utf-8') as f:
-                cookies_data = json.load(f)
-            
-            # 构建cookie字符串
-            cookie_str = '; '.join([f"{cookie['name']}={cookie['value']}" for cookie in cookies_data])
-            
-            # 设置请求头
-            headers = {
-                'authority': 'gmall.jd.com',
-                'method': 'POST',
-                'path': '/api/afs/query/queryExportResult',
-                'scheme': 'https',
-                'accept': 'application/json, text/plain, */*',
-                'content-type': 'application/json',
-                'cookie': cookie_str,
-                'origin': 'https://gongxiao.jd.com',
-                'referer': 'https://gongxiao.jd.com/',
-                'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36'
-            }
-            
-            # 发送请求
-            response = requests.post(
-                'https://gmall.jd.com/api/afs/query/queryExportResult',
-                json={},
-                headers=headers
-            )
-            
-            result = response.json()
-            
-            if result.get('success') == True and result.get('message') == "成功" and result.get('data'):
-                # 从响应中提取下载链接
-                download_url = result.get('data')[0].get('url')
-                if download_url:
-                    # 下载文件
-                    service_dir = CONFIG['paths']['service_dir']
-                    if not os.path.exists(service_dir):
-                        os.makedirs(service_dir)
-                    
-                    # 生成文件名：服务单_当前日期.xls
-                    current_date = datetime.now().strftime('%Y%m%d%H%M%S')
-                    filename = os.path.join(service_dir, f"服务单_{current_date}.xls")
-                    
-                    # 下载文件
-                    file_response = requests.get(download_url)
-                    with open(filename, 'wb') as f:
-                        f.write(file_response.content)
-                    
-                    logger.info(f"服务单下载成功，已保存到: {filename}")
-                    self.window.show_message("下载成功", f"服务单文件已保存到: {filename}")
-                else:
-                    logger.error("下载链接不存在")
-                    self.window.show_message("下载失败", "下载链接不存在，请先生成服务单", QMessageBox.Icon.Warning)
-            else:
-                logger.error(f"服务单下载请求失败: {result}")
-                self.window.show_message("下载失败", f"服务单下载请求失败: {result.get('message', '未知错误')}", QMessageBox.Icon.Warning)
-                
-        except Exception as e:
-            error_msg = f"下载服务单时发生错误: {str(e)}"
-            logger.error(error_msg)
-            self.window.show_message("下载失败", error_msg, QMessageBox.Icon.Critical)
+        if result.get('success'):
+            logger.info(result.get('message'))
+        else:
+            logger.error(result.get('message'))
+        return result
     
-    def upload_service_to_database(self):
+    def upload_service_to_database(self, account_name):
         """上传服务单数据到数据库"""
+        self.start_job("上传服务单", self.upload_service_to_database_task, account_name,
+                       on_result=lambda result: self.show_result(result, "上传成功", "上传失败"))
+    
+    def upload_service_to_database_task(self, account_name, progress_callback=None, cancel_event=None):
+        """后台任务：处理服务单Excel文件并上传到数据库"""
         logger.info("开始处理服务单Excel文件并上传到数据库")
         
         # 测试数据库连接
@@ -509,161 +840,42 @@ class MainApp(QObject):
         if not test_result.get('success'):
             error_msg = f"数据库连接失败: {test_result.get('message')}"
             logger.error(error_msg)
-            self.window.show_message("数据库连接失败", error_msg, QMessageBox.Icon.Warning)
-            return
+            return {"success": False, "title": "数据库连接失败", "message": error_msg}
         
         logger.info("数据库连接测试成功")
         
-        # 处理服务单Excel文件
-        service_dir = CONFIG['paths']['service_dir']
+        # 处理该账号下载的服务单Excel文件，跳过已经上传过的文件
+        session = self.account_sessions.get(account_name)
+        service_dir = session.service_dir
+        manifest = session.service_manifest if CONFIG['processing']['incremental'] else None
         logger.info(f"从 {service_dir} 目录读取服务单Excel文件")
         
         try:
-            # 创建服务单表
-            service_table_sql = """
-                IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='jx_service_orders' AND xtype='U')
-                CREATE TABLE jx_service_orders (
-                    service_no NVARCHAR(50) PRIMARY KEY,
-                    purchase_order_no NVARCHAR(50),
-                    customer_expectation NVARCHAR(255),
-                    service_status NVARCHAR(50),
-                    supplier_id NVARCHAR(50),
-                    supplier_store_name NVARCHAR(100),
-                    distributor_id NVARCHAR(50),
-                    distributor_store_name NVARCHAR(100),
-                    product_name NVARCHAR(255),
-                    product_quantity INT,
-                    purchase_amount DECIMAL(10, 2),
-                    customer_name NVARCHAR(50),
-                    contact_phone NVARCHAR(50),
-                    shipping_address NVARCHAR(255),
-                    customer_feedback NVARCHAR(255),
-                    created_at DATETIME,
-                    return_method NVARCHAR(50),
-                    service_reason NVARCHAR(255),
-                    return_tracking_no NVARCHAR(50),
-                    order_id NVARCHAR(50),
-                    sales_store_front NVARCHAR(100),
-                    order_type NVARCHAR(50),
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """
-            
-            # 连接数据库并创建表
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(service_table_sql)
-            conn.commit()
-            
-            # 查找所有xls文件
-            files_processed = 0
-            total_records = 0
-            
-            for file in os.listdir(service_dir):
-                if file.endswith('.xls') or file.endswith('.xlsx'):
-                    file_path = os.path.join(service_dir, file)
-                    logger.info(f"处理文件: {file_path}")
-                    
-                    # 使用pandas读取Excel文件
-                    import pandas as pd
-                    df = pd.read_excel(file_path)
-                    
-                    # 字段映射
-                    column_mapping = {
-                        '采购单号': 'purchase_order_no',
-                        '服务单号': 'service_no',
-                        '用户期望': 'customer_expectation',
-                        '服务单状态': 'service_status',
-                        '供应商编号': 'supplier_id',
-                        '供应商店铺名称': 'supplier_store_name',
-                        '分销商编号': 'distributor_id',
-                        '分销商店铺名称': 'distributor_store_name',
-                        '产品名称': 'product_name',
-                        '产品数量': 'product_quantity',
-                        '采购金额': 'purchase_amount',
-                        '顾客姓名': 'customer_name',
-                        '联系方式': 'contact_phone',
-                        '收货地址': 'shipping_address',
-                        '用户意见': 'customer_feedback',
-                        '服务单创建时间': 'created_at',
-                        '返件方式': 'return_method',
-                        '申请原因': 'service_reason',
-                        '客户寄回物流单号': 'return_tracking_no',
-                        '订单号': 'order_id',
-                        '前台销售店铺': 'sales_store_front',
-                        '订单类型': 'order_type'
-                    }
-                    
-                    # 重命名列
-                    for old_col, new_col in column_mapping.items():
-                        if old_col in df.columns:
-                            df.rename(columns={old_col: new_col}, inplace=True)
-                    
-                    # 确保服务单号列存在
-                    if 'service_no' not in df.columns:
-                        logger.error(f"文件 {file} 缺少服务单号列，跳过")
-                        continue
-                    
-                    # 如果数据为空，跳过
-                    if df.empty:
-                        logger.warning(f"文件 {file} 中没有数据，跳过")
-                        continue
-                    
-                    # 收集所有服务单号
-                    service_nos = df['service_no'].unique().tolist()
-                    
-                    # 删除已有的相同服务单号记录
-                    if service_nos:
-                        placeholders = ','.join(['?' for _ in service_nos])
-                        delete_sql = f"DELETE FROM jx_service_orders WHERE service_no IN ({placeholders})"
-                        cursor.execute(delete_sql, service_nos)
-                        rows_deleted = cursor.rowcount
-                        logger.info(f"已删除 {rows_deleted} 条旧服务单记录")
-                    
-                    # 上传新数据
-                    records_count = 0
-                    
-                    for _, row in df.iterrows():
-                        # 准备列名和值
-                        columns = [col for col in row.index if col in column_mapping.values() and pd.notna(row[col])]
-                        values = [row[col] for col in columns]
-                        
-                        # 跳过没有服务单号的记录
-                        if 'service_no' not in columns or not values[columns.index('service_no')]:
-                            continue
-                        
-                        # 构建SQL
-                        column_str = ', '.join(columns)
-                        placeholders = ', '.join(['?' for _ in columns])
-                        sql = f"INSERT INTO jx_service_orders ({column_str}) VALUES ({placeholders})"
-                        
-                        try:
-                            cursor.execute(sql, values)
-                            records_count += 1
-                        except Exception as e:
-                            logger.error(f"插入记录时出错: {str(e)}")
-                    
-                    # 提交事务
-                    conn.commit()
-                    logger.info(f"文件 {file} 处理完成，已上传 {records_count} 条记录")
-                    total_records += records_count
-                    files_processed += 1
-            
-            # 关闭连接
-            conn.close()
+            data_result = self.data_processor.process_service_excel(service_dir, progress_callback, cancel_event, manifest)
+            if not data_result.get('success'):
+                error_msg = data_result.get('message')
+                logger.warning(error_msg)
+                return {"success": False, "cancelled": data_result.get('cancelled', False),
+                        "title": "上传提示", "message": error_msg}
+            if not data_result['files']:
+                return {"success": True, "message": data_result.get('message')}
             
-            if files_processed > 0:
-                success_msg = f"服务单上传完成，共处理 {files_processed} 个文件，上传 {total_records} 条记录"
+            upload_result = self.db_manager.upload_service_data(data_result['service_data'], progress_callback, cancel_event)
+            self.record_upload(session.service_manifest, data_result, upload_result)
+            if upload_result.get('success'):
+                success_msg = f"{upload_result.get('message')}，共处理 {len(data_result['files'])} 个文件"
                 logger.info(success_msg)
-                self.window.show_message("上传成功", success_msg)
+                return {"success": True, "message": success_msg}
             else:
-                logger.warning("没有找到服务单文件")
-                self.window.show_message("上传提示", "没有找到可上传的服务单文件", QMessageBox.Icon.Information)
+                error_msg = f"上传服务单失败: {upload_result.get('message')}"
+                logger.error(error_msg)
+                return {"success": False, "cancelled": upload_result.get('cancelled', False),
+                        "title": "上传失败", "message": error_msg}
                 
         except Exception as e:
             error_msg = f"上传服务单时发生错误: {str(e)}"
             logger.error(error_msg)
-            self.window.show_message("上传失败", error_msg, QMessageBox.Icon.Critical)
+            return {"success": False, "message": error_msg}
     
     def save_account_config(self, config):
         """保存账号配置"""
@@ -689,8 +901,9 @@ class MainApp(QObject):
             logger.info(result.get('message'))
             self.window.show_message("删除成功", result.get('message'))
             
-            # 从UI中移除账号
+            # 从UI中移除账号，并关闭该账号的会话
             self.window.remove_account_from_combos(account_name)
+            self.account_sessions.remove(account_name)
         else:
             logger.error(result.get('message'))
             self.window.show_message("删除失败", result.get('message'), QMessageBox.Icon.Warning)
@@ -706,23 +919,94 @@ class MainApp(QObject):
                 logger.warning("数据库配置不存在或为空")
                 return
             
-            # 更新数据库管理器的连接参数
-            self.db_manager = DatabaseManager(
-                server=db_config.get('server', ''),
-                database=db_config.get('database', ''),
-                username=db_config.get('username', ''),
-                password=db_config.get('password', ''),
-                batch_size=db_config.get('batch_size', '100'),
-                timeout=db_config.get('timeout', '30')
-            )
+            # 更新数据库管理器的连接参数，旧连接池中的连接随之关闭
+            old_manager = self.db_manager
+            self.db_manager = self.create_db_manager(db_config)
+            old_manager.close()
             logger.info("数据库配置已更新")
         except Exception as e:
             logger.error(f"更新数据库配置失败: {str(e)}")
     
+    def create_db_manager(self, db_config):
+        """根据数据库配置创建数据库管理器"""
+        return DatabaseManager(
+            server=db_config.get('server', ''),
+            database=db_config.get('database', ''),
+            username=db_config.get('username', ''),
+            password=db_config.get('password', ''),
+            batch_size=db_config.get('batch_size', '100'),
+            timeout=db_config.get('timeout', '30'),
+            upsert_mode=CONFIG['database']['upsert_mode'],
+            chunk_size=CONFIG['database']['chunk_size'],
+            pool_size=CONFIG['database']['pool_size'],
+            pool_idle_timeout=CONFIG['database']['pool_idle_timeout'],
+            skip_unchanged=CONFIG['database']['skip_unchanged']
+        )
+    
+    def get_db_manager_for(self, db_config):
+        """表单中的连接参数与当前配置一致时复用共享的数据库管理器，否则创建临时管理器"""
+        same_target = all(
+            str(db_config.get(key, '')) == str(getattr(self.db_manager, key))
+            for key in ('server', 'database', 'username', 'password')
+        )
+        if same_target:
+            return self.db_manager, False
+        return self.create_db_manager(db_config), True
+    
+    def test_db_connection(self, db_config):
+        """测试数据库配置表单中的连接"""
+        self.start_job("测试数据库连接", self.test_db_connection_task, db_config, on_result=self.on_test_db_connection_result)
+    
+    def test_db_connection_task(self, db_config, progress_callback=None, cancel_event=None):
+        """后台任务：测试数据库连接"""
+        db_manager, is_temporary = self.get_db_manager_for(db_config)
+        try:
+            return db_manager.test_connection()
+        finally:
+            if is_temporary:
+                db_manager.close()
+    
+    def on_test_db_connection_result(self, test_result):
+        """显示数据库连接测试结果"""
+        if test_result.get('success'):
+            self.window.show_message("连接成功", "数据库连接测试成功", QMessageBox.Icon.Information)
+        else:
+            self.window.show_message("连接失败", test_result.get('message'), QMessageBox.Icon.Warning)
+    
+    def view_db_schema(self, db_config):
+        """查询并显示数据库表结构"""
+        self.start_job("查看表结构", self.view_db_schema_task, db_config, on_result=self.on_view_db_schema_result)
+    
+    def view_db_schema_task(self, db_config, progress_callback=None, cancel_event=None):
+        """后台任务：查询数据库表结构"""
+        db_manager, is_temporary = self.get_db_manager_for(db_config)
+        try:
+            return db_manager.get_schema_summary()
+        finally:
+            if is_temporary:
+                db_manager.close()
+    
+    def on_view_db_schema_result(self, schema_result):
+        """显示数据库表结构"""
+        if schema_result.get('success'):
+            self.window.show_db_schema(schema_result.get('data'))
+        else:
+            self.window.show_db_schema_error(schema_result.get('message'))
+    
     def on_quit(self):
         """应用程序退出前的清理工作"""
         logger.info("应用程序正在退出，执行清理操作...")
         
+        # 取消并等待正在执行的后台任务
+        if self.current_worker is not None:
+            self.current_worker.cancel()
+            self.current_worker.wait(10000)
+        
+        # 停止后台登录状态检查
+        self.session_timer.stop()
+        if self.probe_worker is not None:
+            self.probe_worker.wait(10000)
+        
         # 关闭可能存在的浏览器实例
         if hasattr(self, 'browser') and self.browser is not None:
             try:
@@ -730,8 +1014,21 @@ class MainApp(QObject):
                 logger.info("已关闭浏览器实例")
             except Exception as e:
                 logger.error(f"关闭浏览器实例时出错: {str(e)}")
+        # 关闭浏览器池中保持运行的Chrome
+        self.browser_pool.close_all()
+        
+        # 关闭数据库连接池和HTTP会话
+        self.db_manager.close()
+        self.account_sessions.close_all()
         
         logger.info("应用程序清理完成，准备退出")
+        
+        # 写出异步日志队列中剩余的日志，再停止界面日志刷新
+        stats = get_logging_stats()
+        if stats is not None:
+            logger.info(f"异步日志统计: 入队 {stats['enqueued']} 条，丢弃 {stats['dropped']} 条，队列最大深度 {stats['max_depth']}")
+        stop_logging()
+        self.log_flusher.stop()
     
     def run(self):
         """运行应用程序"""
@@ -739,5 +1036,7 @@ class MainApp(QObject):
         return self.app.exec()
 
 if __name__ == "__main__":
+    # 打包后的程序中启动解析进程需要先调用
+    multiprocessing.freeze_support()
     app = MainApp()
     sys.exit(app.run()) 
\ No newline at end of file
@@ -1,7 +1,12 @@
-from modules.browser_automation import BrowserAutomation
+from modules.browser_automation import BrowserAutomation, BrowserPool
 from modules.api_client import ApiClient
-from modules.data_processor import DataProcessor
+from modules.export_poller import ExportPoller
+from modules.export_scheduler import ExportScheduler, split_date_range
+from modules.account_session import AccountSession, AccountSessionManager
+from modules.data_processor import DataProcessor, SERVICE_COLUMN_MAPPING, SERVICE_STRING_COLUMNS
+from modules.excel_reader import read_excel
 from modules.database_manager import DatabaseManager
 from modules.cache_manager import CacheManager
 from modules.account_manager import AccountManager
-from modules.log_handler import UILogHandler, LogSignal, setup_logging, get_logger 
\ No newline at end of file
+from modules.log_handler import UILogHandler, LogFlusher, setup_logging, get_logger, get_logging_stats, stop_logging 
+from modules.progress import ProgressReporter, OperationCancelled
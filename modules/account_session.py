@@ -0,0 +1,286 @@
+import os
+import re
+import shutil
+import hashlib
+import time
+import threading
+import logging
+from datetime import datetime, timedelta
+from modules.api_client import ApiClient
+from modules.cache_manager import CacheManager
+from modules.export_poller import ExportPoller
+from modules.export_scheduler import ExportScheduler
+from modules.ingestion_manifest import IngestionManifest
+
+logger = logging.getLogger('AccountSession')
+
+def _legacy_account_dir_name(account_name):
+    """旧版本使用的账号目录名，不同账号可能得到相同的目录名"""
+    return re.sub(r'[\\/*?:"<>|\s]', '_', account_name)
+
+def account_dir_name(account_name):
+    """
+    将账号名称转换为可用作目录名的字符串
+    
+    非法字符和空白替换为 '_'，再附加原始名称哈希的前8位，"a b" 和 "a_b" 等账号不会共用目录
+    """
+    digest = hashlib.sha1(account_name.encode('utf-8')).hexdigest()[:8]
+    return f"{_legacy_account_dir_name(account_name)}-{digest}"
+
+def _move_contents(source_dir, target_dir):
+    """把目录中的文件和子目录移动到目标目录，目标中已存在的同名项保留不动，返回移动的数量"""
+    if not os.path.isdir(source_dir):
+        return 0
+    os.makedirs(target_dir, exist_ok=True)
+    moved = 0
+    for name in os.listdir(source_dir):
+        target = os.path.join(target_dir, name)
+        if os.path.exists(target):
+            logger.warning(f"{target} 已存在，保留 {os.path.join(source_dir, name)} 不迁移")
+            continue
+        shutil.move(os.path.join(source_dir, name), target)
+        moved += 1
+    return moved
+
+class AccountSession:
+    """
+    单个账号的会话状态
+    
+    每个账号有专属的cookies缓存目录和下载目录，以及基于这些目录的
+    ApiClient、CacheManager、ExportPoller 和 ExportScheduler，多个账号可以同时工作互不干扰；
+    订单和服务单目录各有一份上传清单，记录已经上传过的文件
+    
+    参数:
+        account_name: 账号名称
+        cache_dir: 账号专属的缓存目录，保存 cookies.json 等文件
+        download_dir: 账号专属的下载目录，其下包含 orders 和 service 子目录
+        data_processor: 共用的 DataProcessor 实例
+        api_options: 创建 ApiClient 时的额外参数
+        export_options: 导出相关配置，即 CONFIG['export']
+        probe_ttl: 登录状态检查结果的有效秒数，期间不重复请求接口
+    """
+    def __init__(self, account_name, cache_dir, download_dir, data_processor, api_options=None, export_options=None,
+                 probe_ttl=300):
+        self.account_name = account_name
+        self.cache_dir = cache_dir
+        self.download_dir = download_dir
+        self.orders_dir = os.path.join(download_dir, 'orders')
+        self.service_dir = os.path.join(download_dir, 'service')
+        export_options = export_options or {}
+        self.probe_ttl = probe_ttl
+        
+        # 最近一次登录状态检查的结果
+        self.session_valid = None
+        self.session_expiry = None
+        self._checked_at = None
+        self._cookie_mtime = None
+        self._probe_lock = threading.Lock()
+        
+        self.api_client = ApiClient(cache_dir=cache_dir, download_dir=download_dir, **(api_options or {}))
+        self.cache_manager = CacheManager(cache_dir=cache_dir, download_dir=download_dir)
+        self.orders_manifest = IngestionManifest(self.orders_dir)
+        self.service_manifest = IngestionManifest(self.service_dir)
+        self.export_poller = ExportPoller(
+            self.api_client,
+            initial_delay=export_options.get('poll_initial_delay', 2),
+            max_delay=export_options.get('poll_max_delay', 30),
+            timeout=export_options.get('poll_timeout', 900)
+        )
+        self.export_scheduler = ExportScheduler(
+            self.api_client,
+            data_processor,
+            max_concurrent=export_options.get('max_concurrent', 3),
+            initial_delay=export_options.get('poll_initial_delay', 2),
+            max_delay=export_options.get('poll_max_delay', 30),
+            timeout=export_options.get('poll_timeout', 900)
+        )
+    
+    def has_cookies(self):
+        """该账号是否已生成登录缓存"""
+        return os.path.exists(self.api_client.cookie_path)
+    
+    def check_login(self, force=False):
+        """
+        检查该账号的登录cookies是否仍然有效
+        
+        检查结果缓存 probe_ttl 秒，cookies文件变化后重新检查
+        
+        参数:
+            force: 是否忽略缓存的结果重新检查
+        
+        返回:
+            dict: 检查结果，包含 valid 和 expiry（登录cookies的过期时间，未知时为None）
+        """
+        with self._probe_lock:
+            try:
+                cookie_mtime = os.path.getmtime(self.api_client.cookie_path)
+            except OSError:
+                cookie_mtime = None
+            
+            fresh = (self._checked_at is not None
+                     and time.monotonic() - self._checked_at < self.probe_ttl
+                     and cookie_mtime == self._cookie_mtime)
+            if fresh and not force:
+                return {"success": True, "valid": self.session_valid, "expiry": self.session_expiry,
+                        "message": "登录状态有效" if self.session_valid else "登录已失效，请重新生成登录缓存"}
+            
+            result = self.api_client.check_session()
+            result['expiry'] = self.api_client.cookie_expiry()
+            if result.get('success'):
+                # 网络异常时不知道登录是否有效，不缓存结果
+                self.session_valid = result['valid']
+                self.session_expiry = result['expiry']
+                self._checked_at = time.monotonic()
+                self._cookie_mtime = cookie_mtime
+            return result
+    
+    def needs_login(self, refresh_before=0, force=False):
+        """
+        是否需要打开浏览器重新登录
+        
+        参数:
+            refresh_before: 登录cookies在多少秒内过期时提前重新登录
+            force: 是否忽略缓存的检查结果
+        
+        返回:
+            tuple: (是否需要登录, 原因)
+        """
+        if not self.has_cookies():
+            return True, "没有登录缓存"
+        
+        result = self.check_login(force)
+        if not result.get('success'):
+            # 无法确认时不打开浏览器，等下次检查
+            return False, result.get('message')
+        if not result['valid']:
+            return True, result.get('message')
+        
+        expiry = result.get('expiry')
+        if expiry is not None and expiry - datetime.now() < timedelta(seconds=refresh_before):
+            return True, f"登录将在 {expiry:%Y-%m-%d %H:%M} 过期"
+        return False, result.get('message')
+    
+    def close(self):
+        """关闭该账号的HTTP会话"""
+        self.api_client.close()
+
+class AccountSessionManager:
+    """
+    按账号创建并缓存 AccountSession
+    
+    账号 A 的文件保存在 cache_root/accounts/<目录名> 和 download_root/accounts/<目录名> 下，
+    目录名见 account_dir_name
+    """
+    def __init__(self, cache_root, download_root, data_processor, api_options=None, export_options=None,
+                 probe_ttl=300):
+        self.legacy_cache_root = cache_root
+        self.legacy_download_root = download_root
+        self.cache_root = os.path.join(cache_root, 'accounts')
+        self.download_root = os.path.join(download_root, 'accounts')
+        self.data_processor = data_processor
+        self.api_options = api_options
+        self.export_options = export_options
+        self.probe_ttl = probe_ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+    
+    def get(self, account_name):
+        """
+        获取账号的会话，不存在时创建
+        
+        参数:
+            account_name: 账号名称
+        """
+        with self._lock:
+            session = self._sessions.get(account_name)
+            if session is None:
+                dir_name = account_dir_name(account_name)
+                self._migrate_account_dirs(account_name, dir_name)
+                session = AccountSession(
+                    account_name,
+                    os.path.join(self.cache_root, dir_name),
+                    os.path.join(self.download_root, dir_name),
+                    self.data_processor,
+                    self.api_options,
+                    self.export_options,
+                    self.probe_ttl
+                )
+                self._sessions[account_name] = session
+                logger.info(f"已创建账号 {account_name} 的会话，缓存目录: {session.cache_dir}")
+            return session
+    
+    def _migrate_account_dirs(self, account_name, dir_name):
+        """把旧版本目录名（不含哈希）下的账号目录重命名为新的目录名"""
+        legacy_name = _legacy_account_dir_name(account_name)
+        for root in (self.cache_root, self.download_root):
+            legacy_dir = os.path.join(root, legacy_name)
+            new_dir = os.path.join(root, dir_name)
+            if os.path.isdir(legacy_dir) and not os.path.exists(new_dir):
+                try:
+                    os.rename(legacy_dir, new_dir)
+                    logger.info(f"已将账号 {account_name} 的目录 {legacy_dir} 迁移到 {new_dir}")
+                except OSError as e:
+                    logger.warning(f"迁移账号 {account_name} 的目录 {legacy_dir} 失败: {str(e)}")
+    
+    def migrate_legacy_files(self, account_names):
+        """
+        迁移按账号分目录之前的登录缓存和下载文件
+        
+        旧版本所有账号共用 cache_root/cookies.json 以及 download_root 下的 orders 和 service 目录。
+        只配置了一个账号时把这些文件移动到该账号的目录中；有多个账号时无法判断归属，只记录提示
+        
+        参数:
+            account_names: 所有已配置的账号名称
+        
+        返回:
+            bool: 是否执行了迁移
+        """
+        legacy_cookies = os.path.join(self.legacy_cache_root, 'cookies.json')
+        legacy_dirs = {kind: os.path.join(self.legacy_download_root, kind) for kind in ('orders', 'service')}
+        pending = [legacy_cookies] if os.path.exists(legacy_cookies) else []
+        pending += [path for path in legacy_dirs.values() if os.path.isdir(path) and os.listdir(path)]
+        if not pending:
+            return False
+        
+        if len(account_names) != 1:
+            logger.warning(
+                f"发现旧版本的登录缓存或下载文件: {', '.join(pending)}。现在每个账号使用独立的目录"
+                f"（{self.cache_root} 和 {self.download_root} 下的账号目录），"
+                f"请将这些文件移动到对应账号的目录中，或重新登录并下载"
+            )
+            return False
+        
+        session = self.get(account_names[0])
+        try:
+            if os.path.exists(legacy_cookies):
+                os.makedirs(session.cache_dir, exist_ok=True)
+                if os.path.exists(session.api_client.cookie_path):
+                    logger.warning(f"账号 {session.account_name} 已有登录缓存，保留旧的 {legacy_cookies} 不迁移")
+                else:
+                    shutil.move(legacy_cookies, session.api_client.cookie_path)
+            moved = _move_contents(legacy_dirs['orders'], session.orders_dir)
+            moved += _move_contents(legacy_dirs['service'], session.service_dir)
+        except OSError as e:
+            logger.warning(f"迁移旧版本文件到账号 {session.account_name} 的目录失败: {str(e)}")
+            return False
+        
+        # 上传清单在迁移后重新加载
+        session.orders_manifest = IngestionManifest(session.orders_dir)
+        session.service_manifest = IngestionManifest(session.service_dir)
+        logger.info(f"已将旧版本的登录缓存和 {moved} 个下载文件迁移到账号 {session.account_name} 的目录")
+        return True
+    
+    def remove(self, account_name):
+        """关闭并移除账号的会话，账号被删除时调用"""
+        with self._lock:
+            session = self._sessions.pop(account_name, None)
+        if session is not None:
+            session.close()
+    
+    def close_all(self):
+        """关闭所有账号的会话"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
\ No newline at end of file
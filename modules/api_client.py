@@ -1,15 +1,50 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import os
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import random
 import re
+import logging
+from modules.progress import ProgressReporter, OperationCancelled
+
+logger = logging.getLogger('ApiClient')
+
+# 所有京东接口共用的请求头
+DEFAULT_HEADERS = {
+    "accept": "application/json, text/plain, */*",
+    "accept-encoding": "gzip, deflate, br, zstd",
+    "accept-language": "zh-CN,zh;q=0.9",
+    "origin": "https://gongxiao.jd.com",
+    "referer": "https://gongxiao.jd.com/",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
+    "x-requested-with": "XMLHttpRequest"
+}
+
+# 决定登录状态的cookies，用于计算登录的过期时间
+AUTH_COOKIE_NAMES = ('thor', 'pin', 'pt_key', 'pt_pin')
+
+# 导出任务的编号字段，任一存在时直接作为任务标识
+TASK_ID_FIELDS = ('id', 'taskId', 'taskNo')
+# 没有编号时用于识别任务的字段，提交后不再变化
+TASK_STABLE_FIELDS = ('createTime', 'createdTime', 'created', 'gmtCreate', 'taskName', 'startTime', 'endTime',
+                      'param', 'queryParam')
+# 导出过程中会变化的字段，不参与任务标识
+TASK_VOLATILE_FIELDS = ('status', 'statusName', 'statusDesc', 'progress', 'targetFile', 'url', 'fileSize',
+                        'finishTime', 'updateTime', 'modified', 'gmtModified', 'errorMsg', 'remark')
 
 class ApiClient:
-    def __init__(self, cache_dir='./cache', download_dir='./Downloads'):
+    def __init__(self, cache_dir='./cache', download_dir='./Downloads',
+                 download_chunk_size=1024 * 1024, download_retries=5, download_timeout=60,
+                 pool_size=10, request_timeout=30):
         self.cache_dir = cache_dir
         self.download_dir = download_dir
+        self.download_chunk_size = download_chunk_size
+        self.download_retries = download_retries
+        self.download_timeout = download_timeout
+        self.request_timeout = request_timeout
         self.orders_dir = os.path.join(download_dir, 'orders')
         self.service_dir = os.path.join(download_dir, 'service')
         
@@ -23,13 +58,67 @@ class ApiClient:
             os.makedirs(self.service_dir)
             
         self.cookie_path = os.path.join(cache_dir, 'cookies.json')
+        # 已下载过的导出任务记录，批量下载时跳过
+        self.downloaded_exports_path = os.path.join(cache_dir, 'downloaded_exports.json')
+        self._cookie_mtime = None
+        self.cookies = {}
+        
+        # 调用京东接口的会话，复用 api.m.jd.com / gmall.jd.com 的长连接
+        self.session = self._create_session(pool_size)
+        self.session.headers.update(DEFAULT_HEADERS)
+        # 下载导出文件的会话，文件地址是签名链接，不携带登录cookies
+        self.download_session = self._create_session(pool_size)
+        # 不接受压缩传输，Content-Length 和 Range 的字节位置才与写入文件的字节数一致
+        self.download_session.headers['Accept-Encoding'] = 'identity'
+        
+        self.refresh_cookies()
+    
+    @staticmethod
+    def _create_session(pool_size):
+        """创建带连接池的会话"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+    
+    def refresh_cookies(self, force=False):
+        """
+        cookies文件发生变化时重新加载到会话中
+        
+        参数:
+            force: 是否忽略修改时间强制重新加载
+        
+        返回:
+            bool: 是否重新加载了cookies
+        """
+        try:
+            mtime = os.path.getmtime(self.cookie_path)
+        except OSError:
+            mtime = None
+        
+        if not force and mtime == self._cookie_mtime:
+            return False
+        
+        self._cookie_mtime = mtime
         self.cookies = self.load_cookies()
+        self.session.cookies.clear()
+        for name, value in self.cookies.items():
+            self.session.cookies.set(name, value)
+        if self.cookies:
+            logger.info(f"已加载 {len(self.cookies)} 个登录cookies")
+        return True
+    
+    def close(self):
+        """关闭会话及其连接池"""
+        self.session.close()
+        self.download_session.close()
         
     def load_cookies(self):
         """从文件加载cookies"""
         if os.path.exists(self.cookie_path):
             try:
-                with open(self.cookie_path, 'r') as f:
+                with open(self.cookie_path, 'r', encoding='utf-8') as f:
                     cookie_list = json.load(f)
                     return {cookie['name']: cookie['value'] for cookie in cookie_list}
             except Exception as e:
@@ -37,12 +126,70 @@ class ApiClient:
                 return {}
         return {}
     
+    def cookie_expiry(self):
+        """
+        从保存的cookie列表中读取登录cookies的过期时间
+        
+        返回:
+            datetime: 最早过期的登录cookie的过期时间，cookies中没有记录过期时间时返回None
+        """
+        if not os.path.exists(self.cookie_path):
+            return None
+        try:
+            with open(self.cookie_path, 'r', encoding='utf-8') as f:
+                cookie_list = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取cookies过期时间失败: {str(e)}")
+            return None
+        
+        expiries = [cookie['expiry'] for cookie in cookie_list
+                    if cookie.get('name') in AUTH_COOKIE_NAMES and cookie.get('expiry')]
+        if not expiries:
+            return None
+        return datetime.fromtimestamp(min(expiries))
+    
+    def check_session(self):
+        """
+        用一次轻量的导出任务查询检查登录cookies是否仍然有效，不打开浏览器
+        
+        返回:
+            dict: 检查结果，success 表示检查本身是否完成，valid 表示登录是否有效
+        """
+        url = "https://gmall.jd.com/api/batchTask/list"
+        
+        # cookies文件变化时刷新
+        self.refresh_cookies()
+        if not self.cookies:
+            return {"success": True, "valid": False, "message": "Cookie文件不存在，请先进行登录"}
+        
+        data = {"taskType": 18, "page": {"current": 1, "pageSize": 1}}
+        try:
+            # 登录失效时接口会跳转到登录页，不跟随跳转直接判定为失效
+            response = self.session.post(url, json=data, timeout=self.request_timeout, allow_redirects=False)
+        except Exception as e:
+            return {"success": False, "valid": False, "message": f"检查登录状态时请求异常: {str(e)}"}
+        
+        if response.is_redirect or response.status_code in (401, 403):
+            return {"success": True, "valid": False, "message": "登录已失效，请重新生成登录缓存"}
+        if response.status_code != 200:
+            return {"success": False, "valid": False, "message": f"检查登录状态失败，状态码: {response.status_code}"}
+        
+        try:
+            resp_json = response.json()
+        except ValueError:
+            return {"success": True, "valid": False, "message": "登录已失效，请重新生成登录缓存"}
+        
+        if resp_json.get('success'):
+            return {"success": True, "valid": True, "message": "登录状态有效"}
+        return {"success": True, "valid": False,
+                "message": f"登录已失效，请重新生成登录缓存: {resp_json.get('message', '接口返回格式错误')}"}
+    
     def generate_order_list(self, start_time, end_time):
         """生成订单列表"""
         url = "https://api.m.jd.com/api"
         
-        # 刷新cookies
-        self.cookies = self.load_cookies()
+        # cookies文件变化时刷新
+        self.refresh_cookies()
         
         # 生成timestamp
         timestamp = str(int(datetime.now().timestamp() * 1000))
@@ -57,19 +204,8 @@ class ApiClient:
         }
         
         headers = {
-            "authority": "api.m.jd.com",
-            "method": "POST",
-            "path": f"/api?functionId=api_order_export&scval=all&loginType=3&appid=gx-pc&client=pc&t={timestamp}",
-            "scheme": "https",
-            "accept": "application/json, text/plain, */*",
-            "accept-encoding": "gzip, deflate, br, zstd",
-            "accept-language": "zh-CN,zh;q=0.9",
             "content-type": "application/x-www-form-urlencoded",
-            "origin": "https://gongxiao.jd.com",
-            "referer": "https://gongxiao.jd.com/",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
             "x-referer-page": "https://gongxiao.jd.com/vender/home",
-            "x-requested-with": "XMLHttpRequest",
             "x-rp-client": "h5_1.0.0"
         }
         
@@ -84,7 +220,7 @@ class ApiClient:
         }
         
         try:
-            response = requests.post(url, params=params, headers=headers, cookies=self.cookies, data=data)
+            response = self.session.post(url, params=params, headers=headers, data=data, timeout=self.request_timeout)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -92,77 +228,445 @@ class ApiClient:
         except Exception as e:
             return {"success": False, "message": f"请求异常: {str(e)}"}
     
-    def download_order_list(self, orders_dir=None):
-        """下载订单列表"""
-        url = "https://gmall.jd.com/api/batchTask/list"
+    def download_file(self, url, file_path, progress_callback=None, cancel_event=None):
+        """
+        以流式方式下载文件，支持断点续传
         
-        # 如果没有提供订单目录，使用默认的
-        if orders_dir is None:
-            orders_dir = self.orders_dir
+        数据按块写入 file_path + '.part' 临时文件，网络中断后使用HTTP Range请求从已下载的位置继续，
+        下载完成后再原子地重命名为目标文件，内存占用与文件大小无关
         
-        # 确保目录存在
-        if not os.path.exists(orders_dir):
-            os.makedirs(orders_dir)
+        参数:
+            url: 文件下载地址
+            file_path: 保存路径
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止下载并保留临时文件
         
-        # 刷新cookies
-        self.cookies = self.load_cookies()
+        返回:
+            dict: 下载结果，成功时包含 file_path 和 size
+        """
+        temp_path = file_path + '.part'
+        file_name = os.path.basename(file_path)
+        last_error = None
         
-        headers = {
-            "authority": "gmall.jd.com",
-            "method": "POST",
-            "path": "/api/batchTask/list",
-            "scheme": "https",
-            "accept": "application/json, text/plain, */*",
-            "accept-encoding": "gzip, deflate, br, zstd",
-            "accept-language": "zh-CN,zh;q=0.9",
-            "content-type": "application/json",
-            "origin": "https://gongxiao.jd.com",
-            "referer": "https://gongxiao.jd.com/",
-            "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
-            "x-requested-with": "XMLHttpRequest"
-        }
+        for attempt in range(1, self.download_retries + 1):
+            offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            
+            try:
+                with self.download_session.get(url, headers=headers, stream=True, timeout=(10, self.download_timeout)) as response:
+                    if response.status_code == 416 and offset:
+                        # 已下载的部分超出服务器文件大小，丢弃后重新下载
+                        logger.warning(f"{file_name} 的断点位置无效，重新下载")
+                        os.remove(temp_path)
+                        continue
+                    
+                    if response.status_code == 206 and offset:
+                        # Content-Range: bytes start-end/total
+                        content_range = response.headers.get('Content-Range', '')
+                        match = re.match(r'bytes (\d+)-\d+/(\d+|\*)', content_range)
+                        if not match or int(match.group(1)) != offset:
+                            logger.warning(f"{file_name} 的续传响应范围不匹配，重新下载")
+                            os.remove(temp_path)
+                            continue
+                        total = int(match.group(2)) if match.group(2) != '*' else None
+                        mode = 'ab'
+                        logger.info(f"从 {offset} 字节处继续下载 {file_name}")
+                    elif response.status_code == 200:
+                        # 服务器不支持Range时从头下载
+                        offset = 0
+                        content_length = response.headers.get('Content-Length')
+                        total = int(content_length) if content_length else None
+                        mode = 'wb'
+                    else:
+                        return {"success": False, "message": f"下载文件失败，状态码: {response.status_code}"}
+                    
+                    if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+                        # 服务器仍然压缩传输时，长度是压缩后的字节数，无法与解压后写入的字节数比较
+                        total = None
+                    
+                    progress = ProgressReporter(
+                        f"下载 {file_name}",
+                        total / 1024 if total else None,
+                        progress_callback,
+                        cancel_event,
+                        unit='KB',
+                        initial=offset / 1024
+                    )
+                    
+                    downloaded = offset
+                    with open(temp_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                            progress.check_cancelled()
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            downloaded += len(chunk)
+                            progress.advance(len(chunk) / 1024)
+                    progress.report(force=True)
+                
+                if total is not None and downloaded != total:
+                    raise IOError(f"文件不完整，已下载 {downloaded} / {total} 字节")
+                
+                os.replace(temp_path, file_path)
+                logger.info(f"{file_name} 下载完成，共 {downloaded} 字节，平均 {progress.rate():.0f} KB/秒")
+                return {"success": True, "message": f"文件下载成功: {file_path}", "file_path": file_path, "size": downloaded}
+            
+            except OperationCancelled:
+                logger.info(f"{file_name} 下载已取消，已下载部分保留在 {temp_path}")
+                return {"success": False, "cancelled": True, "message": "下载已取消"}
+            except (requests.RequestException, IOError) as e:
+                last_error = e
+                if attempt < self.download_retries:
+                    delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+                    logger.warning(f"下载 {file_name} 中断: {str(e)}，{delay:.1f} 秒后第 {attempt + 1} 次尝试")
+                    time.sleep(delay)
+        
+        return {"success": False, "message": f"下载文件失败，已重试 {self.download_retries} 次: {str(last_error)}"}
+    
+    @staticmethod
+    def task_key(task):
+        """
+        获取导出任务的唯一标识，用于区分提交前后出现的任务
+        
+        标识在导出过程中必须保持不变：没有任务编号时使用创建时间和查询范围，
+        不使用状态、进度以及导出完成后才出现的文件地址
+        """
+        for field in TASK_ID_FIELDS:
+            if task.get(field):
+                return str(task[field])
+        stable = {field: task[field] for field in TASK_STABLE_FIELDS if task.get(field) not in (None, '')}
+        if stable:
+            return json.dumps(stable, sort_keys=True, ensure_ascii=False)
+        for field in ('targetFile', 'url'):
+            if task.get(field):
+                return str(task[field])
+        return json.dumps({field: value for field, value in task.items() if field not in TASK_VOLATILE_FIELDS},
+                          sort_keys=True, ensure_ascii=False, default=str)
+    
+    def list_export_tasks(self, task_type=18, page=1, page_size=10):
+        """
+        查询批量导出任务列表
+        
+        参数:
+            task_type: 任务类型，18为订单导出
+            page: 页码，从1开始
+            page_size: 每页数量
+        
+        返回:
+            dict: 查询结果，成功时 data 为任务列表，total 为任务总数（接口未返回时为None）
+        """
+        url = "https://gmall.jd.com/api/batchTask/list"
+        
+        # cookies文件变化时刷新
+        self.refresh_cookies()
         
         data = {
-            "taskType": 18,
+            "taskType": task_type,
             "page": {
-                "current": 1,
-                "pageSize": 10
+                "current": page,
+                "pageSize": page_size
             }
         }
         
         try:
-            response = requests.post(url, headers=headers, cookies=self.cookies, json=data)
-            if response.status_code == 200:
-                resp_json = response.json()
+            response = self.session.post(url, json=data, timeout=self.request_timeout)
+            if response.status_code != 200:
+                return {"success": False, "message": f"请求失败，状态码: {response.status_code}"}
+            
+            resp_json = response.json()
+            if not resp_json.get('success'):
+                return {"success": False, "message": f"查询导出任务失败: {resp_json.get('message', '接口返回格式错误')}"}
+            
+            payload = resp_json.get('data') or {}
+            rows = payload.get('rows') or []
+            return {"success": True, "data": rows, "total": payload.get('total')}
+        except Exception as e:
+            return {"success": False, "message": f"请求异常: {str(e)}"}
+    
+    def download_export_task(self, task, orders_dir=None, progress_callback=None, cancel_event=None):
+        """
+        下载已完成的订单导出任务文件
+        
+        参数:
+            task: 导出任务列表中的一行，需包含 targetFile
+            orders_dir: 保存目录，默认使用 download_dir/orders
+        """
+        if orders_dir is None:
+            orders_dir = self.orders_dir
+        if not os.path.exists(orders_dir):
+            os.makedirs(orders_dir)
+        
+        file_url = task.get('targetFile')
+        if not file_url:
+            return {"success": False, "message": "导出任务尚未生成文件"}
+        
+        # 提取文件名 - 只使用问号之前的部分
+        if '?' in file_url:
+            file_name = file_url.split('?')[0].split('/')[-1]
+        else:
+            file_name = file_url.split('/')[-1]
+        
+        # 确保文件名有效
+        file_name = re.sub(r'[\\/*?:"<>|]', '_', file_name)  # 替换非法字符
+        
+        # 确保使用标准化的路径分隔符
+        file_path = os.path.join(os.path.abspath(orders_dir), file_name)
+        
+        # 下载文件
+        download_result = self.download_file(file_url, file_path, progress_callback, cancel_event)
+        if download_result.get('success'):
+            # 把文件修改时间设为导出任务的创建时间，并行下载时较早的导出即使较晚下载完成也不会被当作较新的快照
+            created_at = self._task_created_at(task)
+            if created_at is not None:
+                try:
+                    timestamp = created_at.timestamp()
+                    os.utime(file_path, (timestamp, timestamp))
+                except (OSError, OverflowError, ValueError) as e:
+                    logger.warning(f"设置 {file_name} 的导出时间失败，将按下载时间排序: {str(e)}")
+            return {"success": True, "message": f"订单列表下载成功，文件保存在: {file_path}", "file_path": file_path,
+                    "size": download_result.get('size', 0)}
+        else:
+            return download_result
+    
+    def download_order_list(self, orders_dir=None, progress_callback=None, cancel_event=None):
+        """下载最近一个已完成的订单导出任务"""
+        result = self.list_export_tasks()
+        if not result.get('success'):
+            return result
+        
+        # 跳过仍在导出中、尚未生成文件的任务
+        finished = [task for task in result['data'] if task.get('targetFile')]
+        if not finished:
+            return {"success": False, "message": "未找到可下载的文件或接口返回格式错误"}
+        
+        return self.download_export_task(finished[0], orders_dir, progress_callback, cancel_event)
+    
+    @staticmethod
+    def _task_created_at(task):
+        """
+        解析导出任务的创建时间，兼容毫秒时间戳和 YYYY-MM-DD HH:MM:SS 字符串，无法解析时返回None
+        """
+        for field in ('createTime', 'createdTime', 'created', 'gmtCreate'):
+            value = task.get(field)
+            if value in (None, ''):
+                continue
+            try:
+                if isinstance(value, (int, float)):
+                    return datetime.fromtimestamp(value / 1000 if value > 1e11 else value)
+                return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+            except (OverflowError, OSError, ValueError):
+                # 时间戳超出范围或格式不正确时尝试下一个字段，都无法解析时视为未知
+                continue
+        return None
+    
+    def _load_downloaded_exports(self):
+        """读取已下载过的导出任务记录"""
+        if os.path.exists(self.downloaded_exports_path):
+            try:
+                with open(self.downloaded_exports_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"读取已下载导出记录失败，将重新下载: {str(e)}")
+        return {}
+    
+    def _save_downloaded_exports(self, downloaded):
+        """保存已下载过的导出任务记录，先写临时文件再替换，避免写入中断损坏记录"""
+        temp_path = self.downloaded_exports_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(downloaded, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.downloaded_exports_path)
+    
+    def download_all_exports(self, orders_dir=None, since=None, statuses=None, max_workers=4, page_size=50,
+                             max_pages=20, progress_callback=None, cancel_event=None):
+        """
+        分页查询导出任务列表，并行下载所有尚未下载过的已完成任务
+        
+        参数:
+            orders_dir: 保存目录，默认使用 download_dir/orders
+            since: datetime，只下载在此之后创建的任务，None表示不限
+            statuses: 允许的任务状态集合（CONFIG['export']['download_statuses']），None表示只要求任务已生成文件
+            max_workers: 同时下载的文件数
+            page_size: 每页查询的任务数
+            max_pages: 最多查询的页数
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止下载
+        
+        返回:
+            dict: 下载结果，files 为本次下载的文件路径列表
+        """
+        # 分页收集符合条件的已完成任务，任务按创建时间倒序，遇到更早的任务即可停止
+        tasks = []
+        for page in range(1, max_pages + 1):
+            result = self.list_export_tasks(page=page, page_size=page_size)
+            if not result.get('success'):
+                if page == 1:
+                    return result
+                logger.warning(f"查询第 {page} 页导出任务失败，只下载已查询到的任务: {result.get('message')}")
+                break
+            
+            rows = result['data']
+            reached_older = False
+            for task in rows:
+                created_at = self._task_created_at(task)
+                if since is not None and created_at is not None and created_at < since:
+                    reached_older = True
+                    continue
+                if not task.get('targetFile'):
+                    continue
+                if statuses is not None and task.get('status') not in statuses:
+                    continue
+                tasks.append(task)
+            
+            total = result['total']
+            if reached_older or len(rows) < page_size or (total is not None and page * page_size >= total):
+                break
+        
+        downloaded = self._load_downloaded_exports()
+        pending = [task for task in tasks if self.task_key(task) not in downloaded]
+        if not pending:
+            return {"success": True, "message": f"没有新的导出文件需要下载，已跳过 {len(tasks)} 个下载过的任务", "files": []}
+        
+        logger.info(f"共找到 {len(tasks)} 个已完成的导出任务，其中 {len(pending)} 个尚未下载，使用 {max_workers} 个线程并行下载")
+        
+        def download_task(task):
+            if cancel_event is not None and cancel_event.is_set():
+                return {"success": False, "cancelled": True, "message": "下载已取消"}
+            return self.download_export_task(task, orders_dir, None, cancel_event)
+        
+        started = time.monotonic()
+        total_bytes = 0
+        files = []
+        errors = []
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(download_task, task): task for task in pending}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"success": False, "message": f"下载异常: {str(e)}"}
                 
-                if resp_json.get('success') and resp_json.get('data', {}).get('rows'):
-                    file_url = resp_json['data']['rows'][0]['targetFile']
-                    
-                    # 提取文件名 - 只使用问号之前的部分
-                    if '?' in file_url:
-                        file_name = file_url.split('?')[0].split('/')[-1]
-                    else:
-                        file_name = file_url.split('/')[-1]
-                    
-                    # 确保文件名有效
-                    file_name = re.sub(r'[\\/*?:"<>|]', '_', file_name)  # 替换非法字符
-                    
-                    # 下载文件
-                    download_response = requests.get(file_url)
-                    if download_response.status_code == 200:
-                        # 确保使用标准化的路径分隔符
-                        download_dir = os.path.abspath(orders_dir)
-                        file_path = os.path.join(download_dir, file_name)
-                        
-                        with open(file_path, 'wb') as f:
-                            f.write(download_response.content)
-                            
-                        return {"success": True, "message": f"订单列表下载成功，文件保存在: {file_path}", "file_path": file_path}
-                    else:
-                        return {"success": False, "message": f"下载文件失败，状态码: {download_response.status_code}"}
-                else:
-                    return {"success": False, "message": "未找到可下载的文件或接口返回格式错误"}
+                if result.get('success'):
+                    files.append(result['file_path'])
+                    total_bytes += result.get('size', 0)
+                    downloaded[self.task_key(task)] = {
+                        "file_path": result['file_path'],
+                        "downloaded_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    }
+                    self._save_downloaded_exports(downloaded)
+                elif not result.get('cancelled'):
+                    errors.append(result.get('message'))
+                    logger.error(f"下载导出任务 {self.task_key(task)} 失败: {result.get('message')}")
+                
+                if progress_callback:
+                    elapsed = max(time.monotonic() - started, 1e-6)
+                    progress_callback(
+                        f"批量下载导出文件: {len(files) + len(errors)}/{len(pending)} 个，"
+                        f"共 {total_bytes / 1024 / 1024:.1f} MB，{total_bytes / 1024 / 1024 / elapsed:.1f} MB/秒"
+                    )
+        
+        elapsed = max(time.monotonic() - started, 1e-6)
+        summary = (f"成功下载 {len(files)} 个导出文件，共 {total_bytes / 1024 / 1024:.1f} MB，"
+                   f"耗时 {elapsed:.1f} 秒，平均 {total_bytes / 1024 / 1024 / elapsed:.1f} MB/秒")
+        logger.info(summary)
+        
+        cancelled = cancel_event is not None and cancel_event.is_set()
+        if cancelled:
+            return {"success": False, "cancelled": True, "message": f"批量下载已取消，{summary}", "files": files}
+        if errors:
+            return {"success": False, "message": f"{summary}，{len(errors)} 个文件下载失败: {errors[0]}", "files": files}
+        return {"success": True, "message": summary, "files": files}
+    
+    def generate_service_list(self, start_time, end_time):
+        """
+        提交服务单导出请求
+        
+        参数:
+            start_time: 开始时间，格式 YYYY-MM-DD HH:MM:SS
+            end_time: 结束时间，格式 YYYY-MM-DD HH:MM:SS
+        """
+        url = "https://gmall.jd.com/api/afs/query/exportAfsService"
+        
+        # cookies文件变化时刷新
+        self.refresh_cookies()
+        if not self.cookies:
+            return {"success": False, "message": "Cookie文件不存在，请先进行登录"}
+        
+        payload = {
+            "startCreatedTime": start_time,
+            "endCreatedTime": end_time
+        }
+        
+        try:
+            response = self.session.post(url, json=payload, timeout=self.request_timeout)
+            result = response.json()
+            
+            if result.get('success') == True and result.get('message') == "成功":
+                return {"success": True, "message": "服务单生成请求成功，可以点击下载服务单按钮进行下载"}
             else:
-                return {"success": False, "message": f"请求失败，状态码: {response.status_code}"}
+                return {"success": False, "message": f"服务单生成请求失败: {result.get('message', '未知错误')}"}
         except Exception as e:
-            return {"success": False, "message": f"请求异常: {str(e)}"} 
\ No newline at end of file
+            return {"success": False, "message": f"生成服务单时发生错误: {str(e)}"}
+    
+    def query_service_exports(self):
+        """
+        查询服务单导出结果列表
+        
+        返回:
+            dict: 查询结果，成功时 data 为导出记录列表
+        """
+        url = "https://gmall.jd.com/api/afs/query/queryExportResult"
+        
+        # cookies文件变化时刷新
+        self.refresh_cookies()
+        if not self.cookies:
+            return {"success": False, "message": "Cookie文件不存在，请先进行登录"}
+        
+        try:
+            response = self.session.post(url, json={}, timeout=self.request_timeout)
+            result = response.json()
+            
+            if result.get('success') == True and result.get('message') == "成功":
+                return {"success": True, "data": result.get('data') or []}
+            else:
+                return {"success": False, "message": f"服务单下载请求失败: {result.get('message', '未知错误')}"}
+        except Exception as e:
+            return {"success": False, "message": f"查询服务单导出结果时发生错误: {str(e)}"}
+    
+    def download_service_export(self, export, service_dir=None, progress_callback=None, cancel_event=None):
+        """
+        下载一条服务单导出记录对应的文件
+        
+        参数:
+            export: 导出结果列表中的一条记录，需包含 url
+            service_dir: 服务单保存目录，默认使用 download_dir/service
+        """
+        if service_dir is None:
+            service_dir = self.service_dir
+        if not os.path.exists(service_dir):
+            os.makedirs(service_dir)
+        
+        download_url = export.get('url')
+        if not download_url:
+            return {"success": False, "message": "下载链接不存在，请先生成服务单"}
+        
+        # 生成文件名：服务单_当前日期.xls
+        current_date = datetime.now().strftime('%Y%m%d%H%M%S')
+        file_path = os.path.join(os.path.abspath(service_dir), f"服务单_{current_date}.xls")
+        
+        download_result = self.download_file(download_url, file_path, progress_callback, cancel_event)
+        if download_result.get('success'):
+            return {"success": True, "message": f"服务单文件已保存到: {file_path}", "file_path": file_path}
+        else:
+            return download_result
+    
+    def download_service_list(self, service_dir=None, progress_callback=None, cancel_event=None):
+        """查询服务单导出结果并下载最新的导出文件"""
+        result = self.query_service_exports()
+        if not result.get('success'):
+            return result
+        if not result['data']:
+            return {"success": False, "message": "服务单下载请求失败: 没有导出记录"}
+        
+        return self.download_service_export(result['data'][0], service_dir, progress_callback, cancel_event)
\ No newline at end of file
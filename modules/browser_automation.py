@@ -8,43 +8,291 @@ from webdriver_manager.chrome import ChromeDriverManager
 import os
 import json
 import time
+import threading
+import logging
+
+logger = logging.getLogger('BrowserAutomation')
+
+HOME_URL = 'https://gongxiao.jd.com/vender/home'
+LOGIN_MODE_XPATH = '//*[@id="app"]/div/div[1]/div/div/div/div/div[1]/span'
+# 只在已登录的主页面上出现的元素（退出登录入口）
+LOGGED_IN_XPATH = '//a[contains(@href, "logout") or contains(normalize-space(.), "退出")]'
+
+# 账号缓存目录下保存Chrome用户数据（登录状态）的子目录
+PROFILE_DIR_NAME = 'chrome_profile'
+
+# 进程内缓存的ChromeDriver路径，只解析一次
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+def resolve_driver_path(cache_dir):
+    """
+    获取ChromeDriver路径，只在第一次使用时联网查询
+    
+    解析结果保存在 cache_dir/chromedriver.json 中，之后启动直接使用本地路径，离线也可以登录
+    
+    参数:
+        cache_dir: 保存ChromeDriver路径的目录
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path and os.path.exists(_driver_path):
+            return _driver_path
+        
+        record_path = os.path.join(cache_dir, 'chromedriver.json')
+        if os.path.exists(record_path):
+            try:
+                with open(record_path, 'r', encoding='utf-8') as f:
+                    path = json.load(f).get('path')
+                if path and os.path.exists(path):
+                    _driver_path = path
+                    return path
+            except Exception as e:
+                logger.warning(f"读取ChromeDriver路径记录失败: {str(e)}")
+        
+        # 自动下载和安装ChromeDriver
+        path = ChromeDriverManager().install()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(record_path, 'w', encoding='utf-8') as f:
+                json.dump({"path": path}, f, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f"保存ChromeDriver路径记录失败: {str(e)}")
+        _driver_path = path
+        return path
+
+def create_driver(driver_path, profile_dir=None, headless=False):
+    """
+    启动一个Chrome实例
+    
+    参数:
+        driver_path: ChromeDriver路径
+        profile_dir: Chrome用户数据目录，保留登录和受信任设备状态，为None时使用临时目录
+        headless: 是否使用无头模式，不显示浏览器窗口
+    """
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument('--headless=new')
+    if profile_dir:
+        chrome_options.add_argument(f'--user-data-dir={os.path.abspath(profile_dir)}')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--window-size=1920,1080')
+    
+    service = Service(driver_path)
+    return webdriver.Chrome(service=service, options=chrome_options)
+
+class BrowserPool:
+    """
+    Chrome实例池：每个Chrome用户数据目录对应一个实例，用完后保持运行供下次登录复用
+    
+    同一个用户数据目录同时只能被一个Chrome使用，因此同一账号的登录会排队等待；
+    实例总数达到上限时关闭最久未使用的空闲实例，空闲超时的实例自动关闭
+    
+    参数:
+        cache_dir: 保存ChromeDriver路径记录的目录
+        max_size: 同时保持的Chrome实例上限
+        idle_timeout: 空闲实例保留的秒数
+        headless: 默认是否使用无头模式
+    """
+    def __init__(self, cache_dir, max_size=3, idle_timeout=600, headless=True):
+        self.cache_dir = cache_dir
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = idle_timeout
+        self.headless = headless
+        
+        self._idle = {}  # 用户数据目录 -> (实例, 是否无头, 最后归还时间)
+        self._in_use = {}  # 用户数据目录 -> 是否无头
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    def acquire(self, profile_dir, headless=None, timeout=None):
+        """
+        取出用户数据目录对应的Chrome实例，没有空闲实例时启动新的实例
+        
+        参数:
+            profile_dir: Chrome用户数据目录
+            headless: 是否使用无头模式，为None时使用池的默认设置
+            timeout: 等待实例可用的最长秒数
+        """
+        headless = self.headless if headless is None else headless
+        deadline = None if timeout is None else time.monotonic() + timeout
+        driver, stale = None, []
+        
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("浏览器池已关闭")
+                stale.extend(self._evict_idle_locked())
+                if profile_dir not in self._in_use:
+                    if profile_dir in self._idle:
+                        idle_driver, idle_headless, _ = self._idle.pop(profile_dir)
+                        if idle_headless == headless:
+                            driver = idle_driver
+                        else:
+                            stale.append(idle_driver)
+                    if driver is not None or len(self._idle) + len(self._in_use) < self.max_size:
+                        break
+                    if self._idle:
+                        # 实例数已满，关闭最久未使用的空闲实例
+                        oldest = min(self._idle, key=lambda key: self._idle[key][2])
+                        stale.append(self._idle.pop(oldest)[0])
+                        break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"等待浏览器实例超时，浏览器池已满 ({self.max_size})")
+                self._condition.wait(remaining)
+            self._in_use[profile_dir] = headless
+        
+        for old_driver in stale:
+            self._quit_quietly(old_driver)
+        
+        try:
+            if driver is not None and not self._is_alive(driver):
+                logger.info("浏览器池中的Chrome实例已失效，重新启动")
+                self._quit_quietly(driver)
+                driver = None
+            if driver is None:
+                driver = create_driver(resolve_driver_path(self.cache_dir), profile_dir, headless)
+            return driver
+        except Exception:
+            with self._condition:
+                self._in_use.pop(profile_dir, None)
+                self._condition.notify_all()
+            raise
+    
+    def release(self, profile_dir, driver, discard=False):
+        """归还Chrome实例，discard 为True或池已关闭时直接关闭实例"""
+        with self._condition:
+            headless = self._in_use.pop(profile_dir, self.headless)
+            if not discard and not self._closed:
+                self._idle[profile_dir] = (driver, headless, time.monotonic())
+                driver = None
+            self._condition.notify_all()
+        if driver is not None:
+            self._quit_quietly(driver)
+    
+    def discard(self, profile_dir):
+        """关闭该用户数据目录的空闲实例，例如清除登录缓存之前；使用中的实例不受影响"""
+        with self._condition:
+            idle = self._idle.pop(profile_dir, None)
+            self._condition.notify_all()
+        if idle is not None:
+            self._quit_quietly(idle[0])
+    
+    def close_all(self):
+        """关闭所有空闲实例，使用中的实例在归还时关闭"""
+        with self._condition:
+            self._closed = True
+            drivers = [driver for driver, _, _ in self._idle.values()]
+            self._idle = {}
+            self._condition.notify_all()
+        for driver in drivers:
+            self._quit_quietly(driver)
+    
+    def _evict_idle_locked(self):
+        """取出空闲超时的实例，由调用方在释放锁后关闭"""
+        now = time.monotonic()
+        expired = [key for key, (_, _, last_used) in self._idle.items() if now - last_used > self.idle_timeout]
+        return [self._idle.pop(key)[0] for key in expired]
+    
+    @staticmethod
+    def _is_alive(driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _quit_quietly(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
 
 class BrowserAutomation:
-    def __init__(self, cache_dir='./cache', jd_username='', jd_password=''):
+    """
+    自动登录京东供销平台并保存cookies
+    
+    参数:
+        cache_dir: 账号的缓存目录，保存 cookies.json 和Chrome用户数据目录
+        jd_username: 京东账号
+        jd_password: 京东密码
+        pool: BrowserPool 实例，为None时每次登录启动新的Chrome并在结束后关闭
+    """
+    def __init__(self, cache_dir='./cache', jd_username='', jd_password='', pool=None):
         self.cache_dir = cache_dir
         self.jd_username = jd_username
         self.jd_password = jd_password
+        self.pool = pool
         
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir)
             
         self.cookie_path = os.path.join(cache_dir, 'cookies.json')
+        self.profile_dir = os.path.join(cache_dir, PROFILE_DIR_NAME)
         self.driver = None
+        self.headless = False
         
-    def init_browser(self):
-        """初始化Chrome浏览器"""
-        chrome_options = Options()
-        # chrome_options.add_argument('--headless')  # 无头模式，不显示浏览器窗口
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('--window-size=1920,1080')
+    def init_browser(self, headless=None):
+        """初始化Chrome浏览器，使用浏览器池时取出该账号的实例"""
+        if self.pool is not None:
+            self.driver = self.pool.acquire(self.profile_dir, headless)
+            self.headless = self.pool.headless if headless is None else headless
+            return
         
-        # 自动下载和安装ChromeDriver
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
+        self.headless = bool(headless)
+        self.driver = create_driver(resolve_driver_path(self.cache_dir), headless=self.headless)
         
-    def login(self):
-        """自动登录京东供销平台"""
+    def login(self, refresh=False):
+        """
+        自动登录京东供销平台
+        
+        无头模式下遇到滑动验证时，改用可见的浏览器重新登录，方便用户手动完成验证
+        
+        参数:
+            refresh: 登录状态有效但即将过期时为True，不沿用浏览器中的登录状态，重新输入账号密码
+        """
+        result = self._login(refresh)
+        if result == "需要手动验证" and self.headless:
+            logger.info("需要手动验证，改用可见的浏览器重新打开登录页")
+            self.close(discard=True)
+            self.init_browser(headless=False)
+            result = self._login(refresh)
+        return result
+    
+    def _login(self, refresh=False):
+        """打开登录页并输入账号密码"""
         if self.driver is None:
             self.init_browser()
             
-        self.driver.get('https://gongxiao.jd.com/vender/home')
+        self.driver.get(HOME_URL)
+        
+        # 登录表单和主页面在同一地址异步渲染，等待其中之一出现后再判断；
+        # 复用的用户数据目录中登录仍然有效时，直接进入主页面
+        try:
+            WebDriverWait(self.driver, 10).until(EC.any_of(
+                EC.presence_of_element_located((By.XPATH, LOGIN_MODE_XPATH)),
+                EC.presence_of_element_located((By.XPATH, LOGGED_IN_XPATH))
+            ))
+        except Exception:
+            pass  # 两者都没有出现时按未登录处理，下面等待登录方式时会报告超时
+        if not self.driver.find_elements(By.XPATH, LOGIN_MODE_XPATH) and \
+                self.driver.find_elements(By.XPATH, LOGGED_IN_XPATH):
+            if not refresh:
+                self.save_cookies()
+                return "登录成功"
+            # 沿用浏览器中的登录状态只会保存同样即将过期的cookies，清除后重新登录
+            logger.info("登录状态即将过期，清除浏览器中的登录状态后重新登录")
+            self.clear_login_state()
+            self.driver.get(HOME_URL)
         
         # 检查登录方式
         try:
             login_mode = WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, '//*[@id="app"]/div/div[1]/div/div/div/div/div[1]/span'))
+                EC.presence_of_element_located((By.XPATH, LOGIN_MODE_XPATH))
             ).text
             
             if login_mode == "密码登录":
@@ -101,6 +349,13 @@ class BrowserAutomation:
         except Exception as e:
             return f"登录失败: {str(e)}"
     
+    def clear_login_state(self):
+        """清除浏览器中所有域名的cookies，不支持时只清除当前页面域名的cookies"""
+        try:
+            self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        except Exception:
+            self.driver.delete_all_cookies()
+    
     def save_cookies(self):
         """保存cookies到本地"""
         if self.driver:
@@ -108,8 +363,16 @@ class BrowserAutomation:
             with open(self.cookie_path, 'w') as f:
                 json.dump(cookies, f)
                 
-    def close(self):
-        """关闭浏览器"""
+    def close(self, discard=False):
+        """
+        关闭浏览器，使用浏览器池时将实例归还池中保持运行
+        
+        参数:
+            discard: 是否关闭实例而不是归还池中
+        """
         if self.driver:
-            self.driver.quit()
+            if self.pool is not None:
+                self.pool.release(self.profile_dir, self.driver, discard)
+            else:
+                self.driver.quit()
             self.driver = None 
\ No newline at end of file
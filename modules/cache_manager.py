@@ -2,6 +2,8 @@ import os
 import glob
 import shutil
 import logging
+from modules.parse_cache import CACHE_DIR_NAME as PARSE_CACHE_DIR_NAME
+from modules.browser_automation import PROFILE_DIR_NAME
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -35,10 +37,12 @@ class CacheManager:
                     os.remove(cookie_file)
                     logger.info(f"已删除Cookies文件: {cookie_file}")
                 
-                # 清除其他临时文件
-                for file in glob.glob(os.path.join(self.cache_dir, '*.*')):
-                    os.remove(file)
-                    logger.info(f"已删除缓存文件: {file}")
+                # Chrome用户数据目录中也保存着登录状态，需要一起删除；
+                # 已下载导出记录和ChromeDriver路径等其他缓存文件保留
+                profile_dir = os.path.join(self.cache_dir, PROFILE_DIR_NAME)
+                if os.path.exists(profile_dir):
+                    shutil.rmtree(profile_dir)
+                    logger.info(f"已删除浏览器用户数据: {profile_dir}")
             
             # 清除下载文件夹中的所有文件
             if os.path.exists(self.download_dir):
@@ -66,6 +70,12 @@ class CacheManager:
                     files_count += 1
                     logger.info(f"已删除订单文件: {file}")
                 
+                # 删除订单文件的解析缓存
+                parse_cache_dir = os.path.join(self.orders_dir, PARSE_CACHE_DIR_NAME)
+                if os.path.exists(parse_cache_dir):
+                    shutil.rmtree(parse_cache_dir)
+                    logger.info(f"已删除解析缓存: {parse_cache_dir}")
+                
                 return {"success": True, "message": f"订单文件清空成功，共删除 {files_count} 个文件"}
             else:
                 logger.info(f"订单文件夹不存在: {self.orders_dir}，已创建")
@@ -1,15 +1,472 @@
 import pandas as pd
+import numpy as np
 import os
 import glob
 import logging
+import importlib.util
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from modules.progress import ProgressReporter, OperationCancelled
+from modules.excel_reader import read_excel
+from modules.parse_cache import ParseCache
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('DataProcessor')
 
+# 订单解析器版本，解析逻辑变化时加1，使旧的解析缓存失效
+PARSER_VERSION = 2
+
+# 定义字段映射关系
+ORDER_COLUMN_MAPPING = {
+    # 主表字段
+    '订单编号': 'order_id',
+    '换货单的原始订单编号': 'exchange_original_order_id',
+    '订单状态': 'status',
+    '订单锁定状态': 'lock_status',
+    '供应商编号': 'supplier_id',
+    '供应商商家名称': 'supplier_name',
+    '供应商店铺名称': 'supplier_store_name',
+    '分销商编号': 'distributor_id',
+    '分销商商家名称': 'distributor_name',
+    '分销商店铺名称': 'distributor_store_name',
+    '运费': 'shipping_fee',
+    '收货人姓名': 'receiver_name',
+    '联系方式': 'contact_phone',
+    '收货地址': 'shipping_address',
+    '订单备注': 'order_remark',
+    '订单创建时间': 'created_at',
+    '订单出库时间': 'outbound_at',
+    '订单完成时间': 'completed_at',
+    '订单取消时间': 'canceled_at',
+    '是否京仓': 'is_jd_warehouse',
+    '采购单应付采购款': 'payable_amount',
+    '用户实际支付总额': 'user_payment_total',
+    '指定承运商': 'carrier',
+    '物流运单号': 'tracking_number',
+
+    # 明细表字段
+    '产品名称': 'product_name',
+    '产品颜色': 'product_color',
+    '产品尺码': 'product_size',
+    '商家SKU': 'merchant_sku',
+    '父SKU': 'parent_sku',
+    '子SKU': 'child_sku',
+    '产品采购价': 'purchase_price',
+    '采购数量': 'purchase_quantity'
+}
+
+# 定义主表和明细表字段
+MASTER_FIELDS = [
+    'order_id', 'exchange_original_order_id', 'status', 'lock_status',
+    'supplier_id', 'supplier_name', 'supplier_store_name',
+    'distributor_id', 'distributor_name', 'distributor_store_name',
+    'shipping_fee', 'receiver_name', 'contact_phone', 'shipping_address',
+    'order_remark', 'created_at', 'outbound_at', 'completed_at', 'canceled_at',
+    'is_jd_warehouse', 'payable_amount', 'user_payment_total',
+    'carrier', 'tracking_number'
+]
+
+# 定义明细表字段
+DETAIL_FIELDS = [
+    'order_id', 'supplier_id', 'product_name', 'product_color', 'product_size',
+    'merchant_sku', 'parent_sku', 'child_sku', 'purchase_price',
+    'purchase_quantity'
+]
+
+# 订单文件中需要按字符串读取的列
+ORDER_STRING_COLUMNS = {
+    '父SKU': str,
+    '子SKU': str,
+    '商家SKU': str,
+    '订单编号': str,
+    '物流运单号': str,
+    '供应商编号': str,
+    '分销商编号': str
+}
+
+# 日期字段和数值字段
+DATE_FIELDS = ['created_at', 'outbound_at', 'completed_at', 'canceled_at']
+NUMERIC_FIELDS = ['shipping_fee', 'purchase_price', 'purchase_quantity', 'payable_amount', 'user_payment_total']
+
+# 内存优化模式下使用分类类型的低基数字段
+CATEGORY_FIELDS = ['status', 'lock_status', 'supplier_name', 'distributor_store_name', 'carrier', 'is_jd_warehouse']
+
+# 内存优化模式下向下转换为较小整数类型的字段；金额字段保持float64，避免损失精度
+INTEGER_FIELDS = ['purchase_quantity']
+
+# 内存优化模式下文本字段使用的可空字符串类型，安装了pyarrow时使用更紧凑的Arrow存储
+TEXT_DTYPE = 'string[pyarrow]' if importlib.util.find_spec('pyarrow') is not None else 'string'
+
+# 服务单字段映射关系
+SERVICE_COLUMN_MAPPING = {
+    '采购单号': 'purchase_order_no',
+    '服务单号': 'service_no',
+    '用户期望': 'customer_expectation',
+    '服务单状态': 'service_status',
+    '供应商编号': 'supplier_id',
+    '供应商店铺名称': 'supplier_store_name',
+    '分销商编号': 'distributor_id',
+    '分销商店铺名称': 'distributor_store_name',
+    '产品名称': 'product_name',
+    '产品数量': 'product_quantity',
+    '采购金额': 'purchase_amount',
+    '顾客姓名': 'customer_name',
+    '联系方式': 'contact_phone',
+    '收货地址': 'shipping_address',
+    '用户意见': 'customer_feedback',
+    '服务单创建时间': 'created_at',
+    '返件方式': 'return_method',
+    '申请原因': 'service_reason',
+    '客户寄回物流单号': 'return_tracking_no',
+    '订单号': 'order_id',
+    '前台销售店铺': 'sales_store_front',
+    '订单类型': 'order_type'
+}
+
+# 服务单文件中需要按字符串读取的列
+SERVICE_STRING_COLUMNS = {
+    '采购单号': str,
+    '服务单号': str,
+    '供应商编号': str,
+    '分销商编号': str,
+    '联系方式': str,
+    '客户寄回物流单号': str,
+    '订单号': str
+}
+
+# 服务单表的固定字段，文件中缺少的字段为空值
+SERVICE_FIELDS = list(SERVICE_COLUMN_MAPPING.values())
+
+# 服务单的日期字段、整数字段和金额字段
+SERVICE_DATE_FIELDS = ['created_at']
+SERVICE_INTEGER_FIELDS = ['product_quantity']
+SERVICE_NUMERIC_FIELDS = ['purchase_amount']
+
+# 可以转换为int64而不损失精度的最大绝对值
+_EXACT_INT_LIMIT = 2 ** 53
+
+def repair_sku_column(column):
+    """
+    将SKU列转换为字符串，并把科学计数法显示的SKU还原为完整数字，'nan' 转为空字符串
+    
+    只对包含 'e' 的值做数值转换，结果与逐个单元格执行 f"{float(x):.0f}" 相同；
+    包含 'e' 但不是数字的SKU保持原样。字符串类型的列上按是否包含 'e' 筛选只需一次扫描，
+    比对整列执行 pd.to_numeric 快得多，数值转换和格式化只处理科学计数法的行
+    
+    参数:
+        column: SKU列
+    
+    返回:
+        Series: 处理后的字符串列
+    """
+    column = column.astype(str)
+    # 包含 'e' 的值不可能是空白或 'nan'，只需要按是否包含 'e' 筛选
+    candidates = column.str.contains('[eE]', regex=True)
+    missing = column == 'nan'
+    if candidates.any():
+        strings = column[candidates]
+        try:
+            # 通常都是数字，直接转换比 pd.to_numeric 快；有非数字的SKU时再逐个判断
+            numbers = strings.astype('float64')
+        except (TypeError, ValueError):
+            numbers = pd.to_numeric(strings.str.strip(), errors='coerce')
+            numbers = numbers[numbers.notna()]
+        rounded = numbers.round()
+        # 精度范围内的整数直接转换；超出范围、无穷大和带负号的0（包括 '-0e0'）交给字符串格式化处理，
+        # 保证输出 '-0' 与逐个单元格格式化的结果相同
+        exact = (rounded.abs() < _EXACT_INT_LIMIT) & ~(np.signbit(rounded) & (rounded == 0))
+        column = column.copy()
+        column.loc[numbers.index[exact]] = list(map(str, rounded[exact].astype('int64').tolist()))
+        others = numbers.index[~exact]
+        if len(others):
+            column.loc[others] = column.loc[others].map(lambda x: f"{float(x):.0f}")
+    if missing.any():
+        column = column.mask(missing, '')
+    return column
+
+def _format_text_value(value):
+    """单个非字符串值转为文本，整数值的浮点数不带小数部分"""
+    if isinstance(value, float) and value.is_integer():
+        return f"{value:.0f}"
+    return str(value)
+
+def text_values(column):
+    """
+    将文本字段转换为object类型的字符串，缺失值为None
+    
+    读取时被推断为数字、日期或全为空的文本字段，在普通模式（空字符串和数字混合的object列）
+    和内存优化模式（字符串类型）下得到相同的文本；已经全是字符串的列不逐个转换
+    
+    参数:
+        column: 文本字段的列
+    
+    返回:
+        Series: object类型的字符串列
+    """
+    values = column.astype(object)
+    present = column.notna()
+    if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+        values = values.where(present).map(_format_text_value, na_action='ignore')
+    return values.where(present, None)
+
+def optimize_order_frame(df):
+    """
+    将解析后的订单表转换为占用内存更少的类型
+    
+    低基数字段转为分类类型，其他文本字段不论读取时推断为哪种类型都转为可空字符串类型，
+    空字符串转为缺失值；整数字段向下转换，日期和金额字段保持不变
+    
+    参数:
+        df: 主表或明细表DataFrame
+    
+    返回:
+        DataFrame: 转换后的新DataFrame
+    """
+    columns = {}
+    for col in df.columns:
+        column = df[col]
+        if col in INTEGER_FIELDS:
+            columns[col] = pd.to_numeric(column, downcast='integer')
+        elif col in DATE_FIELDS or col in NUMERIC_FIELDS:
+            columns[col] = column
+        else:
+            # 全为空或像数字的文本字段读取时会被推断为float64等类型，同样转为文本，
+            # 写入的值和内容哈希与普通模式一致
+            if not pd.api.types.is_string_dtype(column):
+                column = text_values(column)
+            column = column.mask(column.eq(''))
+            columns[col] = column.astype('category' if col in CATEGORY_FIELDS else TEXT_DTYPE)
+    return pd.DataFrame(columns, index=df.index)
+
+def concat_frames(frames):
+    """
+    合并多个DataFrame，分类类型的列先统一类别，合并后仍保持分类类型
+    
+    参数:
+        frames: DataFrame列表
+    """
+    category_columns = {col for frame in frames for col in frame.columns
+                        if isinstance(frame[col].dtype, pd.CategoricalDtype)}
+    if category_columns and len(frames) > 1:
+        categories = {
+            col: pd.api.types.union_categoricals(
+                [frame[col] for frame in frames if col in frame.columns], ignore_order=True
+            ).categories
+            for col in category_columns
+        }
+        frames = [
+            frame.assign(**{col: frame[col].cat.set_categories(categories[col])
+                            for col in category_columns if col in frame.columns})
+            for frame in frames
+        ]
+    return pd.concat(frames, ignore_index=True)
+
+def memory_mb(*frames):
+    """计算DataFrame实际占用的内存（MB）"""
+    return sum(frame.memory_usage(deep=True).sum() for frame in frames) / (1024 * 1024)
+
+def order_file_version(file_path):
+    """
+    订单文件的快照版本，越大越新
+    
+    使用文件修改时间，通过导出任务下载的文件会把修改时间设为任务的创建时间（见 ApiClient.download_export_task），
+    因此版本反映导出时间而不是下载完成的时间
+    """
+    return os.path.getmtime(file_path)
+
+def order_file_stats(file_path, master, details):
+    """
+    单个订单文件写入的行数、快照版本和订单号，上传成功后记录到上传清单中
+    
+    返回:
+        dict: master_rows、detail_rows、version 和 order_ids（订单号字符串列表）
+    """
+    order_ids = pd.concat([master['order_id'], details['order_id']]).astype(str).unique()
+    return {"master_rows": len(master), "detail_rows": len(details),
+            "version": order_file_version(file_path), "order_ids": order_ids.tolist()}
+
+def deduplicate_orders(master_frames, detail_frames):
+    """
+    合并多个文件的主表和明细表，同一订单只保留最新文件中的快照
+    
+    主表按 order_id 去重，保留最新文件中的一行；明细表只保留每个订单在该文件中的明细行，
+    旧文件中的明细（包括新快照中已不存在的明细行）全部丢弃。主表中没有的订单按明细表中最新的文件保留
+    
+    参数:
+        master_frames: 主表DataFrame列表，按文件从新到旧排列
+        detail_frames: 明细表DataFrame列表，与 master_frames 一一对应
+    
+    返回:
+        tuple: (合并去重后的主表, 合并去重后的明细表)
+    """
+    master_sources = np.repeat(np.arange(len(master_frames)), [len(frame) for frame in master_frames])
+    detail_sources = np.repeat(np.arange(len(detail_frames)), [len(frame) for frame in detail_frames])
+    master = concat_frames(master_frames)
+    details = concat_frames(detail_frames)
+    
+    # 同一订单第一次出现的位置即最新的文件
+    newest = ~master['order_id'].duplicated(keep='first').to_numpy()
+    winners = pd.Series(master_sources[newest], index=master['order_id'].to_numpy()[newest])
+    
+    detail_winners = details['order_id'].map(winners)
+    missing = detail_winners.isna()
+    if missing.any():
+        fallback = pd.Series(detail_sources).groupby(details['order_id'].to_numpy()).transform('min')
+        detail_winners = detail_winners.where(~missing, fallback)
+    
+    master = master[newest].reset_index(drop=True)
+    details = details[detail_winners.to_numpy() == detail_sources].reset_index(drop=True)
+    return master, details
+
+def parse_order_file(file_path, engine='auto', lean=False):
+    """
+    处理单个订单Excel文件，分离为主表和明细表
+    
+    定义在模块级别，可以在子进程中执行
+    
+    参数:
+        file_path: 订单Excel文件路径
+        engine: Excel读取引擎，见 excel_reader.read_excel
+        lean: 是否使用内存优化的类型，见 optimize_order_frame；为False时缺失的文本为空字符串
+    
+    返回:
+        dict: 处理结果，成功时包含 master_data 和 detail_data
+    """
+    try:
+        logger.info(f"处理文件: {os.path.basename(file_path)}")
+        # 只读取映射中的列，并在读取时明确指定字符串类型的列
+        df = read_excel(file_path, columns=ORDER_COLUMN_MAPPING, dtype=ORDER_STRING_COLUMNS, engine=engine)
+        
+        logger.info(f"原始数据行数: {len(df)}, 列数: {len(df.columns)}")
+        
+        # 重命名列名
+        df = df.rename(columns=ORDER_COLUMN_MAPPING)
+        
+        # 清洗数据
+        # 1. 处理缺失值，内存优化模式下保留缺失值，不把整张表转为object类型
+        if not lean:
+            df = df.fillna('')
+        
+        # 2. 处理日期格式
+        for col in DATE_FIELDS:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+        
+        # 3. 处理数值列
+        for col in NUMERIC_FIELDS:
+            if col in df.columns:
+                # 将空字符串转为0并转换为数值类型
+                df[col] = df[col].replace('', '0')
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+        
+        # 4. 确保SKU字段为字符串类型
+        sku_columns = ['merchant_sku', 'parent_sku', 'child_sku']
+        for col in sku_columns:
+            if col in df.columns:
+                df[col] = repair_sku_column(df[col])
+        
+        # 创建主表和明细表
+        # 主表只保留一个订单一条记录
+        df_master = df.drop_duplicates(subset=['order_id'])
+        # 保留主表需要的字段
+        available_master_fields = [f for f in MASTER_FIELDS if f in df.columns]
+        df_master = df_master[available_master_fields]
+        
+        # 明细表只保留有产品名称的记录
+        df_details = df[df['product_name'].notna() & (df['product_name'] != '')].copy()
+        # 保留明细表需要的字段
+        available_detail_fields = [f for f in DETAIL_FIELDS if f in df.columns]
+        df_details = df_details[available_detail_fields]
+        
+        logger.info(f"处理后主表数据行数: {len(df_master)}, 明细表数据行数: {len(df_details)}")
+        
+        if lean:
+            before = memory_mb(df_master, df_details)
+            del df
+            df_master = optimize_order_frame(df_master)
+            df_details = optimize_order_frame(df_details)
+            after = memory_mb(df_master, df_details)
+            logger.info(f"{os.path.basename(file_path)} 内存占用从 {before:.1f} MB 降到 {after:.1f} MB")
+        
+        return {"success": True, "master_data": df_master, "detail_data": df_details}
+    
+    except Exception as e:
+        logger.error(f"处理文件出错: {str(e)}")
+        return {"success": False, "message": f"处理文件 {os.path.basename(file_path)} 时出错: {str(e)}"}
+
+def parse_service_file(file_path, engine='auto'):
+    """
+    处理单个服务单Excel文件，转换为字段固定、类型明确的服务单表
+    
+    参数:
+        file_path: 服务单Excel文件路径
+        engine: Excel读取引擎，见 excel_reader.read_excel
+    
+    返回:
+        dict: 处理结果，成功时 service_data 包含 SERVICE_FIELDS 中的全部字段，服务单号不为空且不重复
+    """
+    try:
+        logger.info(f"处理文件: {os.path.basename(file_path)}")
+        # 只读取映射中的列，编号类字段按字符串读取，避免被解析为浮点数
+        df = read_excel(file_path, columns=SERVICE_COLUMN_MAPPING, dtype=SERVICE_STRING_COLUMNS, engine=engine)
+        df = df.rename(columns=SERVICE_COLUMN_MAPPING)
+        
+        if 'service_no' not in df.columns:
+            return {"success": False, "message": f"文件 {os.path.basename(file_path)} 缺少服务单号列"}
+        
+        # 固定字段顺序，每个文件都使用相同的列
+        df = df.reindex(columns=SERVICE_FIELDS)
+        
+        for col in SERVICE_DATE_FIELDS:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        for col in SERVICE_INTEGER_FIELDS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int64')
+        for col in SERVICE_NUMERIC_FIELDS:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        
+        typed_columns = set(SERVICE_DATE_FIELDS + SERVICE_INTEGER_FIELDS + SERVICE_NUMERIC_FIELDS)
+        text_columns = [col for col in SERVICE_FIELDS if col not in typed_columns]
+        df[text_columns] = df[text_columns].astype(TEXT_DTYPE)
+        
+        # 跳过没有服务单号的记录，同一服务单号只保留最后一行
+        df = df[df['service_no'].notna() & (df['service_no'] != '')]
+        df = df.drop_duplicates(subset=['service_no'], keep='last').reset_index(drop=True)
+        
+        logger.info(f"处理后服务单数据行数: {len(df)}")
+        return {"success": True, "service_data": df}
+    
+    except Exception as e:
+        logger.error(f"处理文件出错: {str(e)}")
+        return {"success": False, "message": f"处理文件 {os.path.basename(file_path)} 时出错: {str(e)}"}
+
 class DataProcessor:
-    def __init__(self, download_dir='./Downloads'):
+    """
+    解析下载的订单Excel文件
+    
+    参数:
+        download_dir: 下载目录，其下包含 orders 和 service 子目录
+        parse_workers: 并行解析订单文件的进程数，1 表示在当前进程中依次解析
+        excel_engine: Excel读取引擎，'auto' 优先使用已安装的最快引擎
+        parse_cache: 是否缓存订单文件的解析结果，需要安装pyarrow
+        parse_cache_max_mb: 每个订单目录中解析缓存的大小上限（MB）
+        lean_dtypes: 是否使用内存优化的类型保存解析结果，见 optimize_order_frame
+    """
+    def __init__(self, download_dir='./Downloads', parse_workers=1, excel_engine='auto',
+                 parse_cache=True, parse_cache_max_mb=512, lean_dtypes=False):
         self.download_dir = download_dir
+        self.parse_workers = max(1, int(parse_workers))
+        self.excel_engine = excel_engine
+        self.lean_dtypes = lean_dtypes
+        
+        self.parse_cache = None
+        if parse_cache:
+            if ParseCache.available():
+                # 两种类型的解析结果分开缓存
+                version = f"{PARSER_VERSION}-lean" if lean_dtypes else PARSER_VERSION
+                self.parse_cache = ParseCache(version, max_bytes=parse_cache_max_mb * 1024 * 1024)
+            else:
+                logger.info("未安装pyarrow，不使用解析缓存")
         self.orders_dir = os.path.join(download_dir, 'orders')
         self.service_dir = os.path.join(download_dir, 'service')
         
@@ -21,164 +478,288 @@ class DataProcessor:
         if not os.path.exists(self.service_dir):
             os.makedirs(self.service_dir)
 
-    def process_order_excel(self, orders_dir=None):
-        """处理订单目录中的Excel文件，分离为主表和明细表"""
+    @staticmethod
+    def sort_newest_first(file_paths):
+        """按快照版本从新到旧排列订单文件"""
+        return sorted(file_paths, key=order_file_version, reverse=True)
+    
+    def find_order_files(self, orders_dir=None):
+        """查找订单目录中的Excel文件，优先使用 .xls 文件"""
         if orders_dir is None:
             orders_dir = self.orders_dir
-            
-        logger.info(f"开始处理订单Excel文件，路径: {orders_dir}")
-        
-        # 查找Excel文件
         excel_files = glob.glob(os.path.join(orders_dir, '*.xls'))
         if not excel_files:
             excel_files = glob.glob(os.path.join(orders_dir, '*.xlsx'))
+        return excel_files
+    
+    def process_order_excel(self, orders_dir=None, progress_callback=None, cancel_event=None, manifest=None):
+        """
+        处理订单目录中的Excel文件，分离为主表和明细表，可通过回调汇报进度、通过cancel_event取消
+        
+        参数:
+            orders_dir: 订单文件目录
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止处理
+            manifest: IngestionManifest 实例，指定时只处理还没有成功上传过的文件，
+                并跳过已从更新的文件上传过的订单
+        
+        返回:
+            dict: 处理结果，另含 files 为处理的文件列表，file_stats 为每个文件的统计（见 order_file_stats）；
+                没有新文件时 files 为空列表
+        """
+        if orders_dir is None:
+            orders_dir = self.orders_dir
             
+        logger.info(f"开始处理订单Excel文件，路径: {orders_dir}")
+        
+        # 查找Excel文件
+        excel_files = self.find_order_files(orders_dir)
         if not excel_files:
             logger.warning("未找到Excel文件")
             return {"success": False, "message": "未找到Excel文件"}
         
         logger.info(f"找到 {len(excel_files)} 个Excel文件")
         
-        # 定义字段映射关系
-        column_mapping = {
-            # 主表字段
-            '订单编号': 'order_id',
-            '换货单的原始订单编号': 'exchange_original_order_id',
-            '订单状态': 'status',
-            '订单锁定状态': 'lock_status',
-            '供应商编号': 'supplier_id',
-            '供应商商家名称': 'supplier_name',
-            '供应商店铺名称': 'supplier_store_name',
-            '分销商编号': 'distributor_id',
-            '分销商商家名称': 'distributor_name',
-            '分销商店铺名称': 'distributor_store_name',
-            '运费': 'shipping_fee',
-            '收货人姓名': 'receiver_name',
-            '联系方式': 'contact_phone',
-            '收货地址': 'shipping_address',
-            '订单备注': 'order_remark',
-            '订单创建时间': 'created_at',
-            '订单出库时间': 'outbound_at',
-            '订单完成时间': 'completed_at',
-            '订单取消时间': 'canceled_at',
-            '是否京仓': 'is_jd_warehouse',
-            '采购单应付采购款': 'payable_amount',
-            '用户实际支付总额': 'user_payment_total',
-            '指定承运商': 'carrier',
-            '物流运单号': 'tracking_number',
-            
-            # 明细表字段
-            '产品名称': 'product_name',
-            '产品颜色': 'product_color',
-            '产品尺码': 'product_size',
-            '商家SKU': 'merchant_sku',
-            '父SKU': 'parent_sku',
-            '子SKU': 'child_sku',
-            '产品采购价': 'purchase_price',
-            '采购数量': 'purchase_quantity'
+        if manifest is not None:
+            excel_files = manifest.pending_files(excel_files)
+            if not excel_files:
+                logger.info("所有订单文件都已上传过，没有新文件需要处理")
+                return {"success": True, "files": [], "file_stats": {}, "message": "没有新的订单文件需要上传"}
+        
+        # 从新到旧处理，同一订单保留最新文件中的快照
+        excel_files = self.sort_newest_first(excel_files)
+        progress = ProgressReporter("解析订单文件", len(excel_files), progress_callback, cancel_event, unit='个文件')
+        results = {}
+        for result in self._iter_order_results(excel_files, progress):
+            if not result.get('success'):
+                return result
+            results[result['file_path']] = result
+        # 按从新到旧的顺序合并
+        results = [results[file_path] for file_path in excel_files]
+        if manifest is not None:
+            for result in results:
+                self._drop_superseded_orders(result, manifest=manifest)
+        
+        combined = self.combine_order_frames(
+            [result['master_data'] for result in results],
+            [result['detail_data'] for result in results]
+        )
+        combined['files'] = excel_files
+        combined['file_stats'] = {
+            file_path: order_file_stats(file_path, result['master_data'], result['detail_data'])
+            for file_path, result in zip(excel_files, results)
         }
+        return combined
+    
+    def iter_order_batches(self, orders_dir=None, progress_callback=None, cancel_event=None, manifest=None):
+        """
+        逐个文件解析订单目录中的Excel文件，每解析完一个文件就产出该文件的结果，不合并所有文件
         
-        # 定义主表和明细表字段
-        master_fields = [
-            'order_id', 'exchange_original_order_id', 'status', 'lock_status',
-            'supplier_id', 'supplier_name', 'supplier_store_name',
-            'distributor_id', 'distributor_name', 'distributor_store_name',
-            'shipping_fee', 'receiver_name', 'contact_phone', 'shipping_address',
-            'order_remark', 'created_at', 'outbound_at', 'completed_at', 'canceled_at',
-            'is_jd_warehouse', 'payable_amount', 'user_payment_total',
-            'carrier', 'tracking_number'
-        ]
+        同时在解析中的文件不超过解析进程数，调用方停止读取时不再开始解析新的文件，
+        内存占用只取决于同时处理的文件数，与文件总数无关。文件从新到旧处理，
+        已在较新文件中出现过的订单不再产出，每个订单只上传最新的快照
         
-        # 定义明细表字段
-        detail_fields = [
-            'order_id', 'supplier_id', 'product_name', 'product_color', 'product_size',
-            'merchant_sku', 'parent_sku', 'child_sku', 'purchase_price',
-            'purchase_quantity'
-        ]
+        参数:
+            orders_dir: 订单文件目录
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止处理
+            manifest: IngestionManifest 实例，指定时只处理还没有成功上传过的文件，
+                并跳过已从更新的文件上传过的订单（例如上次上传中断后重新处理剩余的较旧文件）
         
-        all_processed_data_master = []
-        all_processed_data_details = []
+        产出:
+            dict: 单个文件的处理结果，格式与 process_order_excel 相同，files 只包含该文件；
+                失败或取消时产出包含错误信息的dict后结束，没有新文件时不产出任何结果
+        """
+        if orders_dir is None:
+            orders_dir = self.orders_dir
         
+        excel_files = self.find_order_files(orders_dir)
+        if not excel_files:
+            logger.warning("未找到Excel文件")
+            yield {"success": False, "message": "未找到Excel文件"}
+            return
+        
+        if manifest is not None:
+            excel_files = manifest.pending_files(excel_files)
+        excel_files = self.sort_newest_first(excel_files)
+        logger.info(f"开始逐个文件解析并上传 {orders_dir} 中的 {len(excel_files)} 个订单文件")
+        
+        progress = ProgressReporter("解析订单文件", len(excel_files), progress_callback, cancel_event, unit='个文件')
+        seen_orders = set()
+        for result in self._iter_order_results(excel_files, progress):
+            if result.get('success'):
+                file_path = result['file_path']
+                self._drop_superseded_orders(result, seen_orders, manifest)
+                stats = order_file_stats(file_path, result['master_data'], result['detail_data'])
+                seen_orders.update(stats['order_ids'])
+                result['files'] = [file_path]
+                result['file_stats'] = {file_path: stats}
+            yield result
+    
+    @staticmethod
+    def _drop_superseded_orders(result, seen_orders=None, manifest=None):
+        """
+        从单个文件的解析结果中去掉已有更新快照的订单
+        
+        参数:
+            result: 单个文件的解析结果，包含 file_path、master_data 和 detail_data
+            seen_orders: 本次已从较新的文件产出的订单号字符串集合
+            manifest: IngestionManifest 实例，指定时同时去掉之前已从较新的文件上传过的订单
+        """
+        if not seen_orders and manifest is None:
+            return
+        version = order_file_version(result['file_path'])
+        
+        def keep(frame):
+            order_ids = frame['order_id'].astype(str)
+            superseded = order_ids.isin(seen_orders or ())
+            if manifest is not None:
+                superseded |= manifest.uploaded_newer(order_ids, version)
+            return frame[~superseded]
+        
+        master, details = keep(result['master_data']), keep(result['detail_data'])
+        skipped = len(result['master_data']) - len(master)
+        if skipped:
+            logger.info(f"{os.path.basename(result['file_path'])} 中有 {skipped} 个订单已从较新的文件上传，跳过")
+        result['master_data'], result['detail_data'] = master, details
+    
+    def _iter_order_results(self, excel_files, progress):
+        """
+        解析订单文件，按文件顺序产出每个文件的解析结果，结果中的 file_path 为对应的文件
+        
+        失败或取消时产出包含错误信息的dict后结束
+        """
+        workers = min(self.parse_workers, len(excel_files))
+        if workers > 1:
+            return self._iter_order_results_parallel(excel_files, workers, progress)
+        return self._iter_order_results_sequential(excel_files, progress)
+    
+    def _iter_order_results_sequential(self, excel_files, progress):
+        """在当前进程中依次解析订单文件"""
         for file_path in excel_files:
             try:
-                logger.info(f"处理文件: {os.path.basename(file_path)}")
-                # 读取Excel文件时明确指定字符串类型的列
-                df = pd.read_excel(
-                    file_path, 
-                    dtype={
-                        '父SKU': str,
-                        '子SKU': str,
-                        '商家SKU': str,
-                        '订单编号': str,
-                        '物流运单号': str,
-                        '供应商编号': str,
-                        '分销商编号': str
-                    }
-                )
-                
-                logger.info(f"原始数据行数: {len(df)}, 列数: {len(df.columns)}")
-                
-                # 重命名列名
-                df = df.rename(columns=column_mapping)
-                
-                # 清洗数据
-                # 1. 处理缺失值
-                df = df.fillna('')
-                
-                # 2. 处理日期格式
-                date_columns = ['created_at', 'outbound_at', 'completed_at', 'canceled_at']
-                for col in date_columns:
-                    if col in df.columns:
-                        df[col] = pd.to_datetime(df[col], errors='coerce')
-                
-                # 3. 处理数值列
-                numeric_columns = ['shipping_fee', 'purchase_price', 'purchase_quantity', 
-                                   'payable_amount', 'user_payment_total']
-                
-                for col in numeric_columns:
-                    if col in df.columns:
-                        # 将空字符串转为0并转换为数值类型
-                        df[col] = df[col].replace('', '0')
-                        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-                
-                # 4. 确保SKU字段为字符串类型
-                sku_columns = ['merchant_sku', 'parent_sku', 'child_sku']
-                for col in sku_columns:
-                    if col in df.columns:
-                        # 处理科学计数法问题：强制转换为字符串并修复科学计数法显示
-                        df[col] = df[col].astype(str).apply(
-                            lambda x: f"{float(x):.0f}" if x.strip() and x.lower() != 'nan' and 'e' in x.lower() else x
-                        )
-                        df[col] = df[col].replace('nan', '')
-                
-                # 创建主表和明细表
-                # 主表只保留一个订单一条记录
-                df_master = df.drop_duplicates(subset=['order_id'])
-                # 保留主表需要的字段
-                available_master_fields = [f for f in master_fields if f in df.columns]
-                df_master = df_master[available_master_fields]
-                
-                # 明细表只保留有产品名称的记录
-                df_details = df[df['product_name'] != ''].copy()
-                # 保留明细表需要的字段
-                available_detail_fields = [f for f in detail_fields if f in df.columns]
-                df_details = df_details[available_detail_fields]
-                
-                logger.info(f"处理后主表数据行数: {len(df_master)}, 明细表数据行数: {len(df_details)}")
-                
-                all_processed_data_master.append(df_master)
-                all_processed_data_details.append(df_details)
+                progress.check_cancelled()
+            except OperationCancelled as e:
+                logger.warning(str(e))
+                yield {"success": False, "cancelled": True, "message": str(e)}
+                return
             
-            except Exception as e:
-                logger.error(f"处理文件出错: {str(e)}")
-                return {"success": False, "message": f"处理文件 {os.path.basename(file_path)} 时出错: {str(e)}"}
+            result = self.process_order_file(file_path)
+            if not result.get('success'):
+                yield result
+                return
+            
+            result['file_path'] = file_path
+            progress.advance()
+            yield result
+    
+    def process_order_file(self, file_path):
+        """
+        处理单个订单Excel文件，分离为主表和明细表
+        
+        返回:
+            dict: 处理结果，成功时包含 master_data 和 detail_data
+        """
+        cached, key = self._load_cached(file_path)
+        if cached is not None:
+            return cached
+        
+        result = parse_order_file(file_path, self.excel_engine, self.lean_dtypes)
+        self._store_cached(file_path, result, key)
+        return result
+    
+    def _load_cached(self, file_path):
+        """
+        读取文件的解析缓存
         
+        返回:
+            tuple: (缓存的解析结果或None, 缓存键)
+        """
+        if self.parse_cache is None:
+            return None, None
+        try:
+            key = self.parse_cache.key(file_path)
+        except OSError as e:
+            logger.warning(f"计算 {os.path.basename(file_path)} 的哈希失败: {str(e)}")
+            return None, None
+        return self.parse_cache.load(file_path, key), key
+    
+    def _store_cached(self, file_path, result, key):
+        """保存解析成功的结果到缓存"""
+        if self.parse_cache is not None and key is not None and result.get('success'):
+            self.parse_cache.store(file_path, result, key)
+    
+    def _iter_order_results_parallel(self, excel_files, workers, progress):
+        """
+        在进程池中同时解析多个订单文件，按文件顺序产出结果
+        
+        已有解析缓存的文件直接读取缓存；已提交和等待产出的文件不超过 workers 个，
+        上一个结果被取走后才提交新的文件
+        
+        参数:
+            excel_files: 订单文件路径列表
+            workers: 进程数
+            progress: ProgressReporter 实例
+        """
+        logger.info(f"使用 {workers} 个进程并行解析 {len(excel_files)} 个订单文件")
+        
+        remaining = deque(excel_files)
+        window = deque()  # (文件路径, 缓存键, 解析结果或future)
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            while remaining or window:
+                # 补充提交文件，直到达到进程数
+                while remaining and len(window) < workers:
+                    file_path = remaining.popleft()
+                    cached, key = self._load_cached(file_path)
+                    if cached is None:
+                        cached = executor.submit(parse_order_file, file_path, self.excel_engine, self.lean_dtypes)
+                    window.append((file_path, key, cached))
+                
+                progress.check_cancelled()
+                file_path, key, result = window.popleft()
+                if not isinstance(result, dict):
+                    result = result.result()
+                    if not result.get('success'):
+                        logger.error(result.get('message'))
+                        yield result
+                        return
+                    
+                    self._store_cached(file_path, result, key)
+                    logger.info(f"已解析 {os.path.basename(file_path)}: "
+                                f"主表 {len(result['master_data'])} 行，明细表 {len(result['detail_data'])} 行")
+                result['file_path'] = file_path
+                progress.advance()
+                yield result
+        except OperationCancelled as e:
+            logger.warning(str(e))
+            yield {"success": False, "cancelled": True, "message": str(e)}
+        except Exception as e:
+            logger.error(f"并行解析订单文件出错: {str(e)}")
+            yield {"success": False, "message": f"并行解析订单文件时出错: {str(e)}"}
+        finally:
+            # 失败、取消或调用方提前停止读取时不再等待尚未开始的文件
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def combine_order_frames(self, master_frames, detail_frames):
+        """
+        合并多个文件处理后的主表和明细表，同一订单只保留最新文件中的快照，并校验主表与明细表的订单是否一致
+        
+        参数:
+            master_frames: 主表DataFrame列表，按文件从新到旧排列
+            detail_frames: 明细表DataFrame列表，与 master_frames 一一对应
+        """
         # 合并所有处理后的数据
-        if all_processed_data_master and all_processed_data_details:
-            combined_master = pd.concat(all_processed_data_master, ignore_index=True)
-            combined_details = pd.concat(all_processed_data_details, ignore_index=True)
+        if master_frames and detail_frames:
+            combined_master, combined_details = deduplicate_orders(master_frames, detail_frames)
+            
+            master_removed = sum(len(frame) for frame in master_frames) - len(combined_master)
+            detail_removed = sum(len(frame) for frame in detail_frames) - len(combined_details)
+            if master_removed or detail_removed:
+                logger.info(f"多个文件中重复的订单只保留最新快照，去掉主表 {master_removed} 行，明细表 {detail_removed} 行")
             
-            logger.info(f"合并后主表总数据行数: {len(combined_master)}, 明细表总数据行数: {len(combined_details)}")
+            logger.info(f"合并后主表总数据行数: {len(combined_master)}, 明细表总数据行数: {len(combined_details)}，"
+                        f"占用内存 {memory_mb(combined_master, combined_details):.1f} MB")
             
             # 验证数据
             master_order_count = combined_master['order_id'].nunique()
@@ -201,6 +782,77 @@ class DataProcessor:
             logger.warning("没有数据被处理")
             return {"success": False, "message": "没有数据被处理"}
             
+    def process_service_excel(self, service_dir=None, progress_callback=None, cancel_event=None, manifest=None):
+        """
+        处理服务单目录中的Excel文件，合并为一张字段固定的服务单表
+        
+        文件从新到旧处理，同一服务单号只保留最新文件中的记录；缺少服务单号列的文件会被跳过
+        
+        参数:
+            service_dir: 服务单文件目录
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止处理
+            manifest: IngestionManifest 实例，指定时只处理还没有成功上传过的文件
+        
+        返回:
+            dict: 处理结果，service_data 为合并后的服务单表，files 为处理的文件列表，
+                file_stats 为每个文件的行数；没有新文件时 files 为空列表
+        """
+        if service_dir is None:
+            service_dir = self.service_dir
+        
+        logger.info(f"开始处理服务单Excel文件，路径: {service_dir}")
+        service_files = [os.path.join(service_dir, name) for name in sorted(os.listdir(service_dir))
+                         if name.endswith(('.xls', '.xlsx'))]
+        if not service_files:
+            logger.warning("没有找到服务单文件")
+            return {"success": False, "message": "没有找到可上传的服务单文件"}
+        
+        if manifest is not None:
+            service_files = manifest.pending_files(service_files)
+            if not service_files:
+                logger.info("所有服务单文件都已上传过，没有新文件需要处理")
+                return {"success": True, "files": [], "file_stats": {}, "message": "没有新的服务单文件需要上传"}
+        
+        service_files = self.sort_newest_first(service_files)
+        progress = ProgressReporter("解析服务单文件", len(service_files), progress_callback, cancel_event, unit='个文件')
+        frames = []
+        files = []
+        file_stats = {}
+        for file_path in service_files:
+            try:
+                progress.check_cancelled()
+            except OperationCancelled as e:
+                logger.warning(str(e))
+                return {"success": False, "cancelled": True, "message": str(e)}
+            
+            result = parse_service_file(file_path, self.excel_engine)
+            progress.advance()
+            if not result.get('success'):
+                logger.error(f"{result.get('message')}，跳过")
+                continue
+            
+            frames.append(result['service_data'])
+            files.append(file_path)
+            file_stats[file_path] = {"rows": len(result['service_data'])}
+        
+        if not frames:
+            return {"success": False, "message": "没有可上传的服务单数据"}
+        
+        combined = concat_frames(frames)
+        rows = len(combined)
+        combined = combined.drop_duplicates(subset=['service_no'], keep='first').reset_index(drop=True)
+        if rows > len(combined):
+            logger.info(f"多个文件中重复的服务单只保留最新记录，去掉 {rows - len(combined)} 行")
+        
+        return {
+            "success": True,
+            "service_data": combined,
+            "files": files,
+            "file_stats": file_stats,
+            "message": f"处理成功，生成服务单 {len(combined)} 行"
+        }
+    
     def process_excel_files(self):
         """处理下载的Excel文件，分离为主表和明细表 (保持向后兼容)"""
         logger.info("方法已弃用，请使用 process_order_excel() 方法")
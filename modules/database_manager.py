@@ -1,38 +1,218 @@
 import pyodbc
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine
 import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from modules.progress import ProgressReporter, OperationCancelled
+from modules.data_processor import NUMERIC_FIELDS, SERVICE_INTEGER_FIELDS, SERVICE_NUMERIC_FIELDS, text_values
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('DatabaseManager')
 
+# 保存每行内容哈希的列，内容未变化的记录上传时跳过
+HASH_COLUMN = 'row_hash'
+
+# 存放内容哈希列的业务表
+HASHED_TABLES = ('jx_orders_master', 'jx_orders_detail', 'jx_service_orders')
+
+# 按数值计算内容哈希的字段，其他非日期字段都按文本计算
+NUMERIC_HASH_FIELDS = frozenset(NUMERIC_FIELDS) | frozenset(SERVICE_INTEGER_FIELDS) | frozenset(SERVICE_NUMERIC_FIELDS)
+
+# 流式上传时表示解析已结束的队列标记
+_END_OF_BATCHES = object()
+
+# 表示连接已断开或无法建立的SQLSTATE
+DISCONNECT_SQLSTATES = ('08S01', '08S02', '08001', '08003', '08004', '08007')
+
+class ConnectionPool:
+    """pyodbc连接池：限制最大连接数，取出时检查连接可用性，回收空闲超时的连接"""
+    def __init__(self, connection_string, max_size=4, idle_timeout=300, health_check_interval=30,
+                 connect_retries=3, retry_delay=1.0):
+        self.connection_string = connection_string
+        self.max_size = max(1, int(max_size))
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.connect_retries = connect_retries
+        self.retry_delay = retry_delay
+        
+        self._idle = []  # [(连接, 最后归还时间)]
+        self._in_use = 0
+        self._closed = False
+        self._condition = threading.Condition()
+    
+    @staticmethod
+    def is_disconnect_error(error):
+        """判断异常是否表示连接已失效"""
+        if isinstance(error, (pyodbc.OperationalError, pyodbc.InterfaceError)):
+            return True
+        return bool(getattr(error, 'args', None)) and error.args[0] in DISCONNECT_SQLSTATES
+    
+    def acquire(self, timeout=None, force_check=False):
+        """从连接池取出一个可用连接，连接数已满时等待其他连接归还"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        conn, last_used = None, None
+        
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("连接池已关闭")
+                self._evict_idle_locked()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    self._in_use += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"等待数据库连接超时，连接池已满 ({self.max_size})")
+                self._condition.wait(remaining)
+        
+        try:
+            # 空闲较久的连接在交出前先确认仍然可用
+            if conn is not None and (force_check or time.monotonic() - last_used > self.health_check_interval):
+                if not self._is_alive(conn):
+                    logger.info("连接池中的连接已失效，重新建立连接")
+                    self._close_quietly(conn)
+                    conn = None
+            if conn is None:
+                conn = self._connect()
+            return conn
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+    
+    def release(self, conn, discard=False):
+        """归还连接，未提交的事务会被回滚；已失效的连接直接关闭"""
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        
+        with self._condition:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+    
+    def close_all(self):
+        """关闭连接池中的所有空闲连接，使用中的连接在归还时关闭"""
+        with self._condition:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._idle = []
+            self._condition.notify_all()
+    
+    def _connect(self):
+        """建立新连接，遇到瞬时网络故障时按退避间隔重试"""
+        for attempt in range(1, self.connect_retries + 1):
+            try:
+                return pyodbc.connect(self.connection_string)
+            except pyodbc.Error as e:
+                if attempt >= self.connect_retries or not self.is_disconnect_error(e):
+                    raise
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                logger.warning(f"建立数据库连接失败，{delay:.1f} 秒后重试 ({attempt}/{self.connect_retries}): {str(e)}")
+                time.sleep(delay)
+    
+    def _evict_idle_locked(self):
+        """关闭空闲超时的连接，调用方需持有锁"""
+        now = time.monotonic()
+        alive = []
+        for conn, last_used in self._idle:
+            if now - last_used > self.idle_timeout:
+                self._close_quietly(conn)
+            else:
+                alive.append((conn, last_used))
+        self._idle = alive
+    
+    @staticmethod
+    def _is_alive(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
 class DatabaseManager:
-    def __init__(self, server, database, username, password, batch_size=100, timeout=30):
+    def __init__(self, server, database, username, password, batch_size=100, timeout=30, upsert_mode='merge',
+                 chunk_size=5000, pool_size=4, pool_idle_timeout=300, skip_unchanged=True):
         self.server = server
         self.database = database
         self.username = username
         self.password = password
         self.batch_size = int(batch_size)
         self.timeout = int(timeout)
+        # merge: 每批数据先写入临时暂存表，再用一条MERGE语句合并；row: 逐行查询后更新或插入
+        self.upsert_mode = upsert_mode
+        # fast_executemany 每次提交的行数，也是MERGE每批暂存的行数
+        self.chunk_size = int(chunk_size)
+        # 按内容哈希跳过与数据库中完全相同的记录
+        self.skip_unchanged = skip_unchanged
         
         self.connection_string = f'DRIVER={{SQL Server}};SERVER={server};DATABASE={database};UID={username};PWD={password};Connection Timeout={timeout}'
         self.conn_str_sqlalchemy = f'mssql+pyodbc://{username}:{password}@{server}/{database}?driver=SQL+Server&timeout={timeout}'
         
+        # 所有上传、建表和诊断操作共用同一个连接池，登录握手只在首次取连接时发生
+        self.pool = ConnectionPool(self.connection_string, max_size=pool_size, idle_timeout=int(pool_idle_timeout))
+        
     def get_connection(self):
-        """获取数据库连接"""
+        """从连接池获取数据库连接，使用完毕后需调用 release_connection 归还"""
         try:
-            conn = pyodbc.connect(self.connection_string)
-            return conn
+            return self.pool.acquire(timeout=self.timeout)
         except Exception as e:
             logger.error(f"获取数据库连接失败: {str(e)}")
             raise
+    
+    def release_connection(self, conn, discard=False):
+        """将连接归还到连接池"""
+        self.pool.release(conn, discard)
+    
+    @contextmanager
+    def connection(self):
+        """以上下文管理器的方式借用连接池中的连接，连接失效时不再放回连接池"""
+        conn = self.get_connection()
+        discard = False
+        try:
+            yield conn
+        except Exception as e:
+            discard = ConnectionPool.is_disconnect_error(e)
+            raise
+        finally:
+            self.release_connection(conn, discard)
+    
+    def close(self):
+        """关闭连接池中的所有连接"""
+        self.pool.close_all()
         
     def test_connection(self):
         """测试数据库连接"""
         try:
-            conn = pyodbc.connect(self.connection_string)
-            conn.close()
+            conn = self.pool.acquire(timeout=self.timeout, force_check=True)
+            self.pool.release(conn)
             logger.info("数据库连接测试成功")
             return {"success": True, "message": "数据库连接成功"}
         except Exception as e:
@@ -40,122 +220,363 @@ class DatabaseManager:
             return {"success": False, "message": f"数据库连接失败: {str(e)}"}
             
     def create_tables_if_not_exist(self):
-        """创建主表和明细表（如果不存在）"""
+        """创建主表、明细表和服务单表（如果不存在）"""
         try:
-            conn = pyodbc.connect(self.connection_string)
-            cursor = conn.cursor()
-            
-            # 创建订单主表
-            cursor.execute("""
-                IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='jx_orders_master' AND xtype='U')
-                CREATE TABLE jx_orders_master (
-                    order_id NVARCHAR(50) PRIMARY KEY,
-                    exchange_original_order_id NVARCHAR(50),
-                    status NVARCHAR(50),
-                    lock_status NVARCHAR(50),
-                    supplier_id NVARCHAR(50),
-                    supplier_name NVARCHAR(100),
-                    supplier_store_name NVARCHAR(100),
-                    distributor_id NVARCHAR(50),
-                    distributor_name NVARCHAR(100),
-                    distributor_store_name NVARCHAR(100),
-                    shipping_fee DECIMAL(10, 2),
-                    receiver_name NVARCHAR(50),
-                    contact_phone NVARCHAR(50),
-                    shipping_address NVARCHAR(255),
-                    order_remark NVARCHAR(255),
-                    created_at DATETIME,
-                    outbound_at DATETIME,
-                    completed_at DATETIME,
-                    canceled_at DATETIME,
-                    is_jd_warehouse NVARCHAR(10),
-                    payable_amount DECIMAL(10, 2),
-                    user_payment_total DECIMAL(10, 2),
-                    carrier NVARCHAR(100),
-                    tracking_number NVARCHAR(100),
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 创建订单明细表
-            cursor.execute("""
-                IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='jx_orders_detail' AND xtype='U')
-                CREATE TABLE jx_orders_detail (
-                    order_id NVARCHAR(50) NOT NULL,
-                    supplier_id NVARCHAR(50),
-                    product_name NVARCHAR(255),
-                    product_color NVARCHAR(50),
-                    product_size NVARCHAR(50),
-                    merchant_sku NVARCHAR(50),
-                    parent_sku NVARCHAR(50),
-                    child_sku NVARCHAR(50),
-                    purchase_price DECIMAL(10, 2),
-                    purchase_quantity INT,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    CONSTRAINT FK_OrderDetail_OrderMaster FOREIGN KEY (order_id) 
-                    REFERENCES jx_orders_master(order_id)
-                )
-            """)
-            
-            # 删除不再需要的触发器
-            cursor.execute("""
-                IF EXISTS (SELECT * FROM sys.triggers WHERE name = 'trg_GenerateFormattedID')
-                    DROP TRIGGER trg_GenerateFormattedID;
-            """)
-            
-            conn.commit()
-            conn.close()
-            logger.info("主表和明细表创建成功或已存在")
-            return {"success": True, "message": "主表和明细表已创建或已存在"}
+            with self.connection() as conn:
+                self._create_tables(conn)
+            logger.info("主表、明细表和服务单表创建成功或已存在")
+            return {"success": True, "message": "主表、明细表和服务单表已创建或已存在"}
             
         except Exception as e:
             logger.error(f"创建表失败: {str(e)}")
             return {"success": False, "message": f"创建表失败: {str(e)}"}
     
-    def upload_master_data(self, df):
+    def _create_tables(self, conn):
+        """在指定连接上执行建表语句"""
+        cursor = conn.cursor()
+        
+        # 创建订单主表
+        cursor.execute("""
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='jx_orders_master' AND xtype='U')
+            CREATE TABLE jx_orders_master (
+                order_id NVARCHAR(50) PRIMARY KEY,
+                exchange_original_order_id NVARCHAR(50),
+                status NVARCHAR(50),
+                lock_status NVARCHAR(50),
+                supplier_id NVARCHAR(50),
+                supplier_name NVARCHAR(100),
+                supplier_store_name NVARCHAR(100),
+                distributor_id NVARCHAR(50),
+                distributor_name NVARCHAR(100),
+                distributor_store_name NVARCHAR(100),
+                shipping_fee DECIMAL(10, 2),
+                receiver_name NVARCHAR(50),
+                contact_phone NVARCHAR(50),
+                shipping_address NVARCHAR(255),
+                order_remark NVARCHAR(255),
+                created_at DATETIME,
+                outbound_at DATETIME,
+                completed_at DATETIME,
+                canceled_at DATETIME,
+                is_jd_warehouse NVARCHAR(10),
+                payable_amount DECIMAL(10, 2),
+                user_payment_total DECIMAL(10, 2),
+                carrier NVARCHAR(100),
+                tracking_number NVARCHAR(100),
+                row_hash BIGINT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # 创建订单明细表
+        cursor.execute("""
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='jx_orders_detail' AND xtype='U')
+            CREATE TABLE jx_orders_detail (
+                order_id NVARCHAR(50) NOT NULL,
+                supplier_id NVARCHAR(50),
+                product_name NVARCHAR(255),
+                product_color NVARCHAR(50),
+                product_size NVARCHAR(50),
+                merchant_sku NVARCHAR(50),
+                parent_sku NVARCHAR(50),
+                child_sku NVARCHAR(50),
+                purchase_price DECIMAL(10, 2),
+                purchase_quantity INT,
+                row_hash BIGINT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT FK_OrderDetail_OrderMaster FOREIGN KEY (order_id) 
+                REFERENCES jx_orders_master(order_id)
+            )
+        """)
+        
+        # 创建服务单表
+        cursor.execute("""
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='jx_service_orders' AND xtype='U')
+            CREATE TABLE jx_service_orders (
+                service_no NVARCHAR(50) PRIMARY KEY,
+                purchase_order_no NVARCHAR(50),
+                customer_expectation NVARCHAR(255),
+                service_status NVARCHAR(50),
+                supplier_id NVARCHAR(50),
+                supplier_store_name NVARCHAR(100),
+                distributor_id NVARCHAR(50),
+                distributor_store_name NVARCHAR(100),
+                product_name NVARCHAR(255),
+                product_quantity INT,
+                purchase_amount DECIMAL(10, 2),
+                customer_name NVARCHAR(50),
+                contact_phone NVARCHAR(50),
+                shipping_address NVARCHAR(255),
+                customer_feedback NVARCHAR(255),
+                created_at DATETIME,
+                return_method NVARCHAR(50),
+                service_reason NVARCHAR(255),
+                return_tracking_no NVARCHAR(50),
+                order_id NVARCHAR(50),
+                sales_store_front NVARCHAR(100),
+                order_type NVARCHAR(50),
+                row_hash BIGINT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # 为之前创建的表补充内容哈希列
+        for table_name in HASHED_TABLES:
+            cursor.execute(f"IF COL_LENGTH('{table_name}', '{HASH_COLUMN}') IS NULL "
+                           f"ALTER TABLE {table_name} ADD {HASH_COLUMN} BIGINT")
+        
+        # 删除不再需要的触发器
+        cursor.execute("""
+            IF EXISTS (SELECT * FROM sys.triggers WHERE name = 'trg_GenerateFormattedID')
+                DROP TRIGGER trg_GenerateFormattedID;
+        """)
+        
+        conn.commit()
+    
+    def get_schema_summary(self, table_names=('jx_orders_master', 'jx_orders_detail', 'jx_service_orders')):
+        """查询各业务表的列结构和记录数，表不存在时列结构为空"""
+        try:
+            summary = {}
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                for table_name in table_names:
+                    cursor.execute(
+                        "SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH FROM INFORMATION_SCHEMA.COLUMNS "
+                        "WHERE TABLE_NAME = ? ORDER BY ORDINAL_POSITION", table_name
+                    )
+                    columns = [(row.COLUMN_NAME, row.DATA_TYPE, row.CHARACTER_MAXIMUM_LENGTH) for row in cursor.fetchall()]
+                    count = 0
+                    if columns:
+                        cursor.execute(f"SELECT COUNT(*) AS count FROM {table_name}")
+                        count = cursor.fetchone().count
+                    summary[table_name] = {"columns": columns, "count": count}
+            logger.info("已查询数据库表结构")
+            return {"success": True, "data": summary}
+        except Exception as e:
+            logger.error(f"获取表结构失败: {str(e)}")
+            return {"success": False, "message": f"获取表结构失败: {str(e)}"}
+    
+    def upload_master_data(self, df, progress=None):
         """上传主表数据到SQL Server"""
-        return self._upload_data(df, 'jx_orders_master', 'order_id')
+        return self._upload_data(df, 'jx_orders_master', 'order_id', progress)
     
-    def upload_detail_data(self, df):
+    def upload_detail_data(self, df, progress=None):
         """上传明细表数据到SQL Server"""
-        return self._upload_data(df, 'jx_orders_detail', None)
+        return self._upload_data(df, 'jx_orders_detail', None, progress)
     
-    def upload_data(self, data_result):
-        """上传主表和明细表数据到SQL Server数据库"""
+    def upload_service_data(self, df, progress_callback=None, cancel_event=None):
+        """
+        上传服务单数据：先删除相同服务单号的旧记录，再用固定的列集合整批写入
+        
+        参数:
+            df: DataProcessor.process_service_excel 生成的服务单表，每个服务单号只有一行
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止上传
+        """
         try:
-            # 确保表存在
             create_result = self.create_tables_if_not_exist()
             if not create_result['success']:
                 return create_result
             
-            # 检查数据是否包含主表和明细表
-            if 'master_data' not in data_result or 'detail_data' not in data_result:
-                return {"success": False, "message": "数据格式不正确，缺少主表或明细表数据"}
+            if df.empty:
+                logger.warning("没有数据需要上传到 jx_service_orders 表")
+                return {"success": True, "message": "没有服务单数据需要上传", "count": 0}
             
-            # 上传主表数据
-            master_result = self.upload_master_data(data_result['master_data'])
-            if not master_result['success']:
-                return master_result
+            progress = ProgressReporter("上传服务单", len(df), progress_callback, cancel_event)
+            unchanged_count = 0
+            df = df.assign(**{HASH_COLUMN: self.content_hash(df)})
+            with self.connection() as conn:
+                if self.skip_unchanged:
+                    df, _, unchanged_count = self._drop_unchanged_rows(conn, df, 'jx_service_orders', 'service_no')
+                    progress.advance(unchanged_count)
+                
+                counts = self.replace_by_keys(conn, 'jx_service_orders', 'service_no', df, progress, return_keys=True)
+                logger.info(f"已删除 {counts['deleted']} 条旧服务单记录")
             
-            # 上传明细表数据
-            detail_result = self.upload_detail_data(data_result['detail_data'])
-            if not detail_result['success']:
-                return detail_result
+            # 删除了旧记录并重新插入的服务单计为更新
+            updated_count = len(counts['deleted_keys'])
+            inserted_count = counts['inserted'] - updated_count
+            message = (f"服务单上传完成，共上传 {counts['inserted']} 条记录"
+                       f"（新增 {inserted_count} 条，更新 {updated_count} 条，未变化 {unchanged_count} 条）")
+            if counts['errors']:
+                message += f"，{counts['errors']} 条失败"
+            logger.info(message)
+            return {"success": True, "message": message, "count": counts['inserted'], "inserted": inserted_count,
+                    "updated": updated_count, "unchanged": unchanged_count, "errors": counts['errors']}
+        
+        except OperationCancelled as e:
+            logger.warning(str(e))
+            return {"success": False, "cancelled": True, "message": str(e)}
+        except Exception as e:
+            logger.error(f"服务单上传失败: {str(e)}")
+            return {"success": False, "message": f"服务单上传失败: {str(e)}"}
+    
+    def upload_data(self, data_result, progress_callback=None, cancel_event=None):
+        """上传主表和明细表数据到SQL Server数据库，可通过回调汇报进度、通过cancel_event取消"""
+        try:
+            # 确保表存在
+            create_result = self.create_tables_if_not_exist()
+            if not create_result['success']:
+                return create_result
             
-            # 返回成功结果
-            return {
-                "success": True, 
-                "message": f"数据上传成功，主表：{master_result['count']}条记录，明细表：{detail_result['count']}条记录",
-                "master_count": master_result['count'],
-                "detail_count": detail_result['count']
-            }
+            return self._upload_batch(data_result, progress_callback, cancel_event)
             
         except Exception as e:
             logger.error(f"数据上传失败: {str(e)}")
             return {"success": False, "message": f"数据上传失败: {str(e)}"}
     
-    def _upload_data(self, df, table_name, key_column=None):
+    def _upload_batch(self, data_result, progress_callback=None, cancel_event=None, label=''):
+        """上传一组主表和明细表数据，调用方需确保表已存在"""
+        # 检查数据是否包含主表和明细表
+        if 'master_data' not in data_result or 'detail_data' not in data_result:
+            return {"success": False, "message": "数据格式不正确，缺少主表或明细表数据"}
+        
+        # 上传主表数据
+        master_data = data_result['master_data']
+        master_progress = ProgressReporter(f"上传主表{label}", len(master_data), progress_callback, cancel_event)
+        master_result = self.upload_master_data(master_data, master_progress)
+        if not master_result['success']:
+            return master_result
+        
+        # 上传明细表数据
+        detail_data = data_result['detail_data']
+        detail_progress = ProgressReporter(f"上传明细表{label}", len(detail_data), progress_callback, cancel_event)
+        detail_result = self.upload_detail_data(detail_data, detail_progress)
+        if not detail_result['success']:
+            return detail_result
+        
+        # 返回成功结果
+        return {
+            "success": True, 
+            "message": (f"数据上传成功，主表：{master_result['count']}条记录"
+                        f"（新增 {master_result.get('inserted', 0)} 条，更新 {master_result.get('updated', 0)} 条，"
+                        f"未变化 {master_result.get('unchanged', 0)} 条），"
+                        f"明细表：{detail_result['count']}条记录（未变化 {detail_result.get('unchanged', 0)} 条）"),
+            "master_count": master_result['count'],
+            "master_inserted": master_result.get('inserted', 0),
+            "master_updated": master_result.get('updated', 0),
+            "master_unchanged": master_result.get('unchanged', 0),
+            "detail_count": detail_result['count'],
+            "detail_unchanged": detail_result.get('unchanged', 0)
+        }
+    
+    def upload_stream(self, batches, progress_callback=None, cancel_event=None, on_batch=None, queue_size=2):
+        """
+        边解析边上传：后台线程依次读取 batches 中的解析结果放入有界队列，当前线程逐批上传
+        
+        队列满时解析暂停，内存中最多保留 queue_size 批等待上传的数据和正在上传的一批，
+        数据库写入与下一批的解析同时进行
+        
+        参数:
+            batches: 产出解析结果的可迭代对象，例如 DataProcessor.iter_order_batches，
+                每批结果包含 master_data 和 detail_data；产出失败结果时停止上传
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止上传
+            on_batch: 每批上传后调用的函数，参数为 (该批解析结果, 该批上传结果)
+            queue_size: 等待上传的批次数上限
+        
+        返回:
+            dict: 与 upload_data 相同格式的汇总结果，另含 batches 为成功上传的批次数
+        """
+        create_result = self.create_tables_if_not_exist()
+        if not create_result['success']:
+            return create_result
+        
+        batch_queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce_batches, args=(batches, batch_queue, stop),
+                                    name='UploadStreamProducer', daemon=True)
+        producer.start()
+        
+        totals = {"master_count": 0, "master_inserted": 0, "master_updated": 0, "master_unchanged": 0,
+                  "detail_count": 0, "detail_unchanged": 0}
+        uploaded = 0
+        waited = 0.0
+        started = time.monotonic()
+        try:
+            while True:
+                wait_started = time.monotonic()
+                batch = batch_queue.get()
+                waited += time.monotonic() - wait_started
+                if batch is _END_OF_BATCHES:
+                    break
+                if not batch.get('success'):
+                    return self._stream_failure(batch, uploaded)
+                
+                files = batch.get('files') or []
+                label = f" {os.path.basename(files[0])}" if len(files) == 1 else ''
+                try:
+                    result = self._upload_batch(batch, progress_callback, cancel_event, label)
+                except Exception as e:
+                    logger.error(f"数据上传失败: {str(e)}")
+                    result = {"success": False, "message": f"数据上传失败: {str(e)}"}
+                if on_batch is not None:
+                    on_batch(batch, result)
+                if not result.get('success'):
+                    return self._stream_failure(result, uploaded)
+                
+                uploaded += 1
+                for key in totals:
+                    totals[key] += result.get(key, 0)
+        finally:
+            # 提前结束时通知后台线程停止解析，并等待其释放解析资源
+            stop.set()
+            producer.join()
+        
+        elapsed = time.monotonic() - started
+        logger.info(f"流式上传完成，共 {uploaded} 批，耗时 {elapsed:.1f} 秒，其中等待解析 {waited:.1f} 秒")
+        if not uploaded:
+            return {"success": True, "message": "没有新的订单文件需要上传", "batches": 0, **totals}
+        return {
+            "success": True,
+            "message": (f"数据上传成功（{uploaded} 个文件），主表：{totals['master_count']}条记录"
+                        f"（新增 {totals['master_inserted']} 条，更新 {totals['master_updated']} 条，"
+                        f"未变化 {totals['master_unchanged']} 条），"
+                        f"明细表：{totals['detail_count']}条记录（未变化 {totals['detail_unchanged']} 条）"),
+            "batches": uploaded,
+            **totals
+        }
+    
+    @staticmethod
+    def _stream_failure(result, uploaded):
+        """流式上传中断时的结果，说明中断前已上传的批次数"""
+        message = result.get('message', '未知错误')
+        if uploaded:
+            message = f"{message}（此前已上传 {uploaded} 个文件）"
+        return {**{k: v for k, v in result.items() if k not in ('master_data', 'detail_data')},
+                "success": False, "message": message, "batches": uploaded}
+    
+    @staticmethod
+    def _produce_batches(batches, batch_queue, stop):
+        """在后台线程中读取解析结果放入队列，stop 被设置后停止读取"""
+        def put(item):
+            # 队列满时等待上传线程取走，上传已结束时放弃
+            while not stop.is_set():
+                try:
+                    batch_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        try:
+            for batch in batches:
+                if not put(batch) or not batch.get('success'):
+                    return
+        except Exception as e:
+            logger.error(f"读取解析结果出错: {str(e)}")
+            put({"success": False, "message": f"解析订单文件时出错: {str(e)}"})
+        finally:
+            # 关闭生成器，释放解析进程池等资源
+            close = getattr(batches, 'close', None)
+            if close is not None:
+                close()
+            put(_END_OF_BATCHES)
+    
+    def _upload_data(self, df, table_name, key_column=None, progress=None):
         """上传数据到SQL Server数据库的通用方法"""
+        conn = None
+        discard = False
         try:
             logger.info(f"开始上传数据到 {table_name} 表，共 {len(df)} 条记录")
             
@@ -170,8 +591,8 @@ class DatabaseManager:
                     # 将空字符串的日期设为None
                     df[col] = pd.to_datetime(df[col], errors='coerce')
             
-            # 建立数据库连接
-            conn = pyodbc.connect(self.connection_string)
+            # 从连接池获取数据库连接
+            conn = self.get_connection()
             
             # 获取表的所有列
             cursor = conn.cursor()
@@ -179,130 +600,66 @@ class DatabaseManager:
             table_columns = [row.COLUMN_NAME for row in cursor.fetchall()]
             
             # 过滤出匹配的列
-            df_filtered = df[[col for col in df.columns if col in table_columns]]
+            df_filtered = self._fill_text_na(df[[col for col in df.columns if col in table_columns]])
             
             if df_filtered.empty:
                 logger.error(f"没有匹配的列，无法上传数据到 {table_name} 表")
                 return {"success": False, "message": f"没有匹配的列，无法上传数据到 {table_name} 表", "count": 0}
             
             records_count = 0
+            inserted_count = 0
+            updated_count = 0
             error_count = 0
             skip_count = 0
+            unchanged_count = 0
+            
+            # 始终写入内容哈希，关闭跳过未变化记录时保存的哈希也与数据库内容一致
+            if HASH_COLUMN in table_columns:
+                df_filtered = df_filtered.assign(**{HASH_COLUMN: self.content_hash(df_filtered)})
+            
+            # 按内容哈希去掉与数据库中完全相同的记录
+            if self.skip_unchanged and HASH_COLUMN in table_columns:
+                if key_column and key_column in df_filtered.columns:
+                    df_filtered, _, unchanged_count = self._drop_unchanged_rows(conn, df_filtered, table_name, key_column)
+                elif table_name == 'jx_orders_detail' and 'order_id' in df_filtered.columns:
+                    df_filtered, unchanged_count = self._drop_unchanged_groups(conn, df_filtered, table_name, 'order_id')
+                if unchanged_count:
+                    logger.info(f"{table_name} 表中有 {unchanged_count} 条记录内容未变化，跳过")
+                if progress is not None:
+                    progress.advance(unchanged_count)
             
             # 对于主表（有主键的表），使用UPSERT逻辑
-            if key_column and key_column in df_filtered.columns:
-                for i in range(0, len(df_filtered), self.batch_size):
-                    batch = df_filtered.iloc[i:i+self.batch_size]
-                    batch_count = 0
-                    
-                    for _, row in batch.iterrows():
-                        try:
-                            # 先检查记录是否存在
-                            key_value = row[key_column]
-                            cursor.execute(f"SELECT 1 FROM {table_name} WHERE {key_column} = ?", key_value)
-                            exists = cursor.fetchone() is not None
-                            
-                            if exists:
-                                # 更新现有记录
-                                non_key_columns = [col for col in row.index if col != key_column]
-                                
-                                if not non_key_columns:  # 如果没有非主键列，跳过更新
-                                    skip_count += 1
-                                    continue
-                                    
-                                update_pairs = ', '.join([f"{col} = ?" for col in non_key_columns])
-                                sql = f"UPDATE {table_name} SET {update_pairs} WHERE {key_column} = ?"
-                                
-                                values = [val if pd.notna(val) else None for col, val in row.items() if col != key_column]
-                                values.append(key_value)
-                                cursor.execute(sql, values)
-                            else:
-                                # 插入新记录
-                                columns = ', '.join(row.index)
-                                placeholders = ', '.join(['?' for _ in range(len(row))])
-                                sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-                                
-                                values = [val if pd.notna(val) else None for val in row.values]
-                                cursor.execute(sql, values)
-                            
-                            batch_count += 1
-                            records_count += 1
-                        except pyodbc.IntegrityError as e:
-                            if "PRIMARY KEY" in str(e) or "UNIQUE KEY" in str(e):
-                                logger.warning(f"存在主键冲突，尝试更新: {row[key_column]}")
-                                try:
-                                    # 尝试更新而不是插入
-                                    non_key_columns = [col for col in row.index if col != key_column]
-                                    if non_key_columns:
-                                        update_pairs = ', '.join([f"{col} = ?" for col in non_key_columns])
-                                        sql = f"UPDATE {table_name} SET {update_pairs} WHERE {key_column} = ?"
-                                        
-                                        values = [val if pd.notna(val) else None for col, val in row.items() if col != key_column]
-                                        values.append(key_value)
-                                        cursor.execute(sql, values)
-                                        batch_count += 1
-                                        records_count += 1
-                                    else:
-                                        skip_count += 1
-                                except Exception as inner_e:
-                                    logger.error(f"更新冲突记录时出错: {str(inner_e)}")
-                                    error_count += 1
-                            else:
-                                logger.error(f"处理记录时出错: {str(e)}")
-                                error_count += 1
-                        except Exception as e:
-                            logger.error(f"处理记录时出错: {str(e)}")
-                            error_count += 1
-                    
-                    conn.commit()
-                    logger.info(f"已处理 {batch_count} 条主表记录 (批次 {i//self.batch_size + 1})")
+            if df_filtered.empty:
+                logger.info(f"{table_name} 表没有需要写入的记录")
+            elif key_column and key_column in df_filtered.columns:
+                if self.upsert_mode == 'merge':
+                    counts = self._merge_upsert(conn, df_filtered, table_name, key_column, progress)
+                else:
+                    counts = self._upsert_rows(conn, df_filtered, table_name, key_column, progress)
+                inserted_count = counts['inserted']
+                updated_count = counts['updated']
+                records_count = inserted_count + updated_count
+                skip_count = counts['skipped']
+                error_count = counts['errors']
             else:
-                # 对于明细表，批量删除需要更新的订单明细记录
-                try:
-                    # 如果是明细表，直接收集所有订单ID
-                    if table_name == 'jx_orders_detail' and 'order_id' in df_filtered.columns:
-                        # 获取所有涉及的订单ID
-                        order_ids = df_filtered['order_id'].unique().tolist()
-                        if order_ids:
-                            # 构建参数占位符
-                            placeholders = ','.join(['?' for _ in order_ids])
-                            # 直接执行一条SQL语句删除所有相关明细
-                            sql = f"DELETE FROM {table_name} WHERE order_id IN ({placeholders})"
-                            cursor.execute(sql, order_ids)
-                            rows_affected = cursor.rowcount
-                            conn.commit()
-                            logger.info(f"已删除 {rows_affected} 条明细记录，涉及 {len(order_ids)} 个订单")
-                        else:
-                            logger.info("没有需要更新的订单明细记录")
-                except Exception as e:
-                    logger.warning(f"批量删除明细记录时出错: {str(e)}")
-                
-                # 直接插入新数据
-                for i in range(0, len(df_filtered), self.batch_size):
-                    batch = df_filtered.iloc[i:i+self.batch_size]
-                    batch_count = 0
-                    
-                    for _, row in batch.iterrows():
-                        try:
-                            # 准备SQL
-                            columns = ', '.join(row.index)
-                            placeholders = ', '.join(['?' for _ in range(len(row))])
-                            sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-                            
-                            # 执行SQL
-                            values = [val if pd.notna(val) else None for val in row.values]
-                            cursor.execute(sql, values)
-                            batch_count += 1
-                            records_count += 1
-                        except Exception as e:
-                            logger.error(f"插入记录时出错: {str(e)}")
-                            error_count += 1
-                    
+                # 对于明细表，在同一个事务中删除需要更新的订单的全部明细记录并插入新数据
+                if table_name == 'jx_orders_detail' and 'order_id' in df_filtered.columns:
+                    insert_result = self.replace_by_keys(conn, table_name, 'order_id', df_filtered, progress)
+                    logger.info(f"已删除 {insert_result['deleted']} 条明细记录，"
+                                f"涉及 {df_filtered['order_id'].nunique()} 个订单")
+                else:
+                    # 直接插入新数据
+                    insert_result = self.bulk_insert(conn, table_name, df_filtered, progress)
                     conn.commit()
-                    logger.info(f"已处理 {batch_count} 条明细记录 (批次 {i//self.batch_size + 1})")
+                records_count = insert_result['inserted']
+                inserted_count = insert_result['inserted']
+                error_count = insert_result['errors']
             
-            conn.close()
             message = f"数据上传完成，共成功处理 {records_count} 条数据"
+            if key_column:
+                message += f"（新增 {inserted_count} 条，更新 {updated_count} 条）"
+            if unchanged_count > 0:
+                message += f"，{unchanged_count} 条数据未变化"
             if skip_count > 0:
                 message += f"，跳过 {skip_count} 条数据"
             if error_count > 0:
@@ -313,8 +670,421 @@ class DatabaseManager:
             if error_count > 0 and records_count == 0:
                 return {"success": False, "message": f"数据上传失败，所有 {error_count} 条记录处理出错", "count": 0}
             else:
-                return {"success": True, "message": message, "count": records_count}
+                return {
+                    "success": True,
+                    "message": message,
+                    "count": records_count,
+                    "inserted": inserted_count,
+                    "updated": updated_count,
+                    "unchanged": unchanged_count
+                }
         
+        except OperationCancelled as e:
+            logger.warning(str(e))
+            return {"success": False, "cancelled": True, "message": str(e), "count": 0}
         except Exception as e:
+            discard = ConnectionPool.is_disconnect_error(e)
             logger.error(f"数据库上传失败: {str(e)}")
-            return {"success": False, "message": f"数据库上传失败: {str(e)}", "count": 0} 
\ No newline at end of file
+            return {"success": False, "message": f"数据库上传失败: {str(e)}", "count": 0}
+        finally:
+            if conn is not None:
+                self.release_connection(conn, discard)
+
+    def _create_key_table(self, cursor, table_name, key_column, key_values, purpose):
+        """
+        将键写入带聚集索引的临时表，用于与目标表连接
+        
+        返回:
+            str: 临时表名
+        """
+        key_table = f"#{purpose}_keys_{table_name}"
+        insert_sql = f"INSERT INTO {key_table} ({key_column}) VALUES (?)"
+        rows = [(value,) for value in key_values.tolist()]
+        
+        # 键表列类型直接复制目标表，避免连接时发生隐式转换
+        cursor.execute(f"IF OBJECT_ID('tempdb..{key_table}') IS NOT NULL DROP TABLE {key_table}")
+        cursor.execute(f"SELECT TOP 0 {key_column} INTO {key_table} FROM {table_name}")
+        cursor.fast_executemany = True
+        for i in range(0, len(rows), self.chunk_size):
+            cursor.executemany(insert_sql, rows[i:i+self.chunk_size])
+        cursor.fast_executemany = False
+        cursor.execute(f"CREATE CLUSTERED INDEX IX_{purpose}_keys ON {key_table} ({key_column})")
+        return key_table
+    
+    def delete_by_keys(self, conn, table_name, key_column, keys, return_keys=False):
+        """
+        将待删除的键写入临时表，通过连接一次性删除目标表中的对应记录
+        
+        在调用方的事务中执行，不提交，由调用方提交或回滚
+        
+        参数:
+            return_keys: 是否同时返回实际删除了记录的键
+        
+        返回:
+            tuple: (删除的行数, 删除了记录的键集合；return_keys 为False时为None)
+        """
+        key_values = pd.Series(keys, dtype=object).dropna().drop_duplicates()
+        if key_values.empty:
+            logger.info(f"没有需要删除的 {table_name} 记录")
+            return 0, set() if return_keys else None
+        
+        cursor = conn.cursor()
+        try:
+            key_table = self._create_key_table(cursor, table_name, key_column, key_values, 'delete')
+            output = f"OUTPUT DELETED.{key_column}" if return_keys else ""
+            cursor.execute(f"""
+                DELETE target {output} FROM {table_name} AS target
+                INNER JOIN {key_table} AS delete_keys ON target.{key_column} = delete_keys.{key_column}
+            """)
+            if return_keys:
+                deleted_keys = [row[0] for row in cursor.fetchall()]
+                rows_deleted = len(deleted_keys)
+                deleted_keys = set(deleted_keys)
+            else:
+                rows_deleted = cursor.rowcount
+                deleted_keys = None
+            cursor.execute(f"DROP TABLE {key_table}")
+        finally:
+            cursor.fast_executemany = False
+        
+        return rows_deleted, deleted_keys
+    
+    def replace_by_keys(self, conn, table_name, key_column, df, progress=None, return_keys=False):
+        """
+        在一个事务中删除 df 中各键的旧记录并插入 df，最后统一提交
+        
+        中途取消、出错或有记录插入失败时整个事务回滚，不会出现旧记录已删除、新记录没有插入的情况
+        
+        参数:
+            return_keys: 是否在结果中返回实际删除了记录的键，见 delete_by_keys
+        
+        返回:
+            dict: bulk_insert 的结果，另含 deleted（删除的行数）和 deleted_keys
+        """
+        try:
+            rows_deleted, deleted_keys = self.delete_by_keys(conn, table_name, key_column, df[key_column],
+                                                             return_keys)
+            counts = self.bulk_insert(conn, table_name, df, progress)
+            if counts['errors']:
+                raise RuntimeError(f"{counts['errors']} 条 {table_name} 记录插入失败，已回滚本次删除和插入")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        counts.update(deleted=rows_deleted, deleted_keys=deleted_keys)
+        return counts
+    
+    def fetch_hashes(self, conn, table_name, key_column, keys):
+        """
+        一次性查询指定键在目标表中已保存的内容哈希
+        
+        返回:
+            DataFrame: key_column 和 row_hash 两列，每条已有记录一行；旧记录的哈希为空
+        """
+        key_values = pd.Series(keys, dtype=object).dropna().drop_duplicates()
+        if key_values.empty:
+            return pd.DataFrame({key_column: pd.Series(dtype=object), HASH_COLUMN: pd.Series(dtype='Int64')})
+        
+        cursor = conn.cursor()
+        try:
+            key_table = self._create_key_table(cursor, table_name, key_column, key_values, 'hash')
+            cursor.execute(f"""
+                SELECT target.{key_column}, target.{HASH_COLUMN} FROM {table_name} AS target
+                INNER JOIN {key_table} AS hash_keys ON target.{key_column} = hash_keys.{key_column}
+            """)
+            rows = cursor.fetchall()
+            cursor.execute(f"DROP TABLE {key_table}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.fast_executemany = False
+        
+        return pd.DataFrame({
+            key_column: pd.Series([row[0] for row in rows], dtype=object),
+            HASH_COLUMN: pd.array([row[1] for row in rows], dtype='Int64')
+        })
+    
+    @staticmethod
+    def content_hash(df):
+        """
+        按列名顺序计算每行内容的64位哈希，保存为BIGINT
+        
+        同一个值无论使用哪种类型保存（例如分类类型和字符串、Int64和float64）都得到相同的哈希，
+        内存优化模式和普通模式的解析结果可以直接比较。金额和数量字段按数值计算，
+        其他字段按文本计算（见 data_processor.text_values），读取时被推断为数字的文本字段也是如此
+        """
+        canonical = {}
+        for col in sorted(col for col in df.columns if col != HASH_COLUMN):
+            column = df[col]
+            if pd.api.types.is_datetime64_any_dtype(column):
+                canonical[col] = column.astype('datetime64[ns]')
+            elif col in NUMERIC_HASH_FIELDS and pd.api.types.is_numeric_dtype(column):
+                canonical[col] = column.to_numpy(dtype='float64', na_value=np.nan)
+            else:
+                canonical[col] = text_values(column)
+        hashes = pd.util.hash_pandas_object(pd.DataFrame(canonical, index=df.index), index=False)
+        return pd.Series(hashes.to_numpy().view('int64'), index=df.index)
+    
+    def _drop_unchanged_rows(self, conn, df, table_name, key_column):
+        """
+        去掉内容哈希与数据库中已保存的哈希相同的记录，df 需已包含内容哈希列
+        
+        返回:
+            tuple: (需要写入的记录, 其中数据库中已存在的记录数, 内容未变化的记录数)
+        """
+        existing = self.fetch_hashes(conn, table_name, key_column, df[key_column])
+        stored = pd.Series(existing[HASH_COLUMN].array, index=existing[key_column].to_numpy())
+        keys = df[key_column].astype(object)
+        
+        unchanged = keys.map(stored).eq(df[HASH_COLUMN]).fillna(False).to_numpy(dtype=bool)
+        exists = keys.isin(stored.index).to_numpy()
+        return df[~unchanged], int((exists & ~unchanged).sum()), int(unchanged.sum())
+    
+    def _drop_unchanged_groups(self, conn, df, table_name, group_column):
+        """
+        按 group_column 分组，去掉所有行都与数据库中相同的分组，df 需已包含内容哈希列
+        
+        用于先删除再插入的明细表：一个订单的明细行与数据库中完全一致（行数和内容都相同）时，
+        整个订单都不需要重写
+        
+        返回:
+            tuple: (需要写入的记录, 内容未变化的记录数)
+        """
+        groups = df[group_column].astype(object)
+        existing = self.fetch_hashes(conn, table_name, group_column, groups)
+        
+        # 比较每个分组中各哈希出现的次数，次数不同的分组即有变化；数据库中有空哈希的分组视为有变化
+        new_counts = pd.DataFrame({group_column: groups, HASH_COLUMN: df[HASH_COLUMN]}).groupby(
+            [group_column, HASH_COLUMN]).size()
+        stored = existing.dropna(subset=[HASH_COLUMN]).astype({HASH_COLUMN: 'int64'})
+        old_counts = stored.groupby([group_column, HASH_COLUMN]).size()
+        diff = new_counts.sub(old_counts, fill_value=0)
+        changed = set(diff[diff != 0].index.get_level_values(0))
+        changed.update(existing.loc[existing[HASH_COLUMN].isna(), group_column])
+        
+        keep = groups.isin(changed).to_numpy()
+        return df[keep], int((~keep).sum())
+    
+    def bulk_insert(self, conn, table_name, df, progress=None):
+        """
+        使用fast_executemany按块批量插入数据，仅对失败的块回退为逐行插入
+        
+        在调用方的事务中执行，不提交，由调用方提交；失败的块通过保存点回滚后逐行插入，不影响事务中之前的操作
+        
+        返回:
+            dict: inserted 和 errors 为成功和失败的行数
+        """
+        counts = {"inserted": 0, "errors": 0}
+        if df.empty:
+            return counts
+        
+        # 整张表只准备一条参数化语句，DataFrame一次性转换为参数元组
+        columns = list(df.columns)
+        sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(['?' for _ in columns])})"
+        rows = self._frame_to_rows(df)
+        
+        cursor = conn.cursor()
+        try:
+            # 保存点需要在事务中创建，调用方还没有执行任何语句时先开始事务
+            cursor.execute("IF @@TRANCOUNT = 0 BEGIN TRANSACTION")
+            for i in range(0, len(rows), self.chunk_size):
+                if progress is not None:
+                    progress.check_cancelled()
+                chunk = rows[i:i+self.chunk_size]
+                chunk_no = i // self.chunk_size + 1
+                cursor.fast_executemany = False
+                cursor.execute("SAVE TRANSACTION bulk_chunk")
+                try:
+                    cursor.fast_executemany = True
+                    cursor.executemany(sql, chunk)
+                    counts['inserted'] += len(chunk)
+                    logger.info(f"已批量插入 {len(chunk)} 条 {table_name} 记录 (块 {chunk_no})")
+                except Exception as e:
+                    cursor.fast_executemany = False
+                    cursor.execute("ROLLBACK TRANSACTION bulk_chunk")
+                    logger.warning(f"块 {chunk_no} 批量插入失败，改为逐行插入: {str(e)}")
+                    for row in chunk:
+                        try:
+                            cursor.execute(sql, row)
+                            counts['inserted'] += 1
+                        except Exception as row_e:
+                            logger.error(f"插入记录时出错: {str(row_e)}")
+                            counts['errors'] += 1
+                if progress is not None:
+                    progress.advance(len(chunk))
+        finally:
+            cursor.fast_executemany = False
+        
+        return counts
+    
+    @staticmethod
+    def _fill_text_na(df):
+        """将字符串和分类类型列中的缺失值转为空字符串，与未做内存优化的解析结果写入相同的值"""
+        text_columns = [col for col in df.columns
+                        if isinstance(df[col].dtype, (pd.StringDtype, pd.CategoricalDtype))]
+        if not text_columns:
+            return df
+        return df.assign(**{col: df[col].astype(object).fillna('') for col in text_columns})
+    
+    @staticmethod
+    def _frame_to_rows(df):
+        """将DataFrame一次性转换为参数元组列表，空值转为None"""
+        return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+    
+    def _upsert_rows(self, conn, df, table_name, key_column, progress=None):
+        """逐行查询主键后更新或插入数据"""
+        counts = {"inserted": 0, "updated": 0, "skipped": 0, "errors": 0}
+        cursor = conn.cursor()
+        
+        for i in range(0, len(df), self.batch_size):
+            if progress is not None:
+                progress.check_cancelled()
+            batch = df.iloc[i:i+self.batch_size]
+            batch_count = 0
+            
+            for _, row in batch.iterrows():
+                try:
+                    # 先检查记录是否存在
+                    key_value = row[key_column]
+                    cursor.execute(f"SELECT 1 FROM {table_name} WHERE {key_column} = ?", key_value)
+                    exists = cursor.fetchone() is not None
+                    
+                    if exists:
+                        # 更新现有记录
+                        non_key_columns = [col for col in row.index if col != key_column]
+                        
+                        if not non_key_columns:  # 如果没有非主键列，跳过更新
+                            counts['skipped'] += 1
+                            continue
+                            
+                        update_pairs = ', '.join([f"{col} = ?" for col in non_key_columns])
+                        sql = f"UPDATE {table_name} SET {update_pairs} WHERE {key_column} = ?"
+                        
+                        values = [val if pd.notna(val) else None for col, val in row.items() if col != key_column]
+                        values.append(key_value)
+                        cursor.execute(sql, values)
+                        counts['updated'] += 1
+                    else:
+                        # 插入新记录
+                        columns = ', '.join(row.index)
+                        placeholders = ', '.join(['?' for _ in range(len(row))])
+                        sql = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+                        
+                        values = [val if pd.notna(val) else None for val in row.values]
+                        cursor.execute(sql, values)
+                        counts['inserted'] += 1
+                    
+                    batch_count += 1
+                except pyodbc.IntegrityError as e:
+                    if "PRIMARY KEY" in str(e) or "UNIQUE KEY" in str(e):
+                        logger.warning(f"存在主键冲突，尝试更新: {row[key_column]}")
+                        try:
+                            # 尝试更新而不是插入
+                            non_key_columns = [col for col in row.index if col != key_column]
+                            if non_key_columns:
+                                update_pairs = ', '.join([f"{col} = ?" for col in non_key_columns])
+                                sql = f"UPDATE {table_name} SET {update_pairs} WHERE {key_column} = ?"
+                                
+                                values = [val if pd.notna(val) else None for col, val in row.items() if col != key_column]
+                                values.append(key_value)
+                                cursor.execute(sql, values)
+                                batch_count += 1
+                                counts['updated'] += 1
+                            else:
+                                counts['skipped'] += 1
+                        except Exception as inner_e:
+                            logger.error(f"更新冲突记录时出错: {str(inner_e)}")
+                            counts['errors'] += 1
+                    else:
+                        logger.error(f"处理记录时出错: {str(e)}")
+                        counts['errors'] += 1
+                except Exception as e:
+                    logger.error(f"处理记录时出错: {str(e)}")
+                    counts['errors'] += 1
+            
+            conn.commit()
+            logger.info(f"已处理 {batch_count} 条主表记录 (批次 {i//self.batch_size + 1})")
+            if progress is not None:
+                progress.advance(len(batch))
+        
+        return counts
+    
+    def _merge_upsert(self, conn, df, table_name, key_column, progress=None):
+        """通过临时暂存表和MERGE语句按批次更新插入数据，每批 chunk_size 行"""
+        counts = {"inserted": 0, "updated": 0, "skipped": 0, "errors": 0}
+        
+        # 主键为空的记录无法合并，同一批次内主键重复会导致MERGE失败，只保留最后一条
+        valid_df = df[df[key_column].notna()]
+        counts['skipped'] += len(df) - len(valid_df)
+        deduped_df = valid_df.drop_duplicates(subset=[key_column], keep='last')
+        if len(deduped_df) < len(valid_df):
+            logger.warning(f"{table_name} 表数据中有 {len(valid_df) - len(deduped_df)} 条重复的 {key_column}，仅保留最后一条")
+            counts['skipped'] += len(valid_df) - len(deduped_df)
+        
+        columns = list(deduped_df.columns)
+        non_key_columns = [col for col in columns if col != key_column]
+        column_list = ', '.join(columns)
+        stage_table = f"#stage_{table_name}"
+        
+        insert_sql = f"INSERT INTO {stage_table} ({column_list}) VALUES ({', '.join(['?' for _ in columns])})"
+        matched_clause = ''
+        if non_key_columns:
+            update_pairs = ', '.join([f"target.{col} = source.{col}" for col in non_key_columns])
+            matched_clause = f"WHEN MATCHED THEN UPDATE SET {update_pairs}"
+        merge_sql = f"""
+            SET NOCOUNT ON;
+            DECLARE @merge_actions TABLE (merge_action NVARCHAR(10));
+            MERGE {table_name} AS target
+            USING {stage_table} AS source
+            ON target.{key_column} = source.{key_column}
+            {matched_clause}
+            WHEN NOT MATCHED BY TARGET THEN
+                INSERT ({column_list}) VALUES ({', '.join([f"source.{col}" for col in columns])})
+            OUTPUT $action INTO @merge_actions;
+            SELECT
+                SUM(CASE WHEN merge_action = 'INSERT' THEN 1 ELSE 0 END) AS inserted,
+                SUM(CASE WHEN merge_action = 'UPDATE' THEN 1 ELSE 0 END) AS updated
+            FROM @merge_actions;
+        """
+        
+        cursor = conn.cursor()
+        # 暂存表结构直接复制目标表的列定义，保证类型一致
+        cursor.execute(f"IF OBJECT_ID('tempdb..{stage_table}') IS NOT NULL DROP TABLE {stage_table}")
+        cursor.execute(f"SELECT TOP 0 {column_list} INTO {stage_table} FROM {table_name}")
+        conn.commit()
+        
+        try:
+            for i in range(0, len(deduped_df), self.chunk_size):
+                if progress is not None:
+                    progress.check_cancelled()
+                batch = deduped_df.iloc[i:i+self.chunk_size]
+                batch_no = i // self.chunk_size + 1
+                try:
+                    cursor.execute(f"TRUNCATE TABLE {stage_table}")
+                    cursor.fast_executemany = True
+                    cursor.executemany(insert_sql, self._frame_to_rows(batch))
+                    cursor.execute(merge_sql)
+                    row = cursor.fetchone()
+                    conn.commit()
+                    
+                    inserted = (row.inserted or 0) if row else 0
+                    updated = (row.updated or 0) if row else 0
+                    counts['inserted'] += inserted
+                    counts['updated'] += updated
+                    logger.info(f"已合并 {len(batch)} 条主表记录，新增 {inserted} 条，更新 {updated} 条 (批次 {batch_no})")
+                    if progress is not None:
+                        progress.advance(len(batch))
+                except Exception as e:
+                    conn.rollback()
+                    logger.warning(f"批次 {batch_no} 合并失败，改为逐行处理: {str(e)}")
+                    row_counts = self._upsert_rows(conn, batch, table_name, key_column, progress)
+                    for key in counts:
+                        counts[key] += row_counts[key]
+        finally:
+            cursor.fast_executemany = False
+            cursor.execute(f"IF OBJECT_ID('tempdb..{stage_table}') IS NOT NULL DROP TABLE {stage_table}")
+            conn.commit()
+        
+        return counts
@@ -0,0 +1,69 @@
+import importlib.util
+import logging
+import pandas as pd
+
+logger = logging.getLogger('ExcelReader')
+
+# 按优先顺序尝试的读取引擎，None 表示 pandas 根据文件扩展名选择的默认引擎（xlrd / openpyxl）
+ENGINE_PREFERENCE = ['calamine', None]
+
+# 运行中确认不可用的引擎，之后不再尝试
+_unavailable_engines = set()
+
+def engine_installed(engine):
+    """判断读取引擎依赖的库是否已安装"""
+    if engine is None:
+        return True
+    if engine == 'calamine':
+        return importlib.util.find_spec('python_calamine') is not None
+    return importlib.util.find_spec(engine) is not None
+
+def candidate_engines(engine='auto'):
+    """
+    获取要依次尝试的读取引擎
+
+    参数:
+        engine: 'auto' 按 ENGINE_PREFERENCE 选择第一个可用的引擎，'default' 使用pandas默认引擎，
+            其他值为 pandas.read_excel 的 engine 参数，不可用时回退到默认引擎
+    """
+    if engine == 'auto':
+        engines = [e for e in ENGINE_PREFERENCE if engine_installed(e)]
+    elif engine in (None, 'default'):
+        engines = [None]
+    else:
+        engines = [engine, None]
+    return [e for e in engines if e not in _unavailable_engines]
+
+def read_excel(file_path, columns=None, dtype=None, engine='auto'):
+    """
+    读取Excel文件，只读取需要的列
+
+    参数:
+        file_path: Excel文件路径
+        columns: 需要读取的列名，为None时读取所有列；文件中不存在的列会被忽略
+        dtype: {列名: 类型}，在读取时直接按指定类型解析
+        engine: 读取引擎，见 candidate_engines
+
+    返回:
+        DataFrame: 读取的数据
+    """
+    kwargs = {}
+    if columns is not None:
+        wanted = set(columns)
+        kwargs['usecols'] = lambda column: column in wanted
+    if dtype:
+        kwargs['dtype'] = dtype
+
+    engines = candidate_engines(engine)
+    for index, current in enumerate(engines):
+        try:
+            return pd.read_excel(file_path, engine=current, **kwargs)
+        except (ImportError, ValueError) as e:
+            # 引擎未安装、pandas版本不支持或无法识别文件格式时，改用下一个引擎
+            if current is None or index == len(engines) - 1:
+                raise
+            if isinstance(e, ImportError) or 'engine' in str(e).lower():
+                _unavailable_engines.add(current)
+            logger.warning(f"使用 {current} 引擎读取 {file_path} 失败，改用默认引擎: {str(e)}")
+
+    return pd.read_excel(file_path, **kwargs)
@@ -0,0 +1,144 @@
+import time
+import random
+import logging
+from modules.progress import OperationCancelled
+
+logger = logging.getLogger('ExportPoller')
+
+class ExportPoller:
+    """
+    提交导出请求后自动轮询导出结果，任务完成后立即下载
+    
+    提交前先记录已有的导出任务，之后只认提交后新出现且已生成文件的任务，
+    避免下载到仍在导出中或属于其他请求的文件
+    
+    参数:
+        api_client: ApiClient 实例
+        initial_delay: 第一次查询前的等待秒数
+        max_delay: 两次查询之间的最长等待秒数
+        timeout: 等待导出完成的最长秒数
+    """
+    def __init__(self, api_client, initial_delay=2, max_delay=30, timeout=900):
+        self.api_client = api_client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+    
+    def run_order_export(self, start_time, end_time, orders_dir=None, progress_callback=None, cancel_event=None):
+        """
+        提交订单导出并在完成后下载
+        
+        参数:
+            start_time: 开始时间，格式 YYYY-MM-DD HH:MM:SS
+            end_time: 结束时间，格式 YYYY-MM-DD HH:MM:SS
+            orders_dir: 订单文件保存目录
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止等待
+        
+        返回:
+            dict: 下载结果，成功时包含 file_path
+        """
+        before = self.api_client.list_export_tasks()
+        if not before.get('success'):
+            return before
+        known_keys = {self.api_client.task_key(task) for task in before['data']}
+        
+        submit_result = self.api_client.generate_order_list(start_time, end_time)
+        if submit_result.get('success') is False:
+            return {"success": False, "message": f"提交订单导出失败: {submit_result.get('message', '未知错误')}"}
+        total_num = (submit_result.get('data') or {}).get('totalNum')
+        logger.info(f"订单导出已提交，共 {total_num if total_num is not None else '未知'} 条数据，等待导出完成")
+        
+        def find_finished_task():
+            result = self.api_client.list_export_tasks()
+            if not result.get('success'):
+                logger.warning(f"查询导出任务失败，稍后重试: {result.get('message')}")
+                return None
+            for task in result['data']:
+                if self.api_client.task_key(task) not in known_keys and task.get('targetFile'):
+                    return task
+            return None
+        
+        try:
+            task = self._poll("订单导出", find_finished_task, progress_callback, cancel_event)
+            if task is None:
+                return {"success": False, "message": f"等待订单导出超时（{self.timeout} 秒），可稍后点击下载订单列表重试"}
+            return self.api_client.download_export_task(task, orders_dir, progress_callback, cancel_event)
+        except OperationCancelled as e:
+            return {"success": False, "cancelled": True, "message": str(e)}
+    
+    def run_service_export(self, start_time, end_time, service_dir=None, progress_callback=None, cancel_event=None):
+        """
+        提交服务单导出并在完成后下载
+        
+        参数:
+            start_time: 开始时间，格式 YYYY-MM-DD HH:MM:SS
+            end_time: 结束时间，格式 YYYY-MM-DD HH:MM:SS
+            service_dir: 服务单保存目录
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止等待
+        
+        返回:
+            dict: 下载结果，成功时包含 file_path
+        """
+        before = self.api_client.query_service_exports()
+        if not before.get('success'):
+            return before
+        known_keys = {self.api_client.task_key(export) for export in before['data']}
+        
+        submit_result = self.api_client.generate_service_list(start_time, end_time)
+        if not submit_result.get('success'):
+            return submit_result
+        logger.info("服务单导出已提交，等待导出完成")
+        
+        def find_finished_export():
+            result = self.api_client.query_service_exports()
+            if not result.get('success'):
+                logger.warning(f"查询服务单导出结果失败，稍后重试: {result.get('message')}")
+                return None
+            for export in result['data']:
+                if self.api_client.task_key(export) not in known_keys and export.get('url'):
+                    return export
+            return None
+        
+        try:
+            export = self._poll("服务单导出", find_finished_export, progress_callback, cancel_event)
+            if export is None:
+                return {"success": False, "message": f"等待服务单导出超时（{self.timeout} 秒），可稍后点击下载服务单重试"}
+            return self.api_client.download_service_export(export, service_dir, progress_callback, cancel_event)
+        except OperationCancelled as e:
+            return {"success": False, "cancelled": True, "message": str(e)}
+    
+    def _poll(self, label, check, progress_callback=None, cancel_event=None):
+        """
+        按指数退避加随机抖动的间隔反复调用 check，直到返回非None的结果或超时
+        
+        返回:
+            check 返回的结果，超时返回None
+        """
+        started = time.monotonic()
+        attempt = 0
+        
+        while True:
+            elapsed = time.monotonic() - started
+            if elapsed >= self.timeout:
+                return None
+            
+            delay = min(self.initial_delay * 2 ** attempt, self.max_delay)
+            delay = random.uniform(delay / 2, delay)
+            attempt += 1
+            
+            if progress_callback:
+                progress_callback(f"{label}: 等待导出完成，已等待 {elapsed:.0f} 秒，第 {attempt} 次查询")
+            
+            # 等待期间响应取消请求
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise OperationCancelled(f"{label}已取消")
+            else:
+                time.sleep(delay)
+            
+            result = check()
+            if result is not None:
+                logger.info(f"{label}已完成，共查询 {attempt} 次，耗时 {time.monotonic() - started:.0f} 秒")
+                return result
\ No newline at end of file
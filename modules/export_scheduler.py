@@ -0,0 +1,268 @@
+import time
+import random
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from modules.progress import OperationCancelled
+from modules.data_processor import order_file_stats, order_file_version
+
+logger = logging.getLogger('ExportScheduler')
+
+# 分片名称对应的天数
+SHARD_DAYS = {
+    'day': 1,
+    'week': 7
+}
+
+def split_date_range(start_date, end_date, shard='week'):
+    """
+    将日期范围拆分为多个导出分片
+    
+    参数:
+        start_date: 开始日期，格式 YYYY-MM-DD
+        end_date: 结束日期，格式 YYYY-MM-DD
+        shard: 分片大小，'day'、'week' 或天数
+    
+    返回:
+        list: [(开始时间, 结束时间), ...]，时间格式 YYYY-MM-DD HH:MM:SS
+    """
+    days = SHARD_DAYS.get(shard, shard)
+    if not isinstance(days, int) or days < 1:
+        raise ValueError(f"无效的分片大小: {shard}")
+    
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    if end < start:
+        raise ValueError("结束日期不能早于开始日期")
+    
+    shards = []
+    while start <= end:
+        shard_end = min(start + timedelta(days=days - 1), end)
+        shards.append((f"{start:%Y-%m-%d} 00:00:00", f"{shard_end:%Y-%m-%d} 23:59:59"))
+        start = shard_end + timedelta(days=1)
+    return shards
+
+class ExportScheduler:
+    """
+    将大的日期范围拆分为多个小的导出任务并发执行，完成的分片立即下载并解析
+    
+    每个分片提交后，等待任务列表中出现一个新的任务并将其与该分片绑定，
+    之后按任务标识跟踪导出状态。同一时间最多有 max_concurrent 个分片在服务端导出
+    
+    参数:
+        api_client: ApiClient 实例
+        data_processor: DataProcessor 实例，用于解析下载完成的分片文件
+        max_concurrent: 同时在导出中的分片数量上限
+        initial_delay: 查询导出状态的初始间隔秒数
+        max_delay: 查询导出状态的最长间隔秒数
+        timeout: 单个分片等待导出完成的最长秒数
+        bind_timeout: 提交后等待任务出现在任务列表中的最长秒数
+    """
+    def __init__(self, api_client, data_processor, max_concurrent=3, initial_delay=2, max_delay=30,
+                 timeout=900, bind_timeout=60):
+        self.api_client = api_client
+        self.data_processor = data_processor
+        self.max_concurrent = max_concurrent
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.bind_timeout = bind_timeout
+        # 新提交的任务排在列表最前面，查询的数量只需覆盖正在导出的分片
+        self.page_size = max(20, max_concurrent * 3)
+    
+    def run(self, start_date, end_date, shard='week', orders_dir=None, progress_callback=None, cancel_event=None,
+            parse=True):
+        """
+        分片导出日期范围内的订单，下载并解析所有分片
+        
+        参数:
+            start_date: 开始日期，格式 YYYY-MM-DD
+            end_date: 结束日期，格式 YYYY-MM-DD
+            shard: 分片大小，'day'、'week' 或天数
+            orders_dir: 订单文件保存目录
+            progress_callback: 接收进度文本的回调函数
+            cancel_event: threading.Event，被设置后停止提交和等待
+            parse: 是否解析并合并下载的文件；为False时只下载，由调用方逐个文件解析上传
+        
+        返回:
+            dict: 与 DataProcessor.process_order_excel 相同格式的处理结果，files 为下载的文件列表；
+                parse 为False时只包含 files
+        """
+        try:
+            shards = [
+                {"start_time": shard_start, "end_time": shard_end}
+                for shard_start, shard_end in split_date_range(start_date, end_date, shard)
+            ]
+        except ValueError as e:
+            return {"success": False, "message": str(e)}
+        
+        logger.info(f"日期范围 {start_date} 至 {end_date} 拆分为 {len(shards)} 个分片，最多同时导出 {self.max_concurrent} 个")
+        
+        before = self.api_client.list_export_tasks(page_size=self.page_size)
+        if not before.get('success'):
+            return before
+        known_keys = {self.api_client.task_key(task) for task in before['data']}
+        
+        pending = deque(shards)
+        in_flight = {}  # 任务标识 -> 分片
+        failed = []
+        futures = []
+        started = time.monotonic()
+        
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+                attempt = 0
+                while pending or in_flight:
+                    # 补充提交分片，直到达到并发上限
+                    while pending and len(in_flight) < self.max_concurrent:
+                        item = pending.popleft()
+                        key = self._submit_shard(item, known_keys, cancel_event)
+                        if key is None:
+                            failed.append(item)
+                            continue
+                        known_keys.add(key)
+                        in_flight[key] = item
+                        attempt = 0
+                    
+                    if not in_flight:
+                        break
+                    
+                    delay = min(self.initial_delay * 2 ** attempt, self.max_delay)
+                    self._wait(random.uniform(delay / 2, delay), cancel_event)
+                    
+                    result = self.api_client.list_export_tasks(page_size=self.page_size)
+                    if not result.get('success'):
+                        logger.warning(f"查询导出任务失败，稍后重试: {result.get('message')}")
+                        attempt += 1
+                        continue
+                    
+                    # 已完成的分片交给线程池下载并解析，继续等待其他分片
+                    finished_any = False
+                    for task in result['data']:
+                        key = self.api_client.task_key(task)
+                        if key in in_flight and task.get('targetFile'):
+                            item = in_flight.pop(key)
+                            logger.info(f"分片 {item['start_time']} 至 {item['end_time']} 导出完成")
+                            futures.append(executor.submit(self._download_and_parse, item, task, orders_dir,
+                                                           cancel_event, parse))
+                            finished_any = True
+                    
+                    now = time.monotonic()
+                    for key, item in list(in_flight.items()):
+                        if now - item['submitted_at'] > self.timeout:
+                            item['message'] = f"等待导出超时（{self.timeout} 秒）"
+                            logger.error(f"分片 {item['start_time']} 至 {item['end_time']} {item['message']}")
+                            failed.append(in_flight.pop(key))
+                    
+                    attempt = 0 if finished_any else attempt + 1
+                    
+                    if progress_callback:
+                        done = sum(1 for future in futures if future.done())
+                        progress_callback(
+                            f"分片导出订单: 已完成 {done}/{len(shards)}，导出中 {len(in_flight)}，"
+                            f"待提交 {len(pending)}，已用时 {time.monotonic() - started:.0f} 秒"
+                        )
+                
+                results = [future.result() for future in futures]
+        except OperationCancelled as e:
+            logger.warning(str(e))
+            return {"success": False, "cancelled": True, "message": str(e)}
+        
+        master_frames = []
+        detail_frames = []
+        files = []
+        file_stats = {}
+        # 从新到旧合并，同一订单保留最新文件中的快照
+        results.sort(key=lambda result: order_file_version(result['file_path']) if result.get('success') else 0,
+                     reverse=True)
+        for result in results:
+            if result.get('success') and not parse:
+                files.append(result['file_path'])
+            elif result.get('success'):
+                files.append(result['file_path'])
+                file_stats[result['file_path']] = order_file_stats(result['file_path'], result['master_data'],
+                                                                   result['detail_data'])
+                master_frames.append(result['master_data'])
+                detail_frames.append(result['detail_data'])
+            elif result.get('cancelled'):
+                return {"success": False, "cancelled": True, "message": "分片导出已取消"}
+            else:
+                failed.append(result['shard'])
+        
+        logger.info(f"分片导出结束，成功 {len(files)} 个，失败 {len(failed)} 个，耗时 {time.monotonic() - started:.0f} 秒")
+        
+        if failed:
+            details = '；'.join(f"{item['start_time'][:10]} 至 {item['end_time'][:10]}: {item.get('message', '未知错误')}"
+                               for item in failed)
+            return {"success": False, "files": files,
+                    "message": f"{len(failed)} 个分片导出失败，已下载的文件可稍后通过上传订单列表上传。{details}"}
+        
+        if not parse:
+            return {"success": True, "files": files}
+        
+        combined = self.data_processor.combine_order_frames(master_frames, detail_frames)
+        combined['files'] = files
+        combined['file_stats'] = file_stats
+        return combined
+    
+    def _submit_shard(self, item, known_keys, cancel_event=None):
+        """
+        提交一个分片的导出请求，并等待对应的任务出现在任务列表中
+        
+        返回:
+            str: 绑定的任务标识，失败返回None
+        """
+        result = self.api_client.generate_order_list(item['start_time'], item['end_time'])
+        if result.get('success') is False:
+            item['message'] = f"提交导出失败: {result.get('message', '未知错误')}"
+            logger.error(f"分片 {item['start_time']} 至 {item['end_time']} {item['message']}")
+            return None
+        item['submitted_at'] = time.monotonic()
+        
+        # 提交是逐个进行的，提交后新出现的任务即属于该分片
+        delay = 0.5
+        deadline = time.monotonic() + self.bind_timeout
+        while time.monotonic() < deadline:
+            self._wait(delay, cancel_event)
+            listing = self.api_client.list_export_tasks(page_size=self.page_size)
+            if listing.get('success'):
+                new_tasks = [task for task in listing['data'] if self.api_client.task_key(task) not in known_keys]
+                if new_tasks:
+                    if len(new_tasks) > 1:
+                        logger.warning(f"提交后出现 {len(new_tasks)} 个新任务，取最新的一个作为该分片的任务")
+                    key = self.api_client.task_key(new_tasks[0])
+                    logger.info(f"分片 {item['start_time']} 至 {item['end_time']} 已提交，任务标识: {key}")
+                    return key
+            delay = min(delay * 2, 5)
+        
+        item['message'] = "提交后未在任务列表中找到对应的导出任务"
+        logger.error(f"分片 {item['start_time']} 至 {item['end_time']} {item['message']}")
+        return None
+    
+    def _download_and_parse(self, item, task, orders_dir=None, cancel_event=None, parse=True):
+        """下载已完成的分片，parse 为True时解析为主表和明细表"""
+        result = self.api_client.download_export_task(task, orders_dir, None, cancel_event)
+        if not result.get('success'):
+            item['message'] = result.get('message')
+            return {"success": False, "cancelled": result.get('cancelled', False), "shard": item}
+        if not parse:
+            return {"success": True, "file_path": result['file_path'], "shard": item}
+        
+        parsed = self.data_processor.process_order_file(result['file_path'])
+        if not parsed.get('success'):
+            item['message'] = parsed.get('message')
+            return {"success": False, "shard": item}
+        
+        parsed['file_path'] = result['file_path']
+        parsed['shard'] = item
+        return parsed
+    
+    @staticmethod
+    def _wait(delay, cancel_event=None):
+        """等待指定秒数，期间响应取消请求"""
+        if cancel_event is not None:
+            if cancel_event.wait(delay):
+                raise OperationCancelled("分片导出已取消")
+        else:
+            time.sleep(delay)
\ No newline at end of file
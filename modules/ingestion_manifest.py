@@ -0,0 +1,179 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from modules.parse_cache import file_digest
+
+logger = logging.getLogger('IngestionManifest')
+
+# 清单文件名，位于导出文件所在目录下
+MANIFEST_FILE_NAME = '.ingestion_manifest.json'
+# 已上传订单文件写入的订单号，每个文件单独保存为 <哈希>.txt，不放在清单中，需要时才读取
+ORDER_IDS_DIR_NAME = '.ingestion_orders'
+
+class IngestionManifest:
+    """
+    记录目录中每个导出文件的上传状态，只处理还没有成功上传过的文件
+    
+    以文件内容哈希为键，记录文件名、大小、行数、上传状态和时间。文件名、大小和修改时间
+    都未变化的文件直接使用记录的哈希，不再重新读取文件内容
+    
+    参数:
+        directory: 导出文件所在目录，清单保存在该目录的 .ingestion_manifest.json 中
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_FILE_NAME)
+        self.order_ids_dir = os.path.join(directory, ORDER_IDS_DIR_NAME)
+        self._lock = threading.Lock()
+        self._entries = self._load()  # 哈希 -> 记录
+        self._order_ids = {}  # 哈希 -> 已读取的订单号集合
+    
+    def _load(self):
+        """从文件加载清单"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"读取上传清单失败，将重新处理所有文件: {str(e)}")
+            return {}
+    
+    def _save_locked(self):
+        """保存清单，先写临时文件再替换，调用方需持有锁"""
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+    
+    def digest(self, file_path):
+        """获取文件内容哈希，文件未变化时使用清单中记录的哈希"""
+        stat = os.stat(file_path)
+        file_name = os.path.basename(file_path)
+        with self._lock:
+            for digest, entry in self._entries.items():
+                if (entry.get('file_name') == file_name and entry.get('size') == stat.st_size
+                        and entry.get('mtime') == stat.st_mtime):
+                    return digest
+        return file_digest(file_path)
+    
+    def is_uploaded(self, file_path):
+        """文件是否已经成功上传过"""
+        digest = self.digest(file_path)
+        with self._lock:
+            entry = self._entries.get(digest)
+        return entry is not None and entry.get('status') == 'uploaded'
+    
+    def pending_files(self, file_paths):
+        """
+        筛选出还没有成功上传过的文件
+        
+        参数:
+            file_paths: 文件路径列表
+        
+        返回:
+            list: 需要处理的文件路径，顺序不变
+        """
+        pending = [path for path in file_paths if not self.is_uploaded(path)]
+        skipped = len(file_paths) - len(pending)
+        if skipped:
+            logger.info(f"跳过 {skipped} 个已上传过的文件，需要处理 {len(pending)} 个文件")
+        return pending
+    
+    def _mark(self, file_path, status, digest=None, **fields):
+        stat = os.stat(file_path)
+        if digest is None:
+            digest = self.digest(file_path)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            entry = self._entries.get(digest, {'first_seen_at': now})
+            entry.update({
+                'file_name': os.path.basename(file_path),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'status': status,
+                'updated_at': now
+            })
+            entry.update(fields)
+            self._entries[digest] = entry
+            self._save_locked()
+    
+    def mark_uploaded(self, file_path, order_ids=None, **stats):
+        """
+        记录文件已成功上传
+        
+        参数:
+            file_path: 文件路径
+            order_ids: 订单文件写入的订单号列表，单独保存，清单中只记录数量；
+                和 stats 中的 version 一起供 uploaded_newer 判断哪些订单已有更新的快照
+            stats: 额外记录的信息，例如 master_rows、detail_rows、rows、version
+        """
+        digest = self.digest(file_path)
+        if order_ids is not None:
+            # 先保存订单号再标记为已上传，中断时不会出现已上传但缺少订单号的记录
+            self._save_order_ids(digest, order_ids)
+            stats['order_count'] = len(order_ids)
+        self._mark(file_path, 'uploaded', digest=digest, uploaded_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                   error=None, **stats)
+    
+    def _order_ids_path(self, digest):
+        return os.path.join(self.order_ids_dir, f"{digest}.txt")
+    
+    def _save_order_ids(self, digest, order_ids):
+        """保存文件写入的订单号，每行一个，先写临时文件再替换"""
+        os.makedirs(self.order_ids_dir, exist_ok=True)
+        path = self._order_ids_path(digest)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(order_ids))
+        os.replace(temp_path, path)
+        with self._lock:
+            self._order_ids.pop(digest, None)
+    
+    def _load_order_ids(self, digest):
+        """读取文件写入的订单号，读取后缓存在内存中"""
+        with self._lock:
+            cached = self._order_ids.get(digest)
+        if cached is not None:
+            return cached
+        try:
+            with open(self._order_ids_path(digest), 'r', encoding='utf-8') as f:
+                order_ids = frozenset(f.read().split('\n')) - {''}
+        except OSError:
+            order_ids = frozenset()
+        with self._lock:
+            self._order_ids[digest] = order_ids
+        return order_ids
+    
+    def uploaded_newer(self, order_ids, version):
+        """
+        判断订单是否已从快照版本比 version 更新的文件上传过
+        
+        上次上传中断后重新处理较旧的文件时，数据库中这些订单已经是更新的快照，不应再被覆盖。
+        只读取版本更新的文件的订单号，没有这样的文件时不读取任何订单号文件
+        
+        参数:
+            order_ids: 订单号字符串Series
+            version: 快照版本，见 data_processor.order_file_version
+        
+        返回:
+            Series: 与 order_ids 对齐的布尔值，True 表示已从更新的文件上传过
+        """
+        with self._lock:
+            newer = [digest for digest, entry in self._entries.items()
+                     if entry.get('status') == 'uploaded' and entry.get('version') is not None
+                     and entry['version'] > version]
+        superseded = order_ids.isin(())
+        for digest in newer:
+            uploaded = self._load_order_ids(digest)
+            if uploaded:
+                superseded |= order_ids.isin(uploaded)
+        return superseded
+    
+    def mark_failed(self, file_path, message):
+        """记录文件上传失败，下次仍会处理"""
+        self._mark(file_path, 'failed', error=message)
+
@@ -1,17 +1,22 @@
 import logging
 import os
-import time
-import sys
-from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
-from PyQt6.QtCore import QObject, pyqtSignal
+import threading
+import queue
+import atexit
+from collections import deque
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler, QueueHandler, QueueListener
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
 
 class UILogHandler(logging.Handler):
     """
-    自定义日志处理器，将日志同时显示在UI界面和终端
+    自定义日志处理器，将日志写入有界环形缓冲区，由界面线程的定时器批量取出显示
     """
-    def __init__(self, signal_target=None):
+    def __init__(self, max_buffer=5000):
         super().__init__()
-        self.signal_target = signal_target
+        # 缓冲区写满后丢弃最早的日志，并记录丢弃条数
+        self.buffer = deque(maxlen=max_buffer)
+        self.dropped = 0
+        self._buffer_lock = threading.Lock()
         
         # 设置格式化器
         formatter = logging.Formatter('[%(asctime)s] [%(name)s] [%(levelname)s] - %(message)s')
@@ -19,31 +24,139 @@ class UILogHandler(logging.Handler):
     
     def emit(self, record):
         """
-        发出日志记录，如果有信号目标则发送到UI界面
+        将格式化后的日志放入缓冲区，不在调用线程上操作界面
         """
         try:
             msg = self.format(record)
-            if self.signal_target is not None:
-                # 通过信号发送日志消息到UI
-                self.signal_target.log_signal.emit(msg)
-                
-            # 确保信号被处理，调用立即刷新
-            QApplication = None
-            try:
-                from PyQt6.QtWidgets import QApplication
-            except ImportError:
-                pass
-            
-            if QApplication is not None and QApplication.instance() is not None:
-                QApplication.instance().processEvents()
+            with self._buffer_lock:
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.dropped += 1
+                self.buffer.append(msg)
         except Exception:
             self.handleError(record)
+    
+    def drain(self):
+        """
+        取出缓冲区中的全部日志
+        
+        返回:
+            tuple: (日志文本列表, 自上次取出以来被丢弃的日志条数)
+        """
+        with self._buffer_lock:
+            messages = list(self.buffer)
+            self.buffer.clear()
+            dropped = self.dropped
+            self.dropped = 0
+        return messages, dropped
 
-class LogSignal(QObject):
+class LogFlusher(QObject):
     """
-    用于传递日志消息的信号类
+    在界面线程中定时从UILogHandler取出日志，批量发送给界面
     """
-    log_signal = pyqtSignal(str)
+    logs_ready = pyqtSignal(list)
+    
+    def __init__(self, handler, interval_ms=100):
+        super().__init__()
+        self.handler = handler
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+    
+    def start(self):
+        """启动定时刷新"""
+        self.timer.start()
+    
+    def stop(self):
+        """停止定时刷新并输出剩余日志"""
+        self.timer.stop()
+        self.flush()
+    
+    def flush(self):
+        """取出缓冲区中的日志并发送"""
+        messages, dropped = self.handler.drain()
+        if dropped:
+            messages.insert(0, f"...（日志过多，已省略 {dropped} 条较早的日志，完整内容请查看日志文件）")
+        if messages:
+            self.logs_ready.emit(messages)
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    将日志记录放入有界队列的处理器，由后台监听线程统一写入各个处理器
+    
+    队列已满时，WARNING以下级别的日志直接丢弃并计数，WARNING及以上级别的日志
+    最多等待 block_timeout 秒，仍无法入队才丢弃
+    """
+    def __init__(self, log_queue, block_timeout=1.0):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self._stats_lock = threading.Lock()
+    
+    def enqueue(self, record):
+        """
+        将日志记录放入队列，队列已满时按级别丢弃
+        """
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return
+        
+        depth = self.queue.qsize()
+        with self._stats_lock:
+            self.enqueued += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+    
+    def get_stats(self):
+        """
+        获取队列统计信息
+        
+        返回:
+            dict: 已入队条数、丢弃条数、队列最大深度和当前深度
+        """
+        with self._stats_lock:
+            return {
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "max_depth": self.max_depth,
+                "depth": self.queue.qsize()
+            }
+
+class ClosingQueueListener(QueueListener):
+    """
+    队列已满时也能正常停止的监听器
+    
+    标准的 QueueListener.stop 用 put_nowait 放入结束标记，队列已满时会抛出 queue.Full。
+    这里先最多等待 sentinel_timeout 秒，仍然放不进去时在当前线程中写出积压的日志再放入结束标记
+    """
+    sentinel_timeout = 5.0
+    
+    def enqueue_sentinel(self):
+        try:
+            self.queue.put(self._sentinel, timeout=self.sentinel_timeout)
+            return
+        except queue.Full:
+            pass
+        
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not self._sentinel:
+                self.handle(record)
+        self.queue.put_nowait(self._sentinel)
+
+# 异步日志模式下的队列处理器和后台监听器
+_queue_handler = None
+_queue_listener = None
 
 def ensure_log_dir():
     """
@@ -54,22 +167,30 @@ def ensure_log_dir():
         os.makedirs(log_dir)
     return log_dir
 
-def setup_logging(ui_handler=None, log_level=logging.INFO):
+def setup_logging(ui_handler=None, log_level=logging.INFO, async_mode=False, queue_size=10000):
     """
     设置全局日志配置
     
     参数:
         ui_handler: UI日志处理器
         log_level: 日志级别，默认为INFO
+        async_mode: 是否启用异步日志。启用后调用线程只把日志放入有界队列，
+                    由一个后台线程统一格式化并写入控制台、文件和UI
+        queue_size: 异步日志队列的最大长度
     """
+    global _queue_handler, _queue_listener
+    
     # 获取根日志记录器
     root_logger = logging.getLogger()
     root_logger.setLevel(log_level)
     
-    # 清除现有处理器
+    # 停止之前的异步日志监听器，并清除现有处理器
+    stop_logging()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
     
+    handlers = []
+    
     # 创建标准格式化器
     formatter = logging.Formatter('[%(asctime)s] [%(name)s] [%(levelname)s] - %(message)s')
     
@@ -77,7 +198,7 @@ def setup_logging(ui_handler=None, log_level=logging.INFO):
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    handlers.append(console_handler)
     
     # 确保日志目录存在
     log_dir = ensure_log_dir()
@@ -92,7 +213,7 @@ def setup_logging(ui_handler=None, log_level=logging.INFO):
     )
     size_handler.setLevel(log_level)
     size_handler.setFormatter(formatter)
-    root_logger.addHandler(size_handler)
+    handlers.append(size_handler)
     
     # 添加按时间轮转的文件处理器 (每天轮转一次，保留30天)
     daily_log_file = os.path.join(log_dir, 'daily.log')
@@ -106,7 +227,7 @@ def setup_logging(ui_handler=None, log_level=logging.INFO):
     time_handler.setLevel(log_level)
     time_handler.setFormatter(formatter)
     time_handler.suffix = "%Y-%m-%d"
-    root_logger.addHandler(time_handler)
+    handlers.append(time_handler)
     
     # 添加错误日志专用处理器
     error_log_file = os.path.join(log_dir, 'error.log')
@@ -118,19 +239,74 @@ def setup_logging(ui_handler=None, log_level=logging.INFO):
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    root_logger.addHandler(error_handler)
+    handlers.append(error_handler)
     
     # 如果提供了UI处理器，则添加
     if ui_handler:
         ui_handler.setLevel(log_level)
-        root_logger.addHandler(ui_handler)
+        handlers.append(ui_handler)
+    
+    if async_mode:
+        # 根日志记录器只挂载队列处理器，由后台监听线程分发给各个处理器
+        log_queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _queue_handler.setLevel(log_level)
+        root_logger.addHandler(_queue_handler)
+        
+        _queue_listener = ClosingQueueListener(log_queue, *handlers, respect_handler_level=True)
+        _queue_listener.start()
+    else:
+        for handler in handlers:
+            root_logger.addHandler(handler)
     
     # 记录启动信息
     root_logger.info("========== 程序启动 ==========")
     root_logger.info(f"日志保存路径: {log_dir}")
+    if async_mode:
+        root_logger.info(f"已启用异步日志，队列长度上限: {queue_size}")
     
     return root_logger
 
+def get_logging_stats():
+    """
+    获取异步日志队列的统计信息
+    
+    返回:
+        dict: 队列统计信息，未启用异步日志时返回None
+    """
+    if _queue_handler is None:
+        return None
+    return _queue_handler.get_stats()
+
+def stop_logging():
+    """
+    停止异步日志监听器，写出队列中剩余的日志，然后刷新并关闭各个处理器
+    """
+    global _queue_handler, _queue_listener
+    if _queue_listener is None:
+        return
+    
+    stats = _queue_handler.get_stats()
+    if stats["dropped"]:
+        logging.getLogger().warning(
+            f"异步日志队列溢出，共丢弃 {stats['dropped']} 条日志，队列最大深度 {stats['max_depth']}"
+        )
+    
+    # stop会等待监听线程处理完队列中已有的日志
+    _queue_listener.stop()
+    logging.getLogger().removeHandler(_queue_handler)
+    for handler in _queue_listener.handlers:
+        try:
+            handler.flush()
+            handler.close()
+        except Exception:
+            pass
+    _queue_handler = None
+    _queue_listener = None
+
+# 程序退出时确保队列中的日志被写出
+atexit.register(stop_logging)
+
 def get_logger(name):
     """
     获取指定名称的日志记录器
@@ -0,0 +1,145 @@
+import os
+import hashlib
+import logging
+import threading
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # 未安装pyarrow时不使用解析缓存
+    pa = None
+    feather = None
+
+logger = logging.getLogger('ParseCache')
+
+# 缓存目录名，位于导出文件所在目录下
+CACHE_DIR_NAME = '.parse_cache'
+
+def file_digest(file_path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ParseCache:
+    """
+    订单文件解析结果的列式缓存
+    
+    每个导出文件解析后的主表和明细表以未压缩的Arrow IPC（Feather）格式保存在
+    导出文件所在目录的 .parse_cache 子目录中，以文件内容哈希和解析器版本为键，
+    之后读取时直接内存映射缓存文件，不再解析Excel。缓存总大小超过上限时删除最久未使用的缓存
+    
+    参数:
+        parser_version: 解析器版本，解析逻辑变化后旧缓存自动失效
+        max_bytes: 每个缓存目录的大小上限
+    """
+    PARTS = ('master_data', 'detail_data')
+    
+    def __init__(self, parser_version, max_bytes=512 * 1024 * 1024):
+        self.parser_version = parser_version
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def available():
+        """是否安装了pyarrow"""
+        return pa is not None
+    
+    def _paths(self, file_path, key):
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR_NAME)
+        prefix = os.path.join(cache_dir, f"{key}.v{self.parser_version}")
+        return cache_dir, {part: f"{prefix}.{part}.arrow" for part in self.PARTS}
+    
+    def key(self, file_path):
+        """计算文件的缓存键"""
+        return file_digest(file_path)
+    
+    def load(self, file_path, key=None):
+        """
+        读取文件的缓存解析结果
+        
+        返回:
+            dict: 与 parse_order_file 相同格式的结果，没有缓存时返回None
+        """
+        if not self.available():
+            return None
+        key = key or self.key(file_path)
+        _, paths = self._paths(file_path, key)
+        if not all(os.path.exists(path) for path in paths.values()):
+            return None
+        
+        try:
+            result = {"success": True}
+            for part, path in paths.items():
+                result[part] = feather.read_table(path, memory_map=True).to_pandas()
+                # 更新访问时间，淘汰时保留最近使用的缓存
+                os.utime(path)
+        except Exception as e:
+            logger.warning(f"读取 {os.path.basename(file_path)} 的解析缓存失败，重新解析: {str(e)}")
+            return None
+        
+        logger.info(f"使用解析缓存: {os.path.basename(file_path)}，主表 {len(result['master_data'])} 行，"
+                    f"明细表 {len(result['detail_data'])} 行")
+        return result
+    
+    def store(self, file_path, result, key=None):
+        """保存文件的解析结果，保存失败时只记录日志，不影响解析结果"""
+        if not self.available() or not result.get('success'):
+            return False
+        key = key or self.key(file_path)
+        cache_dir, paths = self._paths(file_path, key)
+        
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            for part, path in paths.items():
+                # 先写临时文件再重命名，避免并发读取到不完整的缓存
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                # Feather不保存索引，合并时也不使用索引
+                feather.write_feather(result[part].reset_index(drop=True), temp_path, compression='uncompressed')
+                os.replace(temp_path, path)
+        except Exception as e:
+            logger.warning(f"保存 {os.path.basename(file_path)} 的解析缓存失败: {str(e)}")
+            for path in paths.values():
+                for leftover in (path, f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
+            return False
+        
+        self.evict(cache_dir)
+        return True
+    
+    def evict(self, cache_dir):
+        """缓存目录超过大小上限时，按最近使用时间从旧到新删除缓存"""
+        with self._lock:
+            try:
+                entries = []
+                for name in os.listdir(cache_dir):
+                    if not name.endswith('.arrow'):
+                        continue
+                    path = os.path.join(cache_dir, name)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            except OSError:
+                return
+            
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            
+            # 同一个文件的主表和明细表一起删除
+            removed = set()
+            for _, _, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                prefix = path.rsplit('.', 2)[0]
+                if prefix in removed:
+                    continue
+                removed.add(prefix)
+                for part in self.PARTS:
+                    part_path = f"{prefix}.{part}.arrow"
+                    if os.path.exists(part_path):
+                        total -= os.path.getsize(part_path)
+                        os.remove(part_path)
+            logger.info(f"解析缓存超过上限，已删除 {len(removed)} 个文件的缓存")
@@ -0,0 +1,73 @@
+import time
+
+class OperationCancelled(Exception):
+    """用户取消了正在执行的任务"""
+    pass
+
+class ProgressReporter:
+    """
+    记录任务进度和吞吐量，并在检查点响应取消请求
+    
+    参数:
+        label: 进度描述，例如"上传主表"
+        total: 总数量，未知时为None
+        callback: 接收进度文本的回调函数
+        cancel_event: threading.Event，被设置后 check_cancelled 会抛出 OperationCancelled
+        unit: 数量单位
+        min_interval: 两次进度回调之间的最小间隔（秒），避免刷屏
+        initial: 初始已完成数量，例如断点续传时已下载的部分，不计入速率
+    """
+    def __init__(self, label, total=None, callback=None, cancel_event=None, unit='条', min_interval=0.2, initial=0):
+        self.label = label
+        self.total = total
+        self.callback = callback
+        self.cancel_event = cancel_event
+        self.unit = unit
+        self.min_interval = min_interval
+        
+        self.initial = initial
+        self.done = initial
+        self.started_at = time.monotonic()
+        self._last_report = 0.0
+    
+    def check_cancelled(self):
+        """如果任务已被取消则抛出 OperationCancelled"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise OperationCancelled(f"{self.label}已取消")
+    
+    def advance(self, count=1):
+        """累加已完成数量并汇报进度"""
+        self.done += count
+        self.report()
+    
+    def rate(self):
+        """每秒处理数量"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        return (self.done - self.initial) / elapsed
+    
+    def eta(self):
+        """预计剩余秒数，总量未知或尚无速率时返回None"""
+        rate = self.rate()
+        if not self.total or rate <= 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+    
+    def report(self, force=False):
+        """将当前进度发送给回调函数"""
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < self.min_interval:
+            return
+        self._last_report = now
+        
+        text = f"{self.label}: {self.done:.0f}"
+        if self.total:
+            text += f"/{self.total:.0f} {self.unit} ({self.done / self.total:.0%})"
+        else:
+            text += f" {self.unit}"
+        text += f"，{self.rate():.0f} {self.unit}/秒"
+        eta = self.eta()
+        if eta is not None:
+            text += f"，预计剩余 {eta:.0f} 秒"
+        self.callback(text)
@@ -0,0 +1,96 @@
+"""上传中断后重新处理较旧的订单文件时，不覆盖已从较新文件上传的订单"""
+import os
+
+import pandas as pd
+import pytest
+
+from modules.data_processor import DataProcessor
+from modules.ingestion_manifest import IngestionManifest
+
+# 文件名 -> (快照版本, 订单号列表)
+ORDER_FILES = {
+    'new.xls': (2_000_000_000, ['A', 'B']),
+    'old.xls': (1_000_000_000, ['A', 'C']),
+}
+
+
+def parsed_orders(file_path):
+    """按文件名返回固定的解析结果，订单状态标明来自哪个文件"""
+    name = os.path.basename(file_path)
+    order_ids = ORDER_FILES[name][1]
+    master = pd.DataFrame({'order_id': order_ids, 'status': [name] * len(order_ids)})
+    details = pd.DataFrame({'order_id': order_ids, 'product_name': [f'{name}-{oid}' for oid in order_ids]})
+    return {"success": True, "master_data": master, "detail_data": details}
+
+
+@pytest.fixture
+def orders_dir(tmp_path):
+    for name, (version, _) in ORDER_FILES.items():
+        path = tmp_path / name
+        path.write_text(name)
+        os.utime(path, (version, version))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    processor = DataProcessor(download_dir=str(tmp_path / 'Downloads'), parse_cache=False)
+    monkeypatch.setattr(processor, 'process_order_file', parsed_orders)
+    return processor
+
+
+def upload_first_batch(processor, orders_dir):
+    """上传最新的文件后中断，模拟上次上传未完成"""
+    manifest = IngestionManifest(orders_dir)
+    batches = processor.iter_order_batches(orders_dir, manifest=manifest)
+    batch = next(batches)
+    batches.close()
+    for file_path in batch['files']:
+        manifest.mark_uploaded(file_path, **batch['file_stats'][file_path])
+    return batch
+
+
+def test_streaming_resume_skips_orders_uploaded_from_newer_file(processor, orders_dir):
+    first = upload_first_batch(processor, orders_dir)
+    assert [os.path.basename(path) for path in first['files']] == ['new.xls']
+
+    batches = list(processor.iter_order_batches(orders_dir, manifest=IngestionManifest(orders_dir)))
+
+    assert len(batches) == 1
+    batch = batches[0]
+    assert [os.path.basename(path) for path in batch['files']] == ['old.xls']
+    assert batch['master_data']['order_id'].tolist() == ['C']
+    assert batch['detail_data']['order_id'].tolist() == ['C']
+
+
+def test_combined_resume_skips_orders_uploaded_from_newer_file(processor, orders_dir):
+    upload_first_batch(processor, orders_dir)
+
+    result = processor.process_order_excel(orders_dir, manifest=IngestionManifest(orders_dir))
+
+    assert result['success']
+    assert [os.path.basename(path) for path in result['files']] == ['old.xls']
+    assert result['master_data']['order_id'].tolist() == ['C']
+    assert result['detail_data']['order_id'].tolist() == ['C']
+
+
+def test_older_upload_does_not_hide_newer_file(processor, orders_dir):
+    manifest = IngestionManifest(orders_dir)
+    old_path = os.path.join(orders_dir, 'old.xls')
+    manifest.mark_uploaded(old_path, version=ORDER_FILES['old.xls'][0], order_ids=['A', 'C'])
+
+    batches = list(processor.iter_order_batches(orders_dir, manifest=IngestionManifest(orders_dir)))
+
+    assert len(batches) == 1
+    assert batches[0]['master_data']['order_id'].tolist() == ['A', 'B']
+    assert batches[0]['master_data']['status'].tolist() == ['new.xls', 'new.xls']
+
+
+def test_manifest_keeps_order_ids_out_of_the_manifest_file(processor, orders_dir):
+    upload_first_batch(processor, orders_dir)
+
+    manifest = IngestionManifest(orders_dir)
+    entry = next(iter(manifest._entries.values()))
+    assert 'order_ids' not in entry
+    assert entry['order_count'] == 2
+    assert os.listdir(manifest.order_ids_dir) == [f"{next(iter(manifest._entries))}.txt"]
@@ -1,12 +1,13 @@
 from PyQt6.QtWidgets import (QMainWindow, QDateEdit, QPushButton, QLabel, QMessageBox, 
                            QVBoxLayout, QHBoxLayout, QWidget, QTabWidget, QComboBox, 
-                           QLineEdit, QTextEdit, QGridLayout, QFormLayout, QScrollArea,
+                           QLineEdit, QTextEdit, QPlainTextEdit, QGridLayout, QFormLayout, QScrollArea,
                            QGroupBox, QSplitter, QFrame)
 from PyQt6.QtCore import QDate, Qt, pyqtSignal
 from PyQt6.QtGui import QPalette
 import os
 import json
 import logging
+from config import CONFIG
 
 logger = logging.getLogger('UI.MainWindow')
 
@@ -15,21 +16,30 @@ class MainWindow(QMainWindow):
     login_signal = pyqtSignal(str)  # 传递选中的账号名称
     generate_signal = pyqtSignal(str, str, str)  # 开始日期、结束日期、账号名称
     download_signal = pyqtSignal(str)  # 账号名称
-    upload_signal = pyqtSignal()
-    clear_cache_signal = pyqtSignal()
+    download_all_signal = pyqtSignal(str)  # 账号名称
+    sync_orders_signal = pyqtSignal(str, str, str)  # 开始日期、结束日期、账号名称
+    sync_all_signal = pyqtSignal(str, str)  # 开始日期、结束日期
+    account_changed_signal = pyqtSignal(str)  # 账号名称
+    upload_signal = pyqtSignal(str)  # 账号名称
+    clear_cache_signal = pyqtSignal(str)  # 账号名称
+    cancel_signal = pyqtSignal()  # 取消当前后台任务
     save_config_signal = pyqtSignal(dict)  # 配置信息
     delete_config_signal = pyqtSignal(str)  # 账号名称
     update_db_config_signal = pyqtSignal()  # 数据库配置更新信号
+    test_db_connection_signal = pyqtSignal(dict)  # 数据库配置表单内容
+    view_db_schema_signal = pyqtSignal(dict)  # 数据库配置表单内容
     
     # 新增服务单相关信号
-    generate_service_signal = pyqtSignal(str, str)  # 开始日期、结束日期
-    download_service_signal = pyqtSignal()
-    upload_service_signal = pyqtSignal()
-    clear_orders_signal = pyqtSignal()  # 清空订单文件
-    clear_service_signal = pyqtSignal()  # 清空服务单文件
+    generate_service_signal = pyqtSignal(str, str, str)  # 开始日期、结束日期、账号名称
+    download_service_signal = pyqtSignal(str)  # 账号名称
+    upload_service_signal = pyqtSignal(str)  # 账号名称
+    clear_orders_signal = pyqtSignal(str)  # 清空订单文件，账号名称
+    clear_service_signal = pyqtSignal(str)  # 清空服务单文件，账号名称
     
     def __init__(self):
         super().__init__()
+        self.logged_in = False  # 是否已登录，后台任务结束后据此恢复按钮状态
+        self.busy = False  # 是否有后台任务正在执行
         self.initUI()
         self.load_accounts()
         
@@ -115,16 +125,22 @@ class MainWindow(QMainWindow):
         self.end_date.setCalendarPopup(True)
         
         # 订单相关功能按钮 - 第一行
-        self.generate_button = QPushButton("生成订单列表")
+        self.generate_button = QPushButton("生成并下载订单列表")
         self.generate_button.clicked.connect(self.on_generate_clicked)
         
         self.download_button = QPushButton("下载订单列表")
         self.download_button.clicked.connect(self.on_download_clicked)
         
+        self.download_all_button = QPushButton("下载全部新导出")
+        self.download_all_button.clicked.connect(self.on_download_all_clicked)
+        
         # 订单相关功能按钮 - 第二行
         self.upload_button = QPushButton("上传订单列表")
         self.upload_button.clicked.connect(self.on_upload_clicked)
         
+        self.sync_orders_button = QPushButton("一键同步订单")
+        self.sync_orders_button.clicked.connect(self.on_sync_orders_clicked)
+        
         self.clear_orders_button = QPushButton("清空订单文件")
         self.clear_orders_button.clicked.connect(self.on_clear_orders_clicked)
         
@@ -134,7 +150,7 @@ class MainWindow(QMainWindow):
         self.separator.setFrameShadow(QFrame.Shadow.Sunken)
         
         # 服务单相关功能按钮 - 第一行
-        self.generate_service_button = QPushButton("生成服务单")
+        self.generate_service_button = QPushButton("生成并下载服务单")
         self.generate_service_button.clicked.connect(self.on_generate_service_clicked)
         
         self.download_service_button = QPushButton("下载服务单")
@@ -147,10 +163,21 @@ class MainWindow(QMainWindow):
         self.clear_service_button = QPushButton("清空服务单文件")
         self.clear_service_button.clicked.connect(self.on_clear_service_clicked)
         
+        # 同步全部已登录账号，不依赖当前选中账号的登录状态
+        self.sync_all_button = QPushButton("同步全部账号")
+        self.sync_all_button.clicked.connect(self.on_sync_all_clicked)
+        
+        # 取消当前任务按钮，仅在后台任务执行期间可用
+        self.cancel_button = QPushButton("取消当前任务")
+        self.cancel_button.clicked.connect(self.on_cancel_clicked)
+        self.cancel_button.setEnabled(False)
+        
         # 初始禁用需要登录才能使用的按钮
         self.generate_button.setEnabled(False)
         self.download_button.setEnabled(False)
+        self.download_all_button.setEnabled(False)
         self.upload_button.setEnabled(False)
+        self.sync_orders_button.setEnabled(False)
         self.generate_service_button.setEnabled(False)
         self.download_service_button.setEnabled(False)
         self.upload_service_button.setEnabled(False)
@@ -163,8 +190,10 @@ class MainWindow(QMainWindow):
         
         # 添加第一组功能按钮（订单相关）
         function_layout.addWidget(self.generate_button, 1, 0, 1, 2)
-        function_layout.addWidget(self.download_button, 1, 2, 1, 2)
-        function_layout.addWidget(self.upload_button, 2, 0, 1, 2)
+        function_layout.addWidget(self.download_button, 1, 2)
+        function_layout.addWidget(self.download_all_button, 1, 3)
+        function_layout.addWidget(self.upload_button, 2, 0)
+        function_layout.addWidget(self.sync_orders_button, 2, 1)
         function_layout.addWidget(self.clear_orders_button, 2, 2, 1, 2)
         
         # 添加分隔线
@@ -176,6 +205,10 @@ class MainWindow(QMainWindow):
         function_layout.addWidget(self.upload_service_button, 5, 0, 1, 2)
         function_layout.addWidget(self.clear_service_button, 5, 2, 1, 2)
         
+        # 添加同步全部账号和取消任务按钮
+        function_layout.addWidget(self.sync_all_button, 6, 0, 1, 2)
+        function_layout.addWidget(self.cancel_button, 6, 2, 1, 2)
+        
         function_group.setLayout(function_layout)
         main_layout.addWidget(function_group)
         
@@ -183,13 +216,18 @@ class MainWindow(QMainWindow):
         log_group = QGroupBox("运行日志")
         log_layout = QVBoxLayout()
         
-        self.log_text = QTextEdit()
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
+        # 限制最大行数，超出后自动丢弃最早的行
+        self.log_text.setMaximumBlockCount(CONFIG['logging']['ui_max_lines'])
         
         log_layout.addWidget(self.log_text)
         log_group.setLayout(log_layout)
         main_layout.addWidget(log_group)
         
+        # 任务进度显示在状态栏
+        self.statusBar().showMessage("就绪")
+        
         # 设置各组件的比例
         main_layout.setStretch(0, 2)  # 账号信息
         main_layout.setStretch(1, 3)  # 功能模块
@@ -353,6 +391,8 @@ class MainWindow(QMainWindow):
     
     def on_account_changed(self, account_name):
         """当主程序标签页的账号选择改变时调用"""
+        # 每个账号有独立的登录缓存，切换账号后重新检查登录状态
+        self.account_changed_signal.emit(account_name)
         if not account_name:
             return
             
@@ -410,7 +450,7 @@ class MainWindow(QMainWindow):
         self.login_signal.emit(account_name)
     
     def on_generate_clicked(self):
-        """生成订单列表按钮点击事件"""
+        """生成并下载订单列表按钮点击事件"""
         account_name = self.account_combo.currentText()
         if not account_name:
             self.show_message("错误", "请先选择一个账号", QMessageBox.Icon.Warning)
@@ -430,35 +470,86 @@ class MainWindow(QMainWindow):
             
         self.download_signal.emit(account_name)
     
+    def on_download_all_clicked(self):
+        """下载全部新导出按钮点击事件"""
+        account_name = self.selected_account()
+        if account_name:
+            self.download_all_signal.emit(account_name)
+    
+    def selected_account(self):
+        """获取主程序标签页选中的账号，未选择时提示并返回None"""
+        account_name = self.account_combo.currentText()
+        if not account_name:
+            self.show_message("错误", "请先选择一个账号", QMessageBox.Icon.Warning)
+            return None
+        return account_name
+    
     def on_upload_clicked(self):
         """上传到数据库按钮点击事件"""
-        self.upload_signal.emit()
+        account_name = self.selected_account()
+        if account_name:
+            self.upload_signal.emit(account_name)
+    
+    def on_sync_orders_clicked(self):
+        """一键同步订单按钮点击事件"""
+        account_name = self.selected_account()
+        if not account_name:
+            return
+            
+        start_date = self.start_date.date().toString("yyyy-MM-dd")
+        end_date = self.end_date.date().toString("yyyy-MM-dd")
+        
+        self.sync_orders_signal.emit(start_date, end_date, account_name)
+    
+    def on_sync_all_clicked(self):
+        """同步全部账号按钮点击事件"""
+        start_date = self.start_date.date().toString("yyyy-MM-dd")
+        end_date = self.end_date.date().toString("yyyy-MM-dd")
+        self.sync_all_signal.emit(start_date, end_date)
     
     def on_clear_cache_clicked(self):
         """清理缓存按钮点击事件"""
-        self.clear_cache_signal.emit()
+        account_name = self.selected_account()
+        if account_name:
+            self.clear_cache_signal.emit(account_name)
     
     def on_clear_orders_clicked(self):
         """清空订单文件按钮点击事件"""
-        self.clear_orders_signal.emit()
+        account_name = self.selected_account()
+        if account_name:
+            self.clear_orders_signal.emit(account_name)
     
     def on_generate_service_clicked(self):
-        """生成服务单按钮点击事件"""
+        """生成并下载服务单按钮点击事件"""
+        account_name = self.selected_account()
+        if not account_name:
+            return
         start_date = self.start_date.date().toString("yyyy-MM-dd")
         end_date = self.end_date.date().toString("yyyy-MM-dd")
-        self.generate_service_signal.emit(start_date, end_date)
+        self.generate_service_signal.emit(start_date, end_date, account_name)
     
     def on_download_service_clicked(self):
         """下载服务单按钮点击事件"""
-        self.download_service_signal.emit()
+        account_name = self.selected_account()
+        if account_name:
+            self.download_service_signal.emit(account_name)
     
     def on_upload_service_clicked(self):
         """上传服务单按钮点击事件"""
-        self.upload_service_signal.emit()
+        account_name = self.selected_account()
+        if account_name:
+            self.upload_service_signal.emit(account_name)
     
     def on_clear_service_clicked(self):
         """清空服务单文件按钮点击事件"""
-        self.clear_service_signal.emit()
+        account_name = self.selected_account()
+        if account_name:
+            self.clear_service_signal.emit(account_name)
+    
+    def on_cancel_clicked(self):
+        """取消当前任务按钮点击事件"""
+        self.cancel_button.setEnabled(False)
+        self.cancel_signal.emit()
     
     def on_save_config_clicked(self):
         """保存配置按钮点击事件"""
@@ -499,13 +590,15 @@ class MainWindow(QMainWindow):
     
     def set_status(self, message):
         """设置状态显示信息"""
-        self.log_text.append(message)
+        self.append_logs([message])
+    
+    def append_logs(self, messages):
+        """批量追加日志，由定时器调用，不强制重绘"""
+        self.log_text.appendPlainText('\n'.join(messages))
         # 滚动到最新内容
         self.log_text.verticalScrollBar().setValue(
             self.log_text.verticalScrollBar().maximum()
         )
-        # 确保更新立即显示
-        self.log_text.repaint()
     
     def show_message(self, title, message, icon=QMessageBox.Icon.Information):
         """显示消息对话框"""
@@ -515,11 +608,40 @@ class MainWindow(QMainWindow):
         msg_box.setText(message)
         msg_box.exec()
         
+    def set_progress(self, message):
+        """在状态栏显示任务进度"""
+        self.statusBar().showMessage(message)
+    
+    def set_busy(self, busy, job_name=''):
+        """后台任务执行期间禁用功能按钮，结束后恢复"""
+        self.busy = busy
+        
+        action_buttons = [
+            self.login_button, self.clear_orders_button, self.clear_service_button, self.sync_all_button,
+            self.save_db_config_button, self.test_db_connection_button, self.view_db_schema_button
+        ]
+        for button in action_buttons:
+            button.setEnabled(not busy)
+        self._set_logged_in_buttons_enabled(self.logged_in and not busy)
+        self.cancel_button.setEnabled(busy)
+        
+        if busy:
+            self.statusBar().showMessage(f"正在执行: {job_name}")
+        else:
+            self.statusBar().showMessage("就绪")
+    
     def enable_logged_in_features(self, enabled=True):
         """启用/禁用需要登录才能使用的功能"""
+        self.logged_in = enabled
+        self._set_logged_in_buttons_enabled(enabled and not self.busy)
+    
+    def _set_logged_in_buttons_enabled(self, enabled):
+        """设置需要登录才能使用的按钮状态"""
         self.generate_button.setEnabled(enabled)
         self.download_button.setEnabled(enabled)
+        self.download_all_button.setEnabled(enabled)
         self.upload_button.setEnabled(enabled)
+        self.sync_orders_button.setEnabled(enabled)
         self.generate_service_button.setEnabled(enabled)
         self.download_service_button.setEnabled(enabled)
         self.upload_service_button.setEnabled(enabled)
@@ -568,27 +690,7 @@ class MainWindow(QMainWindow):
     
     def on_test_db_connection_clicked(self):
         """测试数据库连接"""
-        db_config = self.get_db_config()
-        
-        try:
-            # 创建临时的数据库管理器
-            from modules.database_manager import DatabaseManager
-            db_manager = DatabaseManager(
-                server=db_config['server'],
-                database=db_config['database'],
-                username=db_config['username'],
-                password=db_config['password']
-            )
-            
-            # 测试连接
-            test_result = db_manager.test_connection()
-            if test_result.get('success'):
-                self.show_message("连接成功", "数据库连接测试成功", QMessageBox.Icon.Information)
-            else:
-                self.show_message("连接失败", test_result.get('message'), QMessageBox.Icon.Warning)
-        except Exception as e:
-            logger.error(f"测试数据库连接失败: {str(e)}")
-            self.show_message("连接失败", f"数据库连接测试失败: {str(e)}", QMessageBox.Icon.Critical)
+        self.test_db_connection_signal.emit(self.get_db_config())
     
     def on_view_db_schema_clicked(self):
         """查看数据库表结构"""
@@ -599,100 +701,44 @@ class MainWindow(QMainWindow):
                 self.show_message("配置不完整", f"请填写 {key} 字段", QMessageBox.Icon.Warning)
                 return
         
-        try:
-            # 创建临时的数据库管理器
-            from modules.database_manager import DatabaseManager
-            db_manager = DatabaseManager(
-                server=db_config['server'],
-                database=db_config['database'],
-                username=db_config['username'],
-                password=db_config['password']
-            )
-            
-            # 测试连接
-            test_result = db_manager.test_connection()
-            if not test_result.get('success'):
-                self.show_message("连接失败", test_result.get('message'), QMessageBox.Icon.Warning)
-                return
-            
-            # 连接数据库并获取表结构
-            import pyodbc
-            conn = pyodbc.connect(db_manager.connection_string)
-            cursor = conn.cursor()
-            
-            # 获取主表结构
-            schema_text = "=== 订单主表 (jx_orders_master) ===\n\n"
-            cursor.execute("SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = 'jx_orders_master' ORDER BY ORDINAL_POSITION")
-            
-            for row in cursor.fetchall():
-                col_name = row.COLUMN_NAME
-                data_type = row.DATA_TYPE
-                length = row.CHARACTER_MAXIMUM_LENGTH
-                
-                if length:
-                    schema_text += f"{col_name}: {data_type}({length})\n"
-                else:
-                    schema_text += f"{col_name}: {data_type}\n"
-            
-            # 获取明细表结构
-            schema_text += "\n\n=== 订单明细表 (jx_orders_detail) ===\n\n"
-            cursor.execute("SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = 'jx_orders_detail' ORDER BY ORDINAL_POSITION")
-            
-            for row in cursor.fetchall():
-                col_name = row.COLUMN_NAME
-                data_type = row.DATA_TYPE
-                length = row.CHARACTER_MAXIMUM_LENGTH
-                
-                if length:
-                    schema_text += f"{col_name}: {data_type}({length})\n"
-                else:
-                    schema_text += f"{col_name}: {data_type}\n"
-            
-            # 获取服务单表结构
-            schema_text += "\n\n=== 服务单表 (jx_service_orders) ===\n\n"
-            cursor.execute("IF EXISTS (SELECT * FROM sysobjects WHERE name='jx_service_orders' AND xtype='U') SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = 'jx_service_orders' ORDER BY ORDINAL_POSITION")
+        self.view_db_schema_signal.emit(db_config)
+    
+    def show_db_schema(self, schema_data):
+        """显示数据库表结构和记录数"""
+        table_titles = [
+            ('jx_orders_master', '订单主表', '主表记录数'),
+            ('jx_orders_detail', '订单明细表', '明细表记录数'),
+            ('jx_service_orders', '服务单表', '服务单表记录数')
+        ]
+        
+        schema_text = ""
+        for table_name, title, _ in table_titles:
+            if schema_text:
+                schema_text += "\n\n"
+            schema_text += f"=== {title} ({table_name}) ===\n\n"
             
-            service_table_exists = False
-            for row in cursor.fetchall():
-                service_table_exists = True
-                col_name = row.COLUMN_NAME
-                data_type = row.DATA_TYPE
-                length = row.CHARACTER_MAXIMUM_LENGTH
-                
+            columns = schema_data.get(table_name, {}).get('columns', [])
+            for col_name, data_type, length in columns:
                 if length:
                     schema_text += f"{col_name}: {data_type}({length})\n"
                 else:
                     schema_text += f"{col_name}: {data_type}\n"
             
-            if not service_table_exists:
-                schema_text += "(服务单表尚未创建)\n"
-            
-            # 获取记录计数
-            schema_text += f"\n\n=== 数据统计 ===\n"
-            
-            cursor.execute("SELECT COUNT(*) AS count FROM jx_orders_master")
-            master_count = cursor.fetchone().count
-            schema_text += f"主表记录数: {master_count}\n"
-            
-            cursor.execute("SELECT COUNT(*) AS count FROM jx_orders_detail")
-            detail_count = cursor.fetchone().count
-            schema_text += f"明细表记录数: {detail_count}\n"
-            
-            # 获取服务单表记录数
-            cursor.execute("IF EXISTS (SELECT * FROM sysobjects WHERE name='jx_service_orders' AND xtype='U') SELECT COUNT(*) AS count FROM jx_service_orders ELSE SELECT 0 AS count")
-            service_count = cursor.fetchone().count
-            schema_text += f"服务单表记录数: {service_count}\n"
-            
-            conn.close()
-            
-            # 显示表结构
-            self.schema_text.setText(schema_text)
-            logger.info("已查询并显示数据库表结构")
-            
-        except Exception as e:
-            logger.error(f"获取表结构失败: {str(e)}")
-            self.schema_text.setText(f"获取表结构失败: {str(e)}")
-            self.show_message("查询失败", f"获取表结构失败: {str(e)}", QMessageBox.Icon.Warning)
+            if not columns:
+                schema_text += f"({title}尚未创建)\n"
+        
+        # 记录计数
+        schema_text += f"\n\n=== 数据统计 ===\n"
+        for table_name, _, count_label in table_titles:
+            schema_text += f"{count_label}: {schema_data.get(table_name, {}).get('count', 0)}\n"
+        
+        self.schema_text.setText(schema_text)
+        logger.info("已查询并显示数据库表结构")
+    
+    def show_db_schema_error(self, message):
+        """显示表结构查询失败信息"""
+        self.schema_text.setText(message)
+        self.show_message("查询失败", message, QMessageBox.Icon.Warning)
     
     def get_db_config(self):
         """获取数据库配置表单的值"""